@@ -3,6 +3,7 @@ import logging
 from dotenv import load_dotenv
 from app import create_app
 from app.core.extensions import db
+from app.core import schema
 from app.models.user import User
 from app.models.company import Company
 from flask_moment import Moment
@@ -25,7 +26,8 @@ def make_shell_context():
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        # create_all() would skip columns added to existing tables
+        schema.upgrade()
         
         # Create default admin user if not exists
         if not User.query.filter_by(email='admin@erp.com').first():
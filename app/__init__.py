@@ -15,6 +15,14 @@ def create_app(config_name='default'):
     migrate.init_app(app, db)
     csrf.init_app(app)
     
+    # Background report jobs run on a process pool owned by this app
+    from app.reports.jobs import report_jobs
+    report_jobs.init_app(app, config_name)
+    
+    # Scheduled jobs (overdue invoice sweep) run on a daemon thread started by the first request
+    from app.core.scheduler import scheduler
+    scheduler.init_app(app)
+    
     # Configure login manager
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
@@ -0,0 +1,102 @@
+import threading
+import time
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+class TTLCache:
+    """Small thread-safe per-process cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        return value
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Return the cached value for ``key``, computing and storing it when missing or expired"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            return entry[1]
+        return self.set(key, compute(), ttl)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class _CommitHook:
+    def __init__(self, key, models, collect, apply, factory):
+        self.key = key
+        self.models = models
+        self.collect = collect
+        self.apply = apply
+        self.factory = factory
+
+_commit_hooks = []
+_hooks_by_type = {}
+
+def on_commit(key, models, collect, apply, factory=dict):
+    """Gather per-transaction changes at flush and act on them once the transaction commits.
+
+    ``collect(session, obj, pending)`` is called for every new, dirty or deleted
+    instance of ``models`` (every mapped object when None) with the hook's
+    accumulator, created by ``factory()`` and kept in ``session.info``.
+    ``apply(pending)`` runs after commit when the accumulator is not empty; a
+    rollback discards it. All hooks share one after_flush pass over the session.
+    """
+    _commit_hooks.append(_CommitHook(key, models, collect, apply, factory))
+    _hooks_by_type.clear()
+
+def invalidate_on_commit(key, models, callback, predicate=None):
+    """Call ``callback()`` after the commit of any transaction that flushed an instance of ``models``
+    (for which ``predicate(session, obj)`` holds, when given)"""
+    def collect(session, obj, pending):
+        if predicate is None or predicate(session, obj):
+            pending.add(True)
+    on_commit(key, models, collect, lambda pending: callback(), factory=set)
+
+def _hooks_for(model):
+    hooks = _hooks_by_type.get(model)
+    if hooks is None:
+        hooks = _hooks_by_type[model] = [hook for hook in _commit_hooks
+                                         if hook.models is None or issubclass(model, hook.models)]
+    return hooks
+
+@event.listens_for(Session, 'after_flush')
+def _collect_commit_changes(session, flush_context):
+    pending = session.info.setdefault('commit_hooks', {})
+    for obj in chain(session.new, session.dirty, session.deleted):
+        for hook in _hooks_for(type(obj)):
+            accumulator = pending.get(hook.key)
+            if accumulator is None:
+                accumulator = pending[hook.key] = hook.factory()
+            hook.collect(session, obj, accumulator)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_commit_changes(session):
+    pending = session.info.pop('commit_hooks', None)
+    if not pending:
+        return
+    for hook in _commit_hooks:
+        accumulator = pending.get(hook.key)
+        if accumulator:
+            hook.apply(accumulator)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_commit_changes(session):
+    session.info.pop('commit_hooks', None)
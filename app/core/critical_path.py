@@ -0,0 +1,196 @@
+import heapq
+import threading
+import numpy as np
+
+def _spans(starts, ends):
+    """Concatenated ranges [start, end) as one index array"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(ends - lengths.cumsum(), lengths)
+    return np.arange(total, dtype=np.int64) + offsets
+
+def _csr(keys, n):
+    """Edge order grouped by ``keys`` and the [start, end) offsets of each node's group"""
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return order, offsets
+
+class CycleError(ValueError):
+    """The links form a cycle; ``nodes`` are the nodes on it (or between several cycles)"""
+
+    def __init__(self, message, nodes):
+        super().__init__(message)
+        self.nodes = nodes
+
+class CriticalPath:
+    """Finish-to-start network scheduled with the critical path method over integer arrays.
+
+    Nodes are 0..n-1 with an integer duration and release (earliest allowed
+    start); edges are (predecessor, successor, lag). Nodes are levelled once by
+    a topological sort, so the forward and backward passes are one vectorized
+    step per level. ``update`` changes a single node and re-propagates only
+    through the nodes whose dates actually move.
+    """
+
+    def __init__(self, durations, releases, predecessors, successors, lags):
+        self.durations = np.asarray(durations, dtype=np.int64).copy()
+        self.releases = np.asarray(releases, dtype=np.int64).copy()
+        self.n = n = len(self.durations)
+        self.sources = np.asarray(predecessors, dtype=np.int64)
+        self.targets = np.asarray(successors, dtype=np.int64)
+        self.lags = np.asarray(lags, dtype=np.int64)
+        self._lock = threading.Lock()
+
+        out_order, self.out_offsets = _csr(self.sources, n)
+        in_order, self.in_offsets = _csr(self.targets, n)
+        self.out_edges = out_order
+        self.in_edges = in_order
+        self._sort()
+        # Adjacency as plain lists for the per-node walks of update()
+        self._out = [(self.targets[out_order[a:b]].tolist(), self.lags[out_order[a:b]].tolist())
+                     for a, b in zip(self.out_offsets[:-1].tolist(), self.out_offsets[1:].tolist())]
+        self._in = [(self.sources[in_order[a:b]].tolist(), self.lags[in_order[a:b]].tolist())
+                    for a, b in zip(self.in_offsets[:-1].tolist(), self.in_offsets[1:].tolist())]
+        self.forward()
+        self.backward()
+
+    def _sort(self):
+        """Kahn's algorithm one frontier at a time; raises CycleError if the links form a cycle"""
+        n = self.n
+        indegree = np.bincount(self.targets, minlength=n)
+        level = np.full(n, -1, dtype=np.int64)
+        frontier = np.flatnonzero(indegree == 0)
+        levels = []
+        while frontier.size:
+            level[frontier] = len(levels)
+            levels.append(frontier)
+            edges = self.out_edges[_spans(self.out_offsets[frontier], self.out_offsets[frontier + 1])]
+            reached = self.targets[edges]
+            np.subtract.at(indegree, reached, 1)
+            reached = np.unique(reached)
+            frontier = reached[indegree[reached] == 0]
+        if (level < 0).any():
+            raise CycleError('Task dependencies form a cycle', self._cycle_nodes(level < 0))
+        self.levels = levels
+        self.order = np.concatenate(levels) if levels else np.zeros(0, dtype=np.int64)
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+        # Edges bucketed by the level of their successor (forward) and predecessor (backward)
+        self._in_by_level = self._bucket(level[self.targets], len(levels))
+        self._out_by_level = self._bucket(level[self.sources], len(levels))
+
+    def _cycle_nodes(self, unsorted):
+        """Nodes left by the sort minus those that only lead out of a cycle, found by peeling sinks"""
+        inside = unsorted[self.sources] & unsorted[self.targets]
+        outdegree = np.bincount(self.sources[inside], minlength=self.n)
+        remaining = unsorted.copy()
+        sinks = np.flatnonzero(remaining & (outdegree == 0))
+        while sinks.size:
+            remaining[sinks] = False
+            edges = inside & np.isin(self.targets, sinks)
+            np.subtract.at(outdegree, self.sources[edges], 1)
+            sinks = np.flatnonzero(remaining & (outdegree == 0))
+        return np.flatnonzero(remaining).tolist()
+
+    @staticmethod
+    def _bucket(edge_levels, count):
+        order, offsets = _csr(edge_levels, count)
+        return [order[offsets[i]:offsets[i + 1]] for i in range(count)]
+
+    def forward(self):
+        """Earliest start and finish of every node"""
+        self.early_start = self.releases.copy()
+        self.early_finish = np.empty(self.n, dtype=np.int64)
+        for nodes, edges in zip(self.levels, self._in_by_level):
+            if edges.size:
+                np.maximum.at(self.early_start, self.targets[edges],
+                              self.early_finish[self.sources[edges]] + self.lags[edges])
+            self.early_finish[nodes] = self.early_start[nodes] + self.durations[nodes]
+        self.finish = int(self.early_finish.max()) if self.n else 0
+
+    def backward(self):
+        """Latest finish and start of every node that keeps the overall finish"""
+        self.late_finish = np.full(self.n, self.finish, dtype=np.int64)
+        self.late_start = np.empty(self.n, dtype=np.int64)
+        for nodes, edges in zip(reversed(self.levels), reversed(self._out_by_level)):
+            if edges.size:
+                np.minimum.at(self.late_finish, self.sources[edges],
+                              self.late_start[self.targets[edges]] - self.lags[edges])
+            self.late_start[nodes] = self.late_finish[nodes] - self.durations[nodes]
+
+    @property
+    def slack(self):
+        return self.late_start - self.early_start
+
+    @property
+    def critical(self):
+        return self.slack == 0
+
+    def critical_path(self):
+        """Zero-slack nodes in topological order"""
+        return self.order[self.critical[self.order]]
+
+    def update(self, node, duration=None, release=None):
+        """Change one node's duration and/or release; returns how many nodes were recomputed"""
+        with self._lock:
+            if duration is not None:
+                self.durations[node] = duration
+            if release is not None:
+                self.releases[node] = release
+            visited = self._propagate_forward(node)
+            finish = int(self.early_finish.max()) if self.n else 0
+            if finish != self.finish:
+                # Every latest date hangs off the overall finish
+                self.finish = finish
+                self.backward()
+                return self.n
+            if duration is not None:
+                visited += self._propagate_backward(node)
+            return visited
+
+    def _propagate_forward(self, node):
+        early_start, early_finish, rank = self.early_start, self.early_finish, self.rank
+        heap, queued, visited = [(rank[node], node)], {node}, 0
+        while heap:
+            _, current = heapq.heappop(heap)
+            visited += 1
+            start = self.releases[current]
+            for predecessor, lag in zip(*self._in[current]):
+                start = max(start, early_finish[predecessor] + lag)
+            finish = start + self.durations[current]
+            if current != node and start == early_start[current]:
+                continue
+            early_start[current], early_finish[current] = start, finish
+            for successor in self._out[current][0]:
+                if successor not in queued:
+                    queued.add(successor)
+                    heapq.heappush(heap, (rank[successor], successor))
+        return visited
+
+    def _propagate_backward(self, node):
+        late_start, late_finish, rank = self.late_start, self.late_finish, self.rank
+        heap, queued, visited = [(-rank[node], node)], {node}, 0
+        while heap:
+            _, current = heapq.heappop(heap)
+            visited += 1
+            finish = self.finish
+            for successor, lag in zip(*self._out[current]):
+                finish = min(finish, late_start[successor] - lag)
+            start = finish - self.durations[current]
+            if current != node and start == late_start[current]:
+                continue
+            late_start[current], late_finish[current] = start, finish
+            for predecessor in self._in[current][0]:
+                if predecessor not in queued:
+                    queued.add(predecessor)
+                    heapq.heappush(heap, (-rank[predecessor], predecessor))
+        return visited
+
+    def snapshot(self):
+        """Consistent copies of the date arrays for readers"""
+        with self._lock:
+            return (self.early_start.copy(), self.early_finish.copy(),
+                    self.late_start.copy(), self.late_finish.copy(), self.finish)
@@ -0,0 +1,76 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+_WORD = re.compile(r'\w+')
+
+def prefix_terms(*values):
+    """Lower-cased word tokens of the given values, used both for indexing and querying"""
+    return set(_WORD.findall(' '.join(str(value) for value in values if value).lower()))
+
+class PrefixIndex:
+    """Sorted array of (term, id) pairs answering "which records have a word starting with ..."
+
+    Each record is stored once with its label and detail; lookups bisect to the
+    first term carrying the prefix and walk forward, so a top-N query touches
+    only the matching slice of the array.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}  # id -> (label, detail, terms)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries):
+        """Replace the contents with ``(id, label, detail, terms)`` tuples in one sort"""
+        records = {id: (label, detail, frozenset(terms)) for id, label, detail, terms in entries}
+        keys = sorted((term, id) for id, (label, detail, terms) in records.items() for term in terms)
+        with self._lock:
+            self._entries, self._keys = records, keys
+
+    def add(self, id, label, detail, terms):
+        terms = frozenset(terms)
+        with self._lock:
+            self._discard(id)
+            self._entries[id] = (label, detail, terms)
+            for term in terms:
+                insort(self._keys, (term, id))
+
+    def remove(self, id):
+        with self._lock:
+            self._discard(id)
+
+    def _discard(self, id):
+        entry = self._entries.pop(id, None)
+        if entry is None:
+            return
+        for term in entry[2]:
+            position = bisect_left(self._keys, (term, id))
+            if position < len(self._keys) and self._keys[position] == (term, id):
+                del self._keys[position]
+
+    def search(self, query, limit=10):
+        """Up to ``limit`` records having, for every query word, a word that starts with it"""
+        words = sorted(prefix_terms(query), key=len, reverse=True)
+        if not words:
+            return []
+        # Walk the longest (most selective) word's slice and check the rest per record
+        scan, rest = words[0], words[1:]
+        keys, entries = self._keys, self._entries
+        results, seen = [], set()
+        position = bisect_left(keys, (scan,))
+        while position < len(keys) and len(results) < limit:
+            term, id = keys[position]
+            position += 1
+            if not term.startswith(scan):
+                break
+            entry = entries.get(id)
+            if id in seen or entry is None:
+                continue
+            seen.add(id)
+            if all(any(other.startswith(word) for other in entry[2]) for word in rest):
+                results.append({'id': id, 'label': entry[0], 'detail': entry[1]})
+        return results
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+from app.core.extensions import db
+from app.models.scheduled_job import ScheduledJobState
+
+job_states = ScheduledJobState.__table__
+
+class JobScheduler:
+    """Runs registered jobs on one daemon thread per process, each run inside the app context.
+
+    The thread starts with the first request, so CLI commands and report worker
+    processes never run one. Every run is first claimed with a conditional
+    UPDATE on scheduled_job_states, so of several worker processes only one
+    runs a job per interval.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def job(self, name, interval_key):
+        """Register ``func()`` to run every ``app.config[interval_key]`` seconds (0 disables it)"""
+        def register(func):
+            self.jobs[name] = (func, interval_key)
+            return func
+        return register
+
+    def init_app(self, app):
+        app.extensions['scheduler'] = self
+        if app.config.get('SCHEDULER_ENABLED', True):
+            app.before_request(lambda: self.start(current_app._get_current_object()))
+
+    def start(self, app):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, args=(app,), name='job-scheduler', daemon=True)
+                self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            for name in list(self.jobs):
+                with app.app_context():
+                    self.run(name)
+            time.sleep(app.config.get('SCHEDULER_TICK_SECONDS', 60))
+
+    def run(self, name, force=False):
+        """Run a job now if its interval has passed (or ``force``); returns its result, None when skipped.
+
+        Failures of scheduled runs are logged so the loop carries on; a forced run re-raises them.
+        """
+        func, interval_key = self.jobs[name]
+        interval = current_app.config.get(interval_key, 0)
+        if not force and not interval:
+            return None
+        try:
+            if not self.claim(name, interval, force):
+                return None
+            return func()
+        except Exception:
+            db.session.rollback()
+            if force:
+                raise
+            current_app.logger.exception('Scheduled job %s failed', name)
+            return None
+        finally:
+            db.session.remove()
+
+    @staticmethod
+    def claim(name, interval, force=False):
+        """Mark a run as started unless another process started one less than ``interval`` seconds ago"""
+        now = datetime.utcnow()
+        if not ScheduledJobState.query.filter_by(name=name).first():
+            db.session.add(ScheduledJobState(name=name))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another process created the row first
+                db.session.rollback()
+        statement = update(job_states).where(job_states.c.name == name)
+        if not force:
+            statement = statement.where(or_(job_states.c.last_run_at == None,
+                                            job_states.c.last_run_at <= now - timedelta(seconds=interval)))
+        claimed = db.session.execute(statement.values(last_run_at=now, updated_at=now)).rowcount
+        db.session.commit()
+        return bool(claimed)
+
+scheduler = JobScheduler()
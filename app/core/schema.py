@@ -0,0 +1,68 @@
+from sqlalchemy import inspect, literal, text
+from app.core.extensions import db
+
+BACKFILLS = []
+
+def backfill(*tables):
+    """Register ``func()`` to run after an upgrade that created or added columns to any of ``tables``"""
+    def register(func):
+        BACKFILLS.append((frozenset(tables), func))
+        return func
+    return register
+
+def _column_ddl(column, dialect):
+    preparer = dialect.identifier_preparer
+    ddl = f'{preparer.quote(column.name)} {column.type.compile(dialect=dialect)}'
+    default = None
+    if column.server_default is not None:
+        default = str(column.server_default.arg)
+    elif column.default is not None and column.default.is_scalar:
+        default = str(literal(column.default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if default is not None:
+        ddl += f' DEFAULT {default}'
+    if not column.nullable:
+        if default is None:
+            raise RuntimeError(f'Cannot add NOT NULL column {column.table.name}.{column.name} without a default')
+        ddl += ' NOT NULL'
+    for foreign_key in column.foreign_keys:
+        ddl += (f' REFERENCES {preparer.quote(foreign_key.column.table.name)}'
+                f'({preparer.quote(foreign_key.column.name)})')
+    return ddl
+
+def upgrade():
+    """Bring an existing database up to the models.
+
+    ``db.create_all()`` only creates missing tables, so columns and indexes added
+    to existing tables are added here with ALTER TABLE / CREATE INDEX, and the
+    registered backfills of every created or altered table run afterwards.
+    Returns the names of what changed.
+    """
+    engine = db.engine
+    existing = set(inspect(engine).get_table_names())
+    changes = {'tables': [], 'columns': [], 'indexes': [], 'backfills': []}
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.tables.values():
+            if table.name not in existing:
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    connection.execute(text(f'ALTER TABLE {engine.dialect.identifier_preparer.quote(table.name)} '
+                                            f'ADD COLUMN {_column_ddl(column, engine.dialect)}'))
+                    changes['columns'].append(f'{table.name}.{column.name}')
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes['indexes'].append(index.name)
+    db.metadata.create_all(engine)
+    changes['tables'] = sorted(set(inspect(engine).get_table_names()) - existing)
+
+    touched = set(changes['tables']) | {name.split('.')[0] for name in changes['columns']}
+    for tables, func in BACKFILLS:
+        if tables & touched:
+            func()
+            changes['backfills'].append(func.__name__)
+    return changes
@@ -0,0 +1,246 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, update, insert, func, cast, Integer
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+from app.models.document_sequence import DocumentSequence
+
+DEFAULT_BLOCK_SIZE = 20
+
+# Keys under Connection.info holding blocks reserved by the open transaction, and by one being committed
+_PENDING_KEY = 'document_sequence_blocks'
+_COMMITTING_KEY = 'document_sequence_blocks_committing'
+
+# Key under Session.info listing the connection infos of the session's transaction
+_CONNECTIONS_KEY = 'document_sequence_connections'
+
+sequences = DocumentSequence.__table__
+
+
+class SequenceAllocator:
+    """Hand out document numbers from per-process blocks.
+
+    Each process reserves ``block_size`` numbers at a time with a single
+    UPDATE on ``document_sequences`` and serves further numbers from memory,
+    so an insert never has to look at the document table itself. A block
+    reserved inside a transaction only becomes visible to other threads once
+    the session reports that transaction committed; if it rolls back or its
+    commit fails the block is dropped, so a reservation that was never
+    committed can never be handed out twice. Blocks reserved by commits made
+    outside a session are dropped too. Numbers are unique but not gap-free.
+    """
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def next_value(self, connection, prefix, company_id=None, fiscal_year=None,
+                   seed_column=None, seed_prefix=None):
+        """Return the next number for a sequence, reserving a new block if needed"""
+        key = (prefix, company_id or 0, fiscal_year or 0)
+
+        pending = connection.info.setdefault(_PENDING_KEY, {})
+        block = pending.get(key)
+        if block is None or block[0] >= block[1]:
+            taken = self._take_committed(key)
+            if taken:
+                return taken[0]
+            block = pending[key] = self._reserve(connection, key, seed_column, seed_prefix or prefix)
+
+        value = block[0]
+        block[0] += 1
+        return value
+
+    def reserve(self, connection, prefix, count, company_id=None, fiscal_year=None,
+                seed_column=None, seed_prefix=None):
+        """Return ``count`` numbers for a bulk insert.
+
+        What is left of the transaction's and the process's blocks is used
+        first; the rest is reserved with one UPDATE.
+        """
+        key = (prefix, company_id or 0, fiscal_year or 0)
+        values = []
+        block = connection.info.get(_PENDING_KEY, {}).get(key)
+        if block is not None:
+            values.extend(range(block[0], min(block[1], block[0] + count)))
+            block[0] += len(values)
+        values.extend(self._take_committed(key, count - len(values)))
+        if len(values) < count:
+            start, stop = self._reserve(connection, key, seed_column, seed_prefix or prefix,
+                                        size=count - len(values))
+            values.extend(range(start, stop))
+        return values
+
+    def committing(self, connection_info):
+        """Set aside the blocks of a transaction that is about to commit until the commit succeeds"""
+        pending = connection_info.pop(_PENDING_KEY, None)
+        if pending:
+            connection_info[_COMMITTING_KEY] = pending
+
+    def publish(self, connection_info):
+        """Make blocks reserved by a committed transaction available to the process"""
+        pending = connection_info.pop(_COMMITTING_KEY, None)
+        if not pending:
+            return
+        with self._lock:
+            self._check_fork()
+            for key, block in pending.items():
+                if block[0] < block[1]:
+                    self._blocks.setdefault(key, deque()).append(block)
+
+    def discard(self, connection_info):
+        """Forget blocks reserved by a transaction that rolled back or never reported its commit"""
+        connection_info.pop(_PENDING_KEY, None)
+        connection_info.pop(_COMMITTING_KEY, None)
+
+    def reset(self):
+        """Drop every cached block (e.g. after the sequence table was edited by hand)"""
+        with self._lock:
+            self._blocks.clear()
+
+    def _take_committed(self, key, count=1):
+        taken = []
+        with self._lock:
+            self._check_fork()
+            blocks = self._blocks.get(key)
+            while blocks and len(taken) < count:
+                block = blocks[0]
+                stop = min(block[1], block[0] + count - len(taken))
+                taken.extend(range(block[0], stop))
+                block[0] = stop
+                if block[0] >= block[1]:
+                    blocks.popleft()
+        return taken
+
+    def _check_fork(self):
+        # Blocks must not be shared with a forked worker (gunicorn --preload)
+        if self._pid != os.getpid():
+            self._blocks.clear()
+            self._pid = os.getpid()
+
+    def _reserve(self, connection, key, seed_column, seed_prefix, size=None):
+        prefix, company_id, fiscal_year = key
+        size = size or self._block_size()
+        condition = (
+            (sequences.c.prefix == prefix) &
+            (sequences.c.company_id == company_id) &
+            (sequences.c.fiscal_year == fiscal_year)
+        )
+
+        result = connection.execute(
+            update(sequences)
+            .where(condition)
+            .values(next_value=sequences.c.next_value + size, updated_at=datetime.utcnow())
+        )
+        if result.rowcount == 0:
+            self._create(connection, key, seed_column, seed_prefix)
+            connection.execute(
+                update(sequences)
+                .where(condition)
+                .values(next_value=sequences.c.next_value + size, updated_at=datetime.utcnow())
+            )
+
+        stop = connection.execute(select(sequences.c.next_value).where(condition)).scalar()
+        return [stop - size, stop]
+
+    def _create(self, connection, key, seed_column, seed_prefix):
+        prefix, company_id, fiscal_year = key
+        start = 1
+        if seed_column is not None:
+            # One-off scan so numbering continues after documents created before the sequence existed
+            last = connection.execute(
+                select(func.max(cast(func.substr(seed_column, len(seed_prefix) + 1), Integer)))
+                .where(seed_column.like(f'{seed_prefix}%'))
+            ).scalar()
+            start = (last or 0) + 1
+
+        values = dict(prefix=prefix, company_id=company_id, fiscal_year=fiscal_year, next_value=start)
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        elif dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            dialect_insert = None
+
+        if dialect_insert is not None:
+            # Another worker may create the same row concurrently
+            connection.execute(dialect_insert(sequences).values(**values).on_conflict_do_nothing())
+        else:
+            connection.execute(insert(sequences).values(**values))
+
+    def _block_size(self):
+        if self.block_size:
+            return self.block_size
+        if has_app_context():
+            return current_app.config.get('DOCUMENT_SEQUENCE_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+        return DEFAULT_BLOCK_SIZE
+
+
+allocator = SequenceAllocator()
+
+
+@event.listens_for(Engine, 'commit')
+def _set_aside_blocks(conn):
+    # Fires before the DBAPI commit, which may still fail; the blocks are published by the session below
+    allocator.committing(conn.info)
+
+
+@event.listens_for(Session, 'after_begin')
+def _track_connection(session, transaction, connection):
+    session.info.setdefault(_CONNECTIONS_KEY, []).append(connection.info)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_blocks(session):
+    for connection_info in session.info.pop(_CONNECTIONS_KEY, ()):
+        allocator.publish(connection_info)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_connections(session):
+    session.info.pop(_CONNECTIONS_KEY, None)
+
+
+@event.listens_for(Engine, 'rollback')
+def _discard_blocks(conn):
+    allocator.discard(conn.info)
+
+
+@event.listens_for(Engine, 'rollback_savepoint')
+def _discard_blocks_on_savepoint_rollback(conn, name, context):
+    # Blocks reserved before the savepoint survive in the database; dropping them only leaves a gap
+    allocator.discard(conn.info)
+
+
+@event.listens_for(Pool, 'reset')
+def _discard_blocks_on_reset(dbapi_connection, connection_record, reset_state):
+    allocator.discard(connection_record.info)
+
+
+def next_document_number(connection, prefix, seed_column=None, width=6, company_id=None, fiscal_year=None):
+    """Allocate the next formatted document number, e.g. ``INV-000042``.
+
+    Pass the document's number column as ``seed_column`` so a new sequence
+    continues from the numbers already stored in that table.
+    """
+    number_prefix = f"{prefix}{fiscal_year}-" if fiscal_year else prefix
+    value = allocator.next_value(connection, prefix, company_id=company_id, fiscal_year=fiscal_year,
+                                 seed_column=seed_column, seed_prefix=number_prefix)
+    return f"{number_prefix}{value:0{width}d}"
+
+
+def next_document_numbers(connection, prefix, count, seed_column=None, width=6, company_id=None, fiscal_year=None):
+    """Allocate ``count`` formatted document numbers, with at most one sequence UPDATE"""
+    if count <= 0:
+        return []
+    number_prefix = f"{prefix}{fiscal_year}-" if fiscal_year else prefix
+    values = allocator.reserve(connection, prefix, count, company_id=company_id, fiscal_year=fiscal_year,
+                               seed_column=seed_column, seed_prefix=number_prefix)
+    return [f"{number_prefix}{value:0{width}d}" for value in values]
@@ -0,0 +1,58 @@
+from sqlalchemy import update, insert, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+def increment(connection, table, keys, deltas, **insert_values):
+    """Add ``deltas`` to the counter columns of the row identified by ``keys``.
+
+    The row is created when missing. Runs as an UPDATE first so the common
+    case is a single indexed statement; a concurrent insert of the same key is
+    folded in with ON CONFLICT on SQLite and PostgreSQL. ``keys`` must match a
+    unique constraint of ``table``. Returns True when the row already existed.
+    """
+    condition = [table.c[name] == value for name, value in keys.items()]
+    result = connection.execute(
+        update(table)
+        .where(*condition)
+        .values({name: table.c[name] + delta for name, delta in deltas.items()})
+    )
+    if result.rowcount:
+        return True
+
+    values = dict(keys, **deltas, **insert_values)
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        connection.execute(insert(table).values(values))
+        return False
+
+    statement = dialect_insert(table).values(values)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + statement.excluded[name] for name in deltas}
+    ))
+    return False
+
+class day_diff(FunctionElement):
+    """Whole days from ``start`` to ``end`` (``end - start``) as an integer SQL expression"""
+    type = Integer()
+    name = 'day_diff'
+    inherit_cache = True
+
+@compiles(day_diff)
+def _day_diff(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f'({compiler.process(end, **kw)} - {compiler.process(start, **kw)})'
+
+@compiles(day_diff, 'sqlite')
+def _day_diff_sqlite(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f'CAST(julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)}) AS INTEGER)'
+
+@compiles(day_diff, 'mysql')
+def _day_diff_mysql(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f'DATEDIFF({compiler.process(end, **kw)}, {compiler.process(start, **kw)})'
@@ -0,0 +1,98 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from flask import current_app, send_file
+
+class ContentStore:
+    """Files stored once per content under ``root/ab/cd/<sha256>``.
+
+    Writes stream the source to a temporary file in chunks while hashing it
+    and then rename it into place, so memory use does not grow with the file
+    and identical content already on disk costs no extra space.
+    """
+
+    def __init__(self, root, chunk_size=1024 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def relative_path(sha256):
+        return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+    def path(self, sha256):
+        return os.path.join(self.root, self.relative_path(sha256))
+
+    def exists(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def put(self, stream):
+        """Store a binary stream; returns (sha256, size, created) where created is False for a duplicate"""
+        staging = os.path.join(self.root, 'tmp')
+        os.makedirs(staging, exist_ok=True)
+        digest, size = hashlib.sha256(), 0
+        descriptor, temp_path = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(descriptor, 'wb') as temp:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            target = self.path(sha256)
+            if os.path.exists(target):
+                try:
+                    # Mark the content as in use so garbage collection within its grace period keeps it
+                    os.utime(target)
+                    os.unlink(temp_path)
+                    return sha256, size, False
+                except FileNotFoundError:
+                    pass  # collected meanwhile; store it again
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temp_path, target)
+            return sha256, size, True
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def delete(self, sha256, older_than=None):
+        """Remove a stored file, unless it was written or touched less than ``older_than`` seconds ago"""
+        path = self.path(sha256)
+        try:
+            if older_than is not None and time.time() - os.path.getmtime(path) < older_than:
+                return False
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def send(self, sha256, download_name, mimetype=None, as_attachment=True):
+        """Response for a stored file that never reads it into Python memory.
+
+        With DOCUMENT_ACCEL_REDIRECT_PREFIX set, the front-end server (nginx
+        X-Accel-Redirect) sends the file from that internal location; otherwise
+        send_file streams it, answering Range and conditional requests, and
+        hands it to the server instead when USE_X_SENDFILE is on.
+        """
+        prefix = current_app.config.get('DOCUMENT_ACCEL_REDIRECT_PREFIX')
+        if prefix:
+            response = current_app.response_class(
+                mimetype=mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = '/'.join([prefix.rstrip('/'), sha256[:2], sha256[2:4], sha256])
+            response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                                 filename=download_name)
+            return response
+        return send_file(self.path(sha256), mimetype=mimetype, as_attachment=as_attachment,
+                         download_name=download_name, conditional=True, etag=sha256,
+                         max_age=current_app.config.get('DOCUMENT_CACHE_SECONDS', 3600))
+
+def get_document_store():
+    """The content store under UPLOAD_FOLDER/DOCUMENT_STORE_FOLDER, relative to the app root"""
+    root = os.path.join(current_app.root_path, '..', current_app.config.get('UPLOAD_FOLDER', 'uploads'),
+                        current_app.config.get('DOCUMENT_STORE_FOLDER', 'documents'))
+    return ContentStore(os.path.normpath(root), current_app.config.get('DOCUMENT_CHUNK_SIZE', 1024 * 1024))
@@ -4,4 +4,5 @@ bp = Blueprint('finance', __name__)
 
 # Import models to register them with SQLAlchemy
 from app.finance import models
-from app.finance import routes
\ No newline at end of file
+from app.finance import routes
+from app.finance import commands
\ No newline at end of file
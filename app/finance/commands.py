@@ -0,0 +1,100 @@
+import io
+import random
+import time
+from datetime import date, timedelta
+import click
+from app.core.scheduler import scheduler
+from app.finance import bp
+from app.core.extensions import db
+from app.finance.reconciliation import Reconciler, ReconciliationService, read_csv
+from app.finance.services import LedgerService, AccountTreeService, OverdueInvoiceService, BudgetService
+from app.main.services import NotificationService
+
+@bp.cli.command('notify-overdue')
+def notify_overdue():
+    """Notify approvers about invoices that have gone overdue since the last run."""
+    count = NotificationService.notify_overdue_invoices(db.session.connection())
+    db.session.commit()
+    click.echo(f"Sent notifications for {count} overdue invoices")
+
+@bp.cli.command('rebuild-account-balances')
+def rebuild_account_balances():
+    """Recompute the account balance table from posted journal entries."""
+    count = LedgerService.rebuild()
+    click.echo(f"Rebuilt {count} account balance rows")
+
+@bp.cli.command('rebuild-account-paths')
+def rebuild_account_paths():
+    """Recompute chart of accounts materialized paths from parent_account_id."""
+    count = AccountTreeService.rebuild()
+    click.echo(f"Rebuilt paths for {count} accounts")
+
+@bp.cli.command('rebuild-budget-actuals')
+def rebuild_budget_actuals():
+    """Recompute budget line actuals and variances from the ledger and approved expenses."""
+    count = BudgetService.rebuild()
+    click.echo(f"Rebuilt actuals for {count} budget lines")
+
+@bp.cli.command('sweep-overdue-invoices')
+def sweep_overdue_invoices():
+    """Mark sent invoices whose due date passed since the last sweep as overdue."""
+    count = scheduler.run(OverdueInvoiceService.JOB_NAME, force=True)
+    click.echo(f"Marked {count or 0} invoices overdue")
+
+@bp.cli.command('reconcile-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--bank-account', default=None, help='Only match payments made to this bank account.')
+def reconcile_statement(path, bank_account):
+    """Import a CSV or OFX bank statement and reconcile it against open payments."""
+    with open(path, 'rb') as stream:
+        statement = ReconciliationService.import_statement(stream, path.rsplit('/', 1)[-1], bank_account=bank_account)
+    click.echo(f"Matched {statement.matched_count} of {statement.line_count} statement lines")
+
+@bp.cli.command('benchmark-reconciliation')
+@click.option('--lines', default=1000000, help='Statement lines (and open payments) to generate.')
+@click.option('--tolerance', default=0.0, help='Amount tolerance.')
+@click.option('--window', default=3, help='Date window in days.')
+@click.option('--seed', default=1)
+def benchmark_reconciliation(lines, tolerance, window, seed):
+    """Time CSV parsing and matching on a synthetic statement, without touching the database.
+
+    Lines reference their payment (70%), carry only amount and a shifted date
+    (20%), settle a group of payments sharing a reference (5%) or match
+    nothing (5%).
+    """
+    rng = random.Random(seed)
+    start_day = date(2026, 1, 1)
+    reconciler = Reconciler(round(tolerance * 100), window)
+    csv_text = io.StringIO()
+    csv_text.write('Date,Amount,Reference,Description\n')
+    payment_id = 0
+    started = time.perf_counter()
+    for number in range(lines):
+        kind = rng.random()
+        day = start_day + timedelta(days=rng.randrange(365))
+        if kind < 0.95:
+            group = 3 if kind >= 0.90 else 1
+            reference = f'PAY-{number:07d}'
+            amounts = [rng.randrange(100, 10000000) for _ in range(group)]
+            for amount in amounts:
+                payment_id += 1
+                reconciler.add(payment_id, amount, day, reference if kind < 0.7 or kind >= 0.9 else None)
+            shown_day = day + timedelta(days=rng.randint(-window, window)) if 0.7 <= kind < 0.9 else day
+            csv_text.write(f'{shown_day.isoformat()},{sum(amounts) / 100:.2f},'
+                           f'{reference.lower() if kind < 0.7 or kind >= 0.9 else ""},Transfer\n')
+        else:
+            csv_text.write(f'{day.isoformat()},{rng.randrange(100, 10000000) / 100:.2f},NOISE{number},Unknown\n')
+    indexed = time.perf_counter()
+    click.echo(f"Generated the statement and indexed {len(reconciler)} payments in {indexed - started:.2f}s")
+
+    stream = io.BytesIO(csv_text.getvalue().encode('utf-8'))
+    matched, counts = 0, {}
+    started = time.perf_counter()
+    for line in read_csv(stream):
+        payments, match_type = reconciler.match(line)
+        if match_type:
+            matched += 1
+            counts[match_type] = counts.get(match_type, 0) + 1
+    elapsed = time.perf_counter() - started
+    click.echo(f"Parsed and matched {lines} lines in {elapsed:.2f}s ({lines / elapsed:,.0f} lines/s); "
+               f"matched {matched} ({', '.join(f'{k}: {v}' for k, v in sorted(counts.items()))})")
@@ -1,8 +1,14 @@
 from app.core.extensions import db
 from app.models.base import BaseModel
+from app.core.sequences import next_document_number
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import event
+from sqlalchemy import event, inspect, and_, case, literal
+from sqlalchemy.ext.hybrid import hybrid_property
+from app.core.sql import day_diff
+
+# Invoice statuses that still carry a receivable; drafts, paid and cancelled invoices never become overdue
+OPEN_INVOICE_STATUSES = ('sent', 'overdue')
 
 class ChartOfAccounts(BaseModel):
     __tablename__ = 'chart_of_accounts'
@@ -13,22 +19,33 @@ class ChartOfAccounts(BaseModel):
     parent_account_id = db.Column(db.Integer, db.ForeignKey('chart_of_accounts.id'))
     description = db.Column(db.Text)
     is_active = db.Column(db.Boolean, default=True)
+    # Materialized path of ids from the root ('/1/4/9/') and depth below it, kept by listeners
+    path = db.Column(db.String(255), index=True)
+    depth = db.Column(db.Integer, default=0)
     
     # Self-referential relationship
     parent = db.relationship('ChartOfAccounts', remote_side='ChartOfAccounts.id', backref='sub_accounts')
 
+    @property
+    def ancestor_ids(self):
+        """Ids from the root down to this account, read from the materialized path"""
+        return [int(part) for part in (self.path or '').split('/') if part]
+
     @property
     def full_account_name(self):
-        """Get full account name with parent"""
-        if self.parent:
-            return f"{self.parent.account_name} - {self.account_name}"
-        return self.account_name
+        """Account names from the root down, from the cached account tree"""
+        from app.finance.services import AccountTreeService
+        return AccountTreeService.full_name(self)
 
     def __repr__(self):
         return f'<Account {self.account_code}: {self.account_name}>'
 
 class Invoice(BaseModel):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        db.Index('ix_invoices_customer_issue_date', 'customer_id', 'issue_date'),
+        db.Index('ix_invoices_status_due_date_customer', 'status', 'due_date', 'customer_id'),
+    )
     
     invoice_number = db.Column(db.String(50), unique=True, nullable=False)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
@@ -67,25 +84,47 @@ class Invoice(BaseModel):
         self.total_amount = self.subtotal + self.tax_amount + self.shipping_cost - self.discount_amount
         self.balance_due = self.total_amount - self.paid_amount
 
-    @property
+    @hybrid_property
+    def is_open(self):
+        """Sent or overdue with a balance left; also usable in queries"""
+        return self.status in OPEN_INVOICE_STATUSES and (self.balance_due or 0) > 0
+
+    @is_open.expression
+    def is_open(cls):
+        return and_(cls.status.in_(OPEN_INVOICE_STATUSES), cls.balance_due > 0)
+
+    @classmethod
+    def overdue_on(cls, day):
+        """SQL condition for invoices open and past their due date on ``day``"""
+        return and_(cls.is_open, cls.due_date < day)
+
+    @hybrid_property
     def is_overdue(self):
-        """Check if invoice is overdue"""
-        return date.today() > self.due_date and self.balance_due > 0
+        """Open and past its due date; also usable in queries"""
+        return self.is_open and date.today() > self.due_date
 
-    @property
+    @is_overdue.expression
+    def is_overdue(cls):
+        return cls.overdue_on(date.today())
+
+    @hybrid_property
     def days_overdue(self):
-        """Calculate days overdue"""
+        """Days past the due date, 0 when not overdue; also usable in queries"""
         if self.is_overdue:
             return (date.today() - self.due_date).days
         return 0
 
+    @days_overdue.expression
+    def days_overdue(cls):
+        return case((cls.is_overdue, day_diff(cls.due_date, literal(date.today()))), else_=0)
+
     def __repr__(self):
         return f'<Invoice {self.invoice_number}>'
 
 class InvoiceItem(BaseModel):
     __tablename__ = 'invoice_items'
     
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
     
     description = db.Column(db.String(200), nullable=False)
@@ -218,6 +257,82 @@ class JournalEntryLine(BaseModel):
     def __repr__(self):
         return f'<JournalEntryLine Entry:{self.journal_entry_id} Account:{self.account_id}>'
 
+class AccountBalance(BaseModel):
+    """Posted debits and credits per account and fiscal period (YYYYMM), kept in step with journal postings"""
+    __tablename__ = 'account_balances'
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'period', name='uq_account_balances_key'),
+        db.Index('ix_account_balances_period', 'period'),
+    )
+
+    account_id = db.Column(db.Integer, db.ForeignKey('chart_of_accounts.id'), nullable=False)
+    period = db.Column(db.Integer, nullable=False)  # year * 100 + month of the entry date
+    debit_total = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    credit_total = db.Column(db.Numeric(18, 2), nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+
+    account = db.relationship('ChartOfAccounts', backref='balances')
+
+    @property
+    def balance(self):
+        return self.debit_total - self.credit_total
+
+    def __repr__(self):
+        return f'<AccountBalance Account:{self.account_id} {self.period}>'
+
+class BankStatement(BaseModel):
+    """An imported bank statement file and how many of its lines were reconciled"""
+    __tablename__ = 'bank_statements'
+
+    file_name = db.Column(db.String(255), nullable=False)
+    bank_account = db.Column(db.String(100))
+    line_count = db.Column(db.Integer, default=0)
+    matched_count = db.Column(db.Integer, default=0)
+    imported_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    imported_by = db.relationship('User', backref='bank_statements')
+
+    def __repr__(self):
+        return f'<BankStatement {self.file_name}>'
+
+class BankStatementLine(BaseModel):
+    __tablename__ = 'bank_statement_lines'
+    __table_args__ = (
+        db.Index('ix_bank_statement_lines_statement_status', 'statement_id', 'status'),
+    )
+
+    statement_id = db.Column(db.Integer, db.ForeignKey('bank_statements.id'), nullable=False)
+    line_number = db.Column(db.Integer, nullable=False)
+    transaction_date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Numeric(15, 2), nullable=False)
+    reference = db.Column(db.String(100))
+    description = db.Column(db.String(255))
+    status = db.Column(db.String(20), default='unmatched')  # matched, unmatched
+    match_type = db.Column(db.String(20))  # reference, reference_group, amount_date
+
+    statement = db.relationship('BankStatement', backref=db.backref('lines', lazy='dynamic'))
+
+    def __repr__(self):
+        return f'<BankStatementLine {self.statement_id}:{self.line_number}>'
+
+class BankReconciliationMatch(BaseModel):
+    """A payment reconciled against a statement line; a line may settle several payments, a payment only once"""
+    __tablename__ = 'bank_reconciliation_matches'
+    __table_args__ = (
+        db.UniqueConstraint('payment_id', name='uq_bank_reconciliation_matches_payment'),
+        db.Index('ix_bank_reconciliation_matches_line', 'line_id'),
+    )
+
+    line_id = db.Column(db.Integer, db.ForeignKey('bank_statement_lines.id'), nullable=False)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=False)
+    amount = db.Column(db.Numeric(15, 2), nullable=False)
+
+    line = db.relationship('BankStatementLine', backref='matches')
+    payment = db.relationship('Payment', backref=db.backref('reconciliation', uselist=False))
+
+    def __repr__(self):
+        return f'<BankReconciliationMatch Line:{self.line_id} Payment:{self.payment_id}>'
+
 class Budget(BaseModel):
     __tablename__ = 'budgets'
     
@@ -251,8 +366,8 @@ class BudgetLine(BaseModel):
         return 0
 
     def calculate_variance(self):
-        """Calculate variance (actual - budgeted)"""
-        self.variance = self.actual_amount - self.budgeted_amount
+        """Calculate variance (actual - budgeted); actual_amount itself is kept current by listeners"""
+        self.variance = (self.actual_amount or 0) - self.budgeted_amount
 
     def __repr__(self):
         return f'<BudgetLine Budget:{self.budget_id} Account:{self.account_id}>'
@@ -261,35 +376,126 @@ class BudgetLine(BaseModel):
 @event.listens_for(Invoice, 'before_insert')
 def generate_invoice_number(mapper, connection, target):
     if not target.invoice_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(invoice_number, 5) AS INTEGER)) FROM invoices WHERE invoice_number LIKE 'INV-%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.invoice_number = f"INV-{next_num:06d}"
+        target.invoice_number = next_document_number(connection, 'INV-', Invoice.__table__.c.invoice_number)
 
 @event.listens_for(Payment, 'before_insert')
 def generate_payment_number(mapper, connection, target):
     if not target.payment_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(payment_number, 5) AS INTEGER)) FROM payments WHERE payment_number LIKE 'PAY-%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.payment_number = f"PAY-{next_num:06d}"
+        target.payment_number = next_document_number(connection, 'PAY-', Payment.__table__.c.payment_number)
 
 @event.listens_for(Expense, 'before_insert')
 def generate_expense_number(mapper, connection, target):
     if not target.expense_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(expense_number, 5) AS INTEGER)) FROM expenses WHERE expense_number LIKE 'EXP-%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.expense_number = f"EXP-{next_num:06d}"
+        target.expense_number = next_document_number(connection, 'EXP-', Expense.__table__.c.expense_number)
 
 @event.listens_for(JournalEntry, 'before_insert')
 def generate_journal_entry_number(mapper, connection, target):
     if not target.entry_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(entry_number, 3) AS INTEGER)) FROM journal_entries WHERE entry_number LIKE 'JE%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.entry_number = f"JE{next_num:06d}"
\ No newline at end of file
+        target.entry_number = next_document_number(connection, 'JE', JournalEntry.__table__.c.entry_number)
+
+# Approval notifications
+def _notify_expense_approval(connection, target):
+    from app.main.services import NotificationService
+    NotificationService.notify_approval(
+        connection, 'expense', target.id, target.status, target.submitted_by_id,
+        NotificationService.recipients(connection),
+        f'Expense {target.expense_number}', link=f'/finance/expenses/{target.id}')
+
+@event.listens_for(Expense, 'after_insert')
+def notify_expense_submitted(mapper, connection, target):
+    _notify_expense_approval(connection, target)
+
+@event.listens_for(Expense, 'after_update')
+def notify_expense_status(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        _notify_expense_approval(connection, target)
+
+# Keep account_balances equal to the sum of posted journal lines. Entry rows are written before
+# their lines in a flush, so entry events move the lines already stored and line events the rest
+_ENTRY_BALANCE_FIELDS = ('status', 'entry_date', 'is_deleted')
+_LINE_BALANCE_FIELDS = ('journal_entry_id', 'account_id', 'debit_amount', 'credit_amount', 'is_deleted')
+
+@event.listens_for(JournalEntry, 'after_insert')
+def post_journal_entry(mapper, connection, target):
+    from app.finance.services import LedgerService
+    LedgerService.apply_entry(connection, target.id, target.status, target.entry_date, target.is_deleted)
+
+@event.listens_for(JournalEntry, 'before_update')
+def unpost_stored_journal_entry(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _ENTRY_BALANCE_FIELDS):
+        from app.finance.services import LedgerService
+        LedgerService.reverse_stored_entry(connection, target.id)
+
+@event.listens_for(JournalEntry, 'after_update')
+def repost_journal_entry(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _ENTRY_BALANCE_FIELDS):
+        from app.finance.services import LedgerService
+        LedgerService.apply_entry(connection, target.id, target.status, target.entry_date, target.is_deleted)
+
+@event.listens_for(JournalEntry, 'before_delete')
+def unpost_deleted_journal_entry(mapper, connection, target):
+    from app.finance.services import LedgerService
+    LedgerService.reverse_stored_entry(connection, target.id)
+
+@event.listens_for(JournalEntryLine, 'after_insert')
+def post_journal_line(mapper, connection, target):
+    from app.finance.services import LedgerService
+    LedgerService.apply_line(connection, target.journal_entry_id, target.account_id,
+                             target.debit_amount, target.credit_amount, target.is_deleted)
+
+@event.listens_for(JournalEntryLine, 'before_update')
+def repost_journal_line(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _LINE_BALANCE_FIELDS):
+        from app.finance.services import LedgerService
+        LedgerService.reverse_stored_line(connection, target.id)
+        LedgerService.apply_line(connection, target.journal_entry_id, target.account_id,
+                                 target.debit_amount, target.credit_amount, target.is_deleted)
+
+@event.listens_for(JournalEntryLine, 'before_delete')
+def unpost_journal_line(mapper, connection, target):
+    from app.finance.services import LedgerService
+    LedgerService.reverse_stored_line(connection, target.id)
+
+# Keep chart_of_accounts.path in step with parent_account_id
+@event.listens_for(ChartOfAccounts, 'after_insert')
+def add_account_path(mapper, connection, target):
+    from app.finance.services import AccountTreeService
+    AccountTreeService.insert_node(connection, target)
+
+@event.listens_for(ChartOfAccounts, 'before_update')
+def check_account_move(mapper, connection, target):
+    if inspect(target).attrs.parent_account_id.history.has_changes():
+        from app.finance.services import AccountTreeService
+        AccountTreeService.check_move(connection, target.id, target.parent_account_id)
+
+@event.listens_for(ChartOfAccounts, 'after_update')
+def move_account_path(mapper, connection, target):
+    if inspect(target).attrs.parent_account_id.history.has_changes():
+        from app.finance.services import AccountTreeService
+        AccountTreeService.move_node(connection, target)
+
+# Keep budget_lines.actual_amount current: postings queue deltas (see LedgerService.post);
+# new lines and changed budget ranges are recomputed at commit
+@event.listens_for(BudgetLine, 'after_insert')
+def budget_line_insert(mapper, connection, target):
+    from app.finance.services import BudgetService
+    BudgetService.mark(connection, [target.id])
+
+@event.listens_for(BudgetLine, 'after_update')
+def budget_line_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in ('account_id', 'budgeted_amount', 'is_deleted')):
+        from app.finance.services import BudgetService
+        BudgetService.mark(connection, [target.id])
+
+@event.listens_for(Budget, 'after_update')
+def budget_range_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.start_date.history.has_changes() or state.attrs.end_date.history.has_changes():
+        from app.finance.services import BudgetService
+        BudgetService.mark(connection, connection.execute(
+            BudgetLine.__table__.select().with_only_columns(BudgetLine.__table__.c.id)
+            .where(BudgetLine.__table__.c.budget_id == target.id)).scalars().all())
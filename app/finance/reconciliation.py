@@ -0,0 +1,309 @@
+import csv
+import io
+import re
+from collections import defaultdict, namedtuple
+from datetime import datetime, date
+from decimal import Decimal, InvalidOperation
+from flask import current_app
+from sqlalchemy import select, insert, exists, func
+from app.core.extensions import db
+from app.finance.models import Payment, BankStatement, BankStatementLine, BankReconciliationMatch
+
+payments = Payment.__table__
+statement_lines = BankStatementLine.__table__
+reconciliation_matches = BankReconciliationMatch.__table__
+
+# One parsed statement line; amount is in cents, positive for money received
+StatementLine = namedtuple('StatementLine', 'line_number transaction_date amount reference description')
+
+# Header names (lower-cased) recognised in CSV statements, by field
+CSV_COLUMNS = {
+    'date': ('date', 'transaction date', 'posted date', 'posting date', 'booking date', 'value date'),
+    'amount': ('amount', 'transaction amount', 'value'),
+    'credit': ('credit', 'credit amount', 'paid in', 'deposit'),
+    'debit': ('debit', 'debit amount', 'paid out', 'withdrawal'),
+    'reference': ('reference', 'ref', 'reference number', 'transaction id', 'fitid', 'check number'),
+    'description': ('description', 'memo', 'details', 'narrative', 'payee', 'name'),
+}
+
+_OFX_TAG = re.compile(r'<(/?)(\w+)>([^<\r\n]*)')
+_REFERENCE_JUNK = re.compile(r'[^A-Z0-9]')
+_TOKEN = re.compile(r'[A-Za-z0-9][A-Za-z0-9\-/]{3,}')
+_PLAIN_AMOUNT = re.compile(r'(-?)(\d+)(?:\.(\d{1,2}))?$')
+
+def normalize_reference(value):
+    """Upper-cased alphanumerics of a reference, so 'inv-0042 ' and 'INV0042' meet; None when empty"""
+    return _REFERENCE_JUNK.sub('', (value or '').upper()) or None
+
+def to_cents(value):
+    """'1,234.50', '(12.00)' or Decimal to integer cents; raises ValueError when unreadable"""
+    if isinstance(value, (int, Decimal)):
+        return int((Decimal(value) * 100).to_integral_value())
+    plain = _PLAIN_AMOUNT.match(value or '')
+    if plain:
+        # Statements are mostly plain '-1234.5' amounts; skip Decimal for those
+        sign, units, fraction = plain.groups()
+        cents = int(units) * 100 + int((fraction or '0').ljust(2, '0'))
+        return -cents if sign else cents
+    text = (value or '').strip().replace(',', '').replace('$', '')
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        cents = int((Decimal(text.strip('()')) * 100).to_integral_value())
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {value}')
+    return -cents if negative else cents
+
+def _parse_date(text, formats, cache):
+    day = cache.get(text)
+    if day is not None:
+        return day
+    for date_format in formats:
+        try:
+            day = cache[text] = datetime.strptime(text.strip(), date_format).date()
+            return day
+        except ValueError:
+            continue
+    raise ValueError(f'Invalid date: {text}')
+
+def read_csv(stream, date_formats=('%Y-%m-%d',)):
+    """Yield StatementLines from a CSV statement one row at a time; dates repeat, so each is parsed once"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    headers = {name.strip().lower(): position for position, name in enumerate(next(reader, ()))}
+    columns = {field: next((headers[name] for name in names if name in headers), None)
+               for field, names in CSV_COLUMNS.items()}
+    if columns['date'] is None or (columns['amount'] is None and columns['credit'] is None):
+        raise ValueError('A CSV statement needs a date column and an amount or credit column')
+    date_column, amount_column = columns['date'], columns['amount']
+    reference_column, description_column = columns['reference'], columns['description']
+    days = {}
+    for number, row in enumerate(reader, 1):
+        if not row:
+            continue
+        if amount_column is not None:
+            amount = to_cents(row[amount_column])
+        else:
+            amount = to_cents(row[columns['credit']] or '0') - to_cents(
+                (row[columns['debit']] if columns['debit'] is not None else None) or '0')
+        yield StatementLine(number, _parse_date(row[date_column], date_formats, days), amount,
+                            row[reference_column].strip() if reference_column is not None else None,
+                            row[description_column].strip() if description_column is not None else None)
+
+def read_ofx(stream):
+    """Yield StatementLines from an OFX/QFX statement (SGML or XML), one transaction at a time"""
+    transaction, number, days = None, 0, {}
+    for line in io.TextIOWrapper(stream, encoding='latin-1', newline=''):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and transaction is not None:
+                    number += 1
+                    memo = transaction.get('NAME') or transaction.get('MEMO')
+                    if transaction.get('NAME') and transaction.get('MEMO'):
+                        memo = f"{transaction['NAME']} {transaction['MEMO']}"
+                    yield StatementLine(number, _parse_date(transaction['DTPOSTED'][:8], ('%Y%m%d',), days),
+                                        to_cents(transaction['TRNAMT']),
+                                        transaction.get('REFNUM') or transaction.get('CHECKNUM') or transaction.get('FITID'),
+                                        memo)
+                    transaction = None
+                elif not closing:
+                    transaction = {}
+            elif transaction is not None and not closing and value.strip():
+                transaction[tag] = value.strip()
+
+def read_statement(stream, file_name, date_formats=('%Y-%m-%d',)):
+    if file_name.lower().rsplit('.', 1)[-1] in ('ofx', 'qfx'):
+        return read_ofx(stream)
+    return read_csv(stream, date_formats)
+
+class Reconciler:
+    """Matches statement lines to open payments through two hash indexes.
+
+    Payments are indexed by normalized reference (reference_number and
+    transaction_id) and by (amount bucket, day). A line looks up its reference
+    and the reference-like tokens of its description first, then probes the
+    amount buckets either side of its own for every day of the date window, so
+    each line costs a bounded number of dictionary lookups whatever the number
+    of payments. Buckets are ``tolerance + 1`` cents wide, so the three probed
+    buckets cover every amount within the tolerance. A reference shared by
+    several open payments whose amounts add up to the line settles all of
+    them (one line to many payments).
+    """
+
+    def __init__(self, tolerance=0, window=3):
+        self.tolerance = tolerance
+        self.window = window
+        self.width = tolerance + 1
+        self.ids, self.amounts, self.days = [], [], []
+        self.used = bytearray()
+        self.by_reference = defaultdict(list)
+        self.by_amount = defaultdict(list)
+
+    def add(self, payment_id, amount, day, *references):
+        """Index an open payment: amount in cents, day as a date or ordinal"""
+        index = len(self.ids)
+        day = day.toordinal() if isinstance(day, date) else day
+        self.ids.append(payment_id)
+        self.amounts.append(amount)
+        self.days.append(day)
+        self.used.append(0)
+        for reference in {normalize_reference(reference) for reference in references} - {None}:
+            self.by_reference[reference].append(index)
+        self.by_amount[(amount // self.width, day)].append(index)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _references(self, line):
+        reference = normalize_reference(line.reference)
+        if reference:
+            yield reference
+        for token in _TOKEN.findall(line.description or ''):
+            token = normalize_reference(token)
+            if token and token != reference:
+                yield token
+
+    def _by_reference(self, line):
+        for reference in self._references(line):
+            candidates = [index for index in self.by_reference.get(reference, ()) if not self.used[index]]
+            if not candidates:
+                continue
+            close = [index for index in candidates if abs(self.amounts[index] - line.amount) <= self.tolerance]
+            if close:
+                day = line.transaction_date.toordinal()
+                return [min(close, key=lambda index: abs(self.days[index] - day))], 'reference'
+            if len(candidates) > 1 and abs(sum(self.amounts[index] for index in candidates) - line.amount) <= self.tolerance:
+                return candidates, 'reference_group'
+        return None
+
+    def _by_amount(self, line):
+        day, bucket = line.transaction_date.toordinal(), line.amount // self.width
+        best, best_key = None, None
+        for offset in range(-self.window, self.window + 1):
+            for probe in (bucket - 1, bucket, bucket + 1):
+                for index in self.by_amount.get((probe, day + offset), ()):
+                    difference = abs(self.amounts[index] - line.amount)
+                    if self.used[index] or difference > self.tolerance:
+                        continue
+                    key = (abs(offset), difference, index)
+                    if best_key is None or key < best_key:
+                        best, best_key = index, key
+        return ([best], 'amount_date') if best is not None else None
+
+    def match(self, line):
+        """(payment ids, match type) for a line, claiming the payments; ([], None) when nothing fits"""
+        if line.amount <= 0:
+            return [], None
+        found = self._by_reference(line) or self._by_amount(line)
+        if found is None:
+            return [], None
+        indexes, match_type = found
+        for index in indexes:
+            self.used[index] = 1
+        return [(self.ids[index], self.amounts[index]) for index in indexes], match_type
+
+class ReconciliationService:
+    """Import bank statements and reconcile their lines against open payments in bulk"""
+
+    @staticmethod
+    def reconciler(bank_account=None):
+        """A Reconciler over every completed payment not yet reconciled, loaded in one query"""
+        config = current_app.config
+        reconciler = Reconciler(to_cents(Decimal(str(config.get('BANK_MATCH_AMOUNT_TOLERANCE', 0)))),
+                                config.get('BANK_MATCH_DATE_WINDOW', 3))
+        reconciled = exists().where(reconciliation_matches.c.payment_id == payments.c.id)
+        statement = (
+            select(payments.c.id, payments.c.amount, payments.c.payment_date, payments.c.reference_number,
+                   payments.c.transaction_id)
+            .where(payments.c.status == 'completed', payments.c.is_deleted == False, ~reconciled)
+        )
+        if bank_account:
+            statement = statement.where(payments.c.bank_account == bank_account)
+        for row in db.session.execute(statement.execution_options(yield_per=10000)):
+            reconciler.add(row.id, to_cents(row.amount), row.payment_date, row.reference_number, row.transaction_id)
+        return reconciler
+
+    @staticmethod
+    def import_statement(stream, file_name, user_id=None, bank_account=None):
+        """Stream a CSV or OFX statement, match each line and store lines and matches in executemany batches.
+
+        Returns the BankStatement. Raises ValueError for an unreadable file;
+        nothing is stored then.
+        """
+        config = current_app.config
+        batch_size = config.get('BANK_RECONCILIATION_BATCH_SIZE', 5000)
+        date_formats = ('%Y-%m-%d',) + tuple(config.get('BANK_STATEMENT_DATE_FORMATS', ()))
+        reconciler = ReconciliationService.reconciler(bank_account)
+
+        statement = BankStatement(file_name=file_name, bank_account=bank_account, imported_by_id=user_id)
+        db.session.add(statement)
+        db.session.flush()
+        connection = db.session.connection()
+        batch, line_count, matched_count = [], 0, 0
+        try:
+            for line in read_statement(stream, file_name, date_formats):
+                batch.append((line, *reconciler.match(line)))
+                if len(batch) >= batch_size:
+                    matched_count += ReconciliationService._store(connection, statement.id, batch)
+                    line_count += len(batch)
+                    batch = []
+            if batch:
+                matched_count += ReconciliationService._store(connection, statement.id, batch)
+                line_count += len(batch)
+        except (ValueError, KeyError, IndexError, csv.Error) as e:
+            db.session.rollback()
+            raise ValueError(f'Could not read {file_name}: {e}')
+        statement.line_count = line_count
+        statement.matched_count = matched_count
+        db.session.commit()
+        return statement
+
+    @staticmethod
+    def _store(connection, statement_id, batch):
+        """Insert one batch of (line, matches, match type): lines first for their ids, then matches"""
+        now = datetime.utcnow()
+        audit = {'created_at': now, 'updated_at': now, 'is_deleted': False}
+        line_ids = connection.execute(
+            insert(statement_lines).returning(statement_lines.c.id, sort_by_parameter_order=True),
+            [dict(audit, statement_id=statement_id, line_number=line.line_number,
+                  transaction_date=line.transaction_date, amount=Decimal(line.amount) / 100,
+                  reference=(line.reference or None) and line.reference[:100],
+                  description=(line.description or None) and line.description[:255],
+                  status='matched' if match_type else 'unmatched', match_type=match_type)
+             for line, matches, match_type in batch]
+        ).scalars().all()
+        rows = [dict(audit, line_id=line_id, payment_id=payment_id, amount=Decimal(amount) / 100)
+                for line_id, (line, matches, match_type) in zip(line_ids, batch)
+                for payment_id, amount in matches]
+        if rows:
+            connection.execute(insert(reconciliation_matches), rows)
+        return sum(1 for line, matches, match_type in batch if match_type)
+
+    @staticmethod
+    def summary(statement, unmatched_limit=100):
+        """Counts per match type and the first unmatched lines of a statement"""
+        counts = dict(db.session.execute(
+            select(statement_lines.c.match_type, func.count())
+            .where(statement_lines.c.statement_id == statement.id)
+            .group_by(statement_lines.c.match_type)
+        ).all())
+        unmatched = db.session.execute(
+            select(statement_lines.c.line_number, statement_lines.c.transaction_date, statement_lines.c.amount,
+                   statement_lines.c.reference, statement_lines.c.description)
+            .where(statement_lines.c.statement_id == statement.id, statement_lines.c.status == 'unmatched')
+            .order_by(statement_lines.c.line_number).limit(unmatched_limit)
+        ).all()
+        return {
+            'id': statement.id,
+            'file_name': statement.file_name,
+            'bank_account': statement.bank_account,
+            'line_count': statement.line_count,
+            'matched_count': statement.matched_count,
+            'match_types': {match_type: count for match_type, count in counts.items() if match_type},
+            'unmatched': [{
+                'line_number': row.line_number,
+                'transaction_date': row.transaction_date.isoformat(),
+                'amount': float(row.amount),
+                'reference': row.reference,
+                'description': row.description,
+            } for row in unmatched],
+        }
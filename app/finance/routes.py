@@ -1,10 +1,39 @@
-from flask import render_template, request, redirect, url_for, flash
-from flask_login import login_required
+from datetime import date, datetime
+from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
 from app.finance import bp
+from app.finance.models import Invoice, Payment, Expense, ChartOfAccounts, BankStatement
+from app.finance.reconciliation import ReconciliationService
+from app.finance.services import (LedgerService, AccountTreeService, JournalPostingService, JournalBatchError,
+                                  ReceivablesService, BudgetService, fiscal_period, fiscal_year_start, format_period, parse_period)
+from app.sales.models import Customer
+from app.core.export import export_response, stream_query
 
 @bp.route('/invoices')
 @login_required
 def invoices():
+    status_filter = request.args.get('status', '')
+    customer_filter = request.args.get('customer_id', type=int)
+    
+    query = Invoice.query.filter_by(is_deleted=False)
+    if status_filter:
+        query = query.filter(Invoice.status == status_filter)
+    if customer_filter:
+        query = query.filter(Invoice.customer_id == customer_filter)
+    
+    export = export_response(
+        request.args.get('export'), 'invoices',
+        ['Invoice Number', 'Customer', 'Issue Date', 'Due Date', 'Status', 'Subtotal', 'Tax',
+         'Total', 'Paid', 'Balance Due'],
+        stream_query(
+            query.outerjoin(Customer, Customer.id == Invoice.customer_id)
+            .with_entities(Invoice.invoice_number, Customer.company_name, Invoice.issue_date, Invoice.due_date,
+                           Invoice.status, Invoice.subtotal, Invoice.tax_amount, Invoice.total_amount,
+                           Invoice.paid_amount, Invoice.balance_due)
+            .order_by(Invoice.issue_date.desc(), Invoice.id)))
+    if export:
+        return export
+    
     return render_template('finance/invoices.html')
 
 @bp.route('/invoices/create', methods=['GET', 'POST'])
@@ -48,6 +77,28 @@ def edit_invoice(id):
 @bp.route('/payments')
 @login_required
 def payments():
+    status_filter = request.args.get('status', '')
+    method_filter = request.args.get('payment_method', '')
+    
+    query = Payment.query.filter_by(is_deleted=False)
+    if status_filter:
+        query = query.filter(Payment.status == status_filter)
+    if method_filter:
+        query = query.filter(Payment.payment_method == method_filter)
+    
+    export = export_response(
+        request.args.get('export'), 'payments',
+        ['Payment Number', 'Invoice', 'Customer', 'Payment Date', 'Method', 'Reference', 'Amount', 'Status'],
+        stream_query(
+            query.outerjoin(Invoice, Invoice.id == Payment.invoice_id)
+            .outerjoin(Customer, Customer.id == Payment.customer_id)
+            .with_entities(Payment.payment_number, Invoice.invoice_number, Customer.company_name,
+                           Payment.payment_date, Payment.payment_method, Payment.reference_number,
+                           Payment.amount, Payment.status)
+            .order_by(Payment.payment_date.desc(), Payment.id)))
+    if export:
+        return export
+    
     return render_template('finance/payments.html')
 
 @bp.route('/payments/add', methods=['GET', 'POST'])
@@ -74,6 +125,25 @@ def payment_detail(id):
 @bp.route('/expenses')
 @login_required
 def expenses():
+    status_filter = request.args.get('status', '')
+    category_filter = request.args.get('category', '')
+    
+    query = Expense.query.filter_by(is_deleted=False)
+    if status_filter:
+        query = query.filter(Expense.status == status_filter)
+    if category_filter:
+        query = query.filter(Expense.category == category_filter)
+    
+    export = export_response(
+        request.args.get('export'), 'expenses',
+        ['Expense Number', 'Category', 'Vendor', 'Expense Date', 'Payment Method', 'Amount', 'Tax', 'Status'],
+        stream_query(
+            query.with_entities(Expense.expense_number, Expense.category, Expense.vendor, Expense.expense_date,
+                                Expense.payment_method, Expense.amount, Expense.tax_amount, Expense.status)
+            .order_by(Expense.expense_date.desc(), Expense.id)))
+    if export:
+        return export
+    
     return render_template('finance/expenses.html')
 
 @bp.route('/expenses/add', methods=['GET', 'POST'])
@@ -95,4 +165,148 @@ def add_expense():
 def expense_detail(id):
     # TODO: Get expense from database
     expense = None
-    return render_template('finance/expense_detail.html', expense=expense)
\ No newline at end of file
+    return render_template('finance/expense_detail.html', expense=expense)
+
+def _report_period(name, default):
+    """A YYYY-MM query argument as a balance period, ``default`` when absent"""
+    return parse_period(request.args[name]) if request.args.get(name) else default
+
+@bp.route('/reports/trial-balance')
+@login_required
+def trial_balance():
+    """Net debit or credit balance per account up to period_to (default this month) as JSON"""
+    try:
+        period_to = _report_period('period_to', fiscal_period(date.today()))
+        period_from = _report_period('period_from', None)
+    except ValueError:
+        return jsonify({'error': 'Periods must be formatted as YYYY-MM'}), 400
+    
+    return jsonify(LedgerService.trial_balance(period_to, period_from))
+
+@bp.route('/reports/balance-sheet')
+@login_required
+def balance_sheet():
+    """Assets, liabilities and equity at the end of a period (default this month) as JSON"""
+    try:
+        period = _report_period('period', fiscal_period(date.today()))
+    except ValueError:
+        return jsonify({'error': 'Periods must be formatted as YYYY-MM'}), 400
+    
+    return jsonify(LedgerService.balance_sheet(period))
+
+@bp.route('/reports/profit-loss')
+@login_required
+def profit_and_loss():
+    """Revenue, expenses and net income from period_from (default fiscal year start) to period_to as JSON"""
+    try:
+        period_to = _report_period('period_to', fiscal_period(date.today()))
+        period_from = _report_period('period_from', fiscal_year_start(period_to))
+    except ValueError:
+        return jsonify({'error': 'Periods must be formatted as YYYY-MM'}), 400
+    if period_from > period_to:
+        return jsonify({'error': 'period_from must not be after period_to'}), 400
+    
+    return jsonify(LedgerService.profit_and_loss(period_from, period_to))
+
+@bp.route('/accounts/tree')
+@login_required
+def account_tree():
+    """The chart of accounts as a nested tree, with subtree balances up to period_to when balances=1, as JSON"""
+    roots = AccountTreeService.tree()['roots']
+    if not request.args.get('balances'):
+        return jsonify({'accounts': roots})
+    try:
+        period_to = _report_period('period_to', fiscal_period(date.today()))
+        period_from = _report_period('period_from', None)
+    except ValueError:
+        return jsonify({'error': 'Periods must be formatted as YYYY-MM'}), 400
+    
+    rollups = AccountTreeService.rollups(period_to, period_from)
+    
+    def with_balances(node):
+        return dict(node, rollup=rollups.get(node['id']), children=[with_balances(child) for child in node['children']])
+    
+    return jsonify({'period_to': format_period(period_to), 'accounts': [with_balances(root) for root in roots]})
+
+@bp.route('/accounts/<int:id>/rollup')
+@login_required
+def account_rollup(id):
+    """Debit, credit and balance of an account and all its sub-accounts as JSON"""
+    account = ChartOfAccounts.query.get_or_404(id)
+    try:
+        period_to = _report_period('period_to', fiscal_period(date.today()))
+        period_from = _report_period('period_from', None)
+    except ValueError:
+        return jsonify({'error': 'Periods must be formatted as YYYY-MM'}), 400
+    
+    rollup = AccountTreeService.rollups(period_to, period_from, account_id=account.id).get(account.id)
+    if rollup is None:
+        return jsonify({'error': 'Account has no tree path; run "flask main upgrade-schema"'}), 404
+    return jsonify(dict(rollup, account_id=account.id, account_code=account.account_code,
+                        account_name=account.full_account_name))
+
+@bp.route('/journal-entries/bulk', methods=['POST'])
+@login_required
+def bulk_journal_entries():
+    """Validate and insert a JSON batch of journal entries with their lines in one transaction"""
+    data = request.get_json(silent=True) or {}
+    entries = data.get('entries')
+    status = data.get('status', 'posted')
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return jsonify({'error': 'entries must be a list of journal entries'}), 400
+    if status not in ('draft', 'posted'):
+        return jsonify({'error': 'status must be draft or posted'}), 400
+    
+    try:
+        result = JournalPostingService.post(entries, user_id=current_user.id, status=status)
+    except JournalBatchError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    return jsonify(result), 201
+
+@bp.route('/reports/ar-aging')
+@login_required
+def ar_aging():
+    """Open receivables per customer in aging buckets as of a date (default today) as JSON;
+    with customer_id, also that customer's open invoices"""
+    try:
+        as_of = datetime.strptime(request.args['as_of'], '%Y-%m-%d').date() if request.args.get('as_of') else date.today()
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+    
+    customer_id = request.args.get('customer_id', type=int)
+    aging = ReceivablesService.aging(as_of, customer_id)
+    if customer_id is not None:
+        aging['invoices'] = ReceivablesService.open_invoices(customer_id, as_of)
+    return jsonify(aging)
+
+@bp.route('/reconciliation/import', methods=['POST'])
+@login_required
+def import_bank_statement():
+    """Import a CSV or OFX bank statement upload and reconcile it against open payments"""
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        return jsonify({'error': 'No statement file uploaded'}), 400
+    
+    try:
+        statement = ReconciliationService.import_statement(file.stream, file.filename, user_id=current_user.id,
+                                                           bank_account=request.form.get('bank_account') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(ReconciliationService.summary(statement)), 201
+
+@bp.route('/reconciliation/<int:id>')
+@login_required
+def bank_statement_summary(id):
+    """Match counts and the first unmatched lines of an imported statement as JSON"""
+    statement = BankStatement.query.get_or_404(id)
+    return jsonify(ReconciliationService.summary(statement, request.args.get('limit', 100, type=int)))
+
+@bp.route('/budgets/<int:id>')
+@login_required
+def budget_detail(id):
+    """Budget-vs-actual for each line of a budget as JSON; actuals are maintained on posting"""
+    budget = BudgetService.budget(id)
+    if budget is None:
+        return jsonify({'error': 'Budget not found'}), 404
+    
+    return jsonify(budget)
@@ -0,0 +1,936 @@
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, select, insert, update, delete, func, extract, literal, and_, case, bindparam
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.pool import Pool
+from app.core.cache import TTLCache, invalidate_on_commit
+from app.core.extensions import db
+from app.core.scheduler import scheduler
+from app.core.schema import backfill
+from app.core.sequences import next_document_numbers
+from app.core.sql import increment, day_diff
+from app.finance.models import (ChartOfAccounts, JournalEntry, JournalEntryLine, AccountBalance, Invoice, Budget,
+                                BudgetLine)
+from app.models.audit_log import AuditLog
+from app.models.scheduled_job import ScheduledJobState
+from app.models.user import User
+from app.sales.models import Customer
+
+accounts = ChartOfAccounts.__table__
+journal_entries = JournalEntry.__table__
+journal_lines = JournalEntryLine.__table__
+account_balances = AccountBalance.__table__
+invoices = Invoice.__table__
+customers = Customer.__table__
+budgets = Budget.__table__
+budget_lines = BudgetLine.__table__
+audit_logs = AuditLog.__table__
+job_states = ScheduledJobState.__table__
+users = User.__table__
+
+# Account types (compared lower-cased) on each statement; liabilities, equity and revenue carry credit balances
+BALANCE_SHEET_TYPES = ('asset', 'liability', 'equity')
+INCOME_TYPES = ('revenue', 'expense')
+CREDIT_NORMAL_TYPES = ('liability', 'equity', 'revenue')
+
+account_tree_cache = TTLCache()
+
+# Bounds on bulk journal lines: amounts fit Numeric(15, 2) and account ids a 64-bit integer
+MAX_JOURNAL_AMOUNT = Decimal('9999999999999.99')
+MAX_ACCOUNT_ID = 2 ** 63 - 1
+
+# Keys under Connection.info holding budget deltas and lines to recompute for the open transaction
+_BUDGET_DELTAS_KEY = 'budget_deltas'
+_BUDGET_RECOMPUTE_KEY = 'budget_recompute'
+# Key under Session.info listing the connections its transaction has begun
+_BUDGET_CONNECTIONS_KEY = 'budget_connections'
+
+# Aging buckets as (key, first, last) days past due; open-ended at the ends
+AGING_BUCKETS = (('current', None, 0), ('1_30', 1, 30), ('31_60', 31, 60), ('61_90', 61, 90), ('90_plus', 91, None))
+
+def fiscal_period(day):
+    """Balance table period of a date: year * 100 + month"""
+    return day.year * 100 + day.month
+
+def parse_period(text):
+    """'YYYY-MM' to a period number; raises ValueError for anything else"""
+    year, month = (int(part) for part in text.split('-'))
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid period: {text}')
+    return year * 100 + month
+
+def format_period(period):
+    return f'{period // 100:04d}-{period % 100:02d}'
+
+def fiscal_year_start(period):
+    """First period of the fiscal year containing ``period``"""
+    start_month = current_app.config.get('FISCAL_YEAR_START_MONTH', 1)
+    year, month = divmod(period, 100)
+    return (year if month >= start_month else year - 1) * 100 + start_month
+
+def _money(value):
+    return float(Decimal(value or 0).quantize(Decimal('0.01')))
+
+class LedgerService:
+    """Posted journal lines rolled into account_balances; statements read only that table"""
+
+    @staticmethod
+    def add(connection, account_id, period, debit, credit, lines):
+        now = datetime.utcnow()
+        increment(connection, account_balances, {'account_id': account_id, 'period': period},
+                  {'debit_total': debit, 'credit_total': credit, 'line_count': lines},
+                  created_at=now, updated_at=now, is_deleted=False)
+
+    @staticmethod
+    def post(connection, account_id, day, debit, credit, lines):
+        """Move posted amounts into account_balances and queue the matching budget-actual delta"""
+        LedgerService.add(connection, account_id, fiscal_period(day), debit, credit, lines)
+        BudgetService.record(connection, account_id, day, debit - credit)
+
+    @staticmethod
+    def _stored_entry(connection, entry_id):
+        return connection.execute(
+            select(journal_entries.c.status, journal_entries.c.entry_date, journal_entries.c.is_deleted)
+            .where(journal_entries.c.id == entry_id)
+        ).first()
+
+    @staticmethod
+    def _move_entry_lines(connection, entry_id, day, sign):
+        rows = connection.execute(
+            select(journal_lines.c.account_id,
+                   func.coalesce(func.sum(journal_lines.c.debit_amount), 0).label('debit'),
+                   func.coalesce(func.sum(journal_lines.c.credit_amount), 0).label('credit'),
+                   func.count().label('lines'))
+            .where(journal_lines.c.journal_entry_id == entry_id, journal_lines.c.is_deleted == False)
+            .group_by(journal_lines.c.account_id)
+        ).all()
+        for row in rows:
+            LedgerService.post(connection, row.account_id, day, sign * Decimal(row.debit),
+                               sign * Decimal(row.credit), sign * row.lines)
+
+    @staticmethod
+    def apply_entry(connection, entry_id, status, entry_date, is_deleted):
+        """Add the stored lines of an entry that is posted"""
+        if status == 'posted' and not is_deleted:
+            LedgerService._move_entry_lines(connection, entry_id, entry_date, 1)
+
+    @staticmethod
+    def reverse_stored_entry(connection, entry_id):
+        """Take out the stored lines of an entry whose stored row is posted"""
+        entry = LedgerService._stored_entry(connection, entry_id)
+        if entry is not None and entry.status == 'posted' and not entry.is_deleted:
+            LedgerService._move_entry_lines(connection, entry_id, entry.entry_date, -1)
+
+    @staticmethod
+    def apply_line(connection, entry_id, account_id, debit, credit, is_deleted=False):
+        """Add one line when its (stored) entry is posted"""
+        if is_deleted:
+            return
+        entry = LedgerService._stored_entry(connection, entry_id)
+        if entry is not None and entry.status == 'posted' and not entry.is_deleted:
+            LedgerService.post(connection, account_id, entry.entry_date,
+                               Decimal(debit or 0), Decimal(credit or 0), 1)
+
+    @staticmethod
+    def reverse_stored_line(connection, line_id):
+        row = connection.execute(
+            select(journal_lines.c.account_id, journal_lines.c.debit_amount, journal_lines.c.credit_amount,
+                   journal_entries.c.entry_date)
+            .join(journal_entries, journal_entries.c.id == journal_lines.c.journal_entry_id)
+            .where(journal_lines.c.id == line_id, journal_lines.c.is_deleted == False,
+                   journal_entries.c.status == 'posted', journal_entries.c.is_deleted == False)
+        ).first()
+        if row is not None:
+            LedgerService.post(connection, row.account_id, row.entry_date,
+                               -Decimal(row.debit_amount or 0), -Decimal(row.credit_amount or 0), -1)
+
+    @staticmethod
+    def rebuild():
+        """Recreate account_balances from posted journal lines in one INSERT ... SELECT"""
+        connection = db.session.connection()
+        period = (extract('year', journal_entries.c.entry_date) * 100 +
+                  extract('month', journal_entries.c.entry_date)).label('period')
+        now = datetime.utcnow()
+        connection.execute(delete(account_balances))
+        connection.execute(account_balances.insert().from_select(
+            ['account_id', 'period', 'debit_total', 'credit_total', 'line_count',
+             'created_at', 'updated_at', 'is_deleted'],
+            select(journal_lines.c.account_id, period,
+                   func.coalesce(func.sum(journal_lines.c.debit_amount), 0),
+                   func.coalesce(func.sum(journal_lines.c.credit_amount), 0),
+                   func.count(),
+                   literal(now, db.DateTime), literal(now, db.DateTime), literal(False, db.Boolean))
+            .join(journal_entries, journal_entries.c.id == journal_lines.c.journal_entry_id)
+            .where(journal_entries.c.status == 'posted', journal_entries.c.is_deleted == False,
+                   journal_lines.c.is_deleted == False)
+            .group_by(journal_lines.c.account_id, period)))
+        db.session.commit()
+        return db.session.query(func.count(AccountBalance.id)).scalar()
+
+    @staticmethod
+    def account_totals(period_to, period_from=None, types=None):
+        """Debit and credit totals per account over a period range, from account_balances only"""
+        statement = (
+            select(accounts.c.id, accounts.c.account_code, accounts.c.account_name, accounts.c.account_type,
+                   func.sum(account_balances.c.debit_total).label('debit'),
+                   func.sum(account_balances.c.credit_total).label('credit'))
+            .join(accounts, accounts.c.id == account_balances.c.account_id)
+            .where(account_balances.c.period <= period_to)
+            .group_by(accounts.c.id, accounts.c.account_code, accounts.c.account_name, accounts.c.account_type)
+            .order_by(accounts.c.account_code)
+        )
+        if period_from is not None:
+            statement = statement.where(account_balances.c.period >= period_from)
+        if types is not None:
+            statement = statement.where(func.lower(accounts.c.account_type).in_(types))
+        return db.session.execute(statement).all()
+
+    @staticmethod
+    def _line(row):
+        """An account row with its balance signed by the side it normally carries"""
+        account_type = (row.account_type or '').lower()
+        net = Decimal(row.debit or 0) - Decimal(row.credit or 0)
+        return {
+            'account_id': row.id,
+            'account_code': row.account_code,
+            'account_name': row.account_name,
+            'account_type': account_type,
+            'balance': _money(-net if account_type in CREDIT_NORMAL_TYPES else net),
+        }, net
+
+    @staticmethod
+    def trial_balance(period_to, period_from=None):
+        """Each account's net debit or credit balance; the two columns total equal when the books balance"""
+        result, total_debit, total_credit = [], Decimal(0), Decimal(0)
+        for row in LedgerService.account_totals(period_to, period_from):
+            net = Decimal(row.debit or 0) - Decimal(row.credit or 0)
+            if not net:
+                continue
+            total_debit += max(net, 0)
+            total_credit += max(-net, 0)
+            result.append({
+                'account_id': row.id,
+                'account_code': row.account_code,
+                'account_name': row.account_name,
+                'account_type': (row.account_type or '').lower(),
+                'debit': _money(max(net, 0)),
+                'credit': _money(max(-net, 0)),
+            })
+        return {
+            'period_from': format_period(period_from) if period_from else None,
+            'period_to': format_period(period_to),
+            'accounts': result,
+            'total_debit': _money(total_debit),
+            'total_credit': _money(total_credit),
+            'balanced': total_debit == total_credit,
+        }
+
+    @staticmethod
+    def balance_sheet(period):
+        """Assets, liabilities and equity at the end of ``period``, with unclosed earnings under equity"""
+        sections = {account_type: {'accounts': [], 'total': Decimal(0)} for account_type in BALANCE_SHEET_TYPES}
+        earnings = Decimal(0)
+        for row in LedgerService.account_totals(period):
+            line, net = LedgerService._line(row)
+            if line['account_type'] in INCOME_TYPES:
+                earnings -= net
+            elif line['account_type'] in sections:
+                sections[line['account_type']]['accounts'].append(line)
+                sections[line['account_type']]['total'] += Decimal(str(line['balance']))
+        equity_total = sections['equity']['total'] + earnings
+        result = {account_type: {'accounts': section['accounts'], 'total': _money(section['total'])}
+                  for account_type, section in sections.items()}
+        result['equity']['retained_earnings'] = _money(earnings)
+        result['equity']['total'] = _money(equity_total)
+        result.update({
+            'period': format_period(period),
+            'total_liabilities_and_equity': _money(sections['liability']['total'] + equity_total),
+            'balanced': sections['asset']['total'] == sections['liability']['total'] + equity_total,
+        })
+        return result
+
+    @staticmethod
+    def profit_and_loss(period_from, period_to):
+        """Revenue, expenses and net income over a period range"""
+        sections = {account_type: {'accounts': [], 'total': Decimal(0)} for account_type in INCOME_TYPES}
+        for row in LedgerService.account_totals(period_to, period_from, types=INCOME_TYPES):
+            line, net = LedgerService._line(row)
+            sections[line['account_type']]['accounts'].append(line)
+            sections[line['account_type']]['total'] += Decimal(str(line['balance']))
+        return {
+            'period_from': format_period(period_from),
+            'period_to': format_period(period_to),
+            'revenue': {'accounts': sections['revenue']['accounts'], 'total': _money(sections['revenue']['total'])},
+            'expense': {'accounts': sections['expense']['accounts'], 'total': _money(sections['expense']['total'])},
+            'net_income': _money(sections['revenue']['total'] - sections['expense']['total']),
+        }
+
+@backfill('account_balances')
+def backfill_account_balances():
+    return LedgerService.rebuild()
+
+class JournalBatchError(ValueError):
+    """A bulk posting batch that failed validation; ``errors`` lists {'entry', 'error'} per problem"""
+
+    def __init__(self, errors):
+        super().__init__(f"{len({error['entry'] for error in errors})} journal entries are invalid")
+        self.errors = errors
+
+class JournalPostingService:
+    """Bulk journal posting: one vectorized validation pass and set-based inserts in one transaction"""
+
+    @staticmethod
+    def _cents(value):
+        """Whole cents of a line amount; raises ValueError with the reason it cannot be posted"""
+        if isinstance(value, bool):
+            raise ValueError('Line amounts must be numbers')
+        try:
+            amount = Decimal(str(value or 0))
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite():
+            raise ValueError('Line amounts must be numbers')
+        if abs(amount) > MAX_JOURNAL_AMOUNT:
+            raise ValueError(f'Line amounts must be at most {MAX_JOURNAL_AMOUNT}')
+        if amount != amount.quantize(Decimal('0.01')):
+            raise ValueError('Line amounts can have at most two decimal places')
+        return int(amount * 100)
+
+    @staticmethod
+    def _parse_line(line):
+        """(account_id, debit, credit) in cents for a line, or the reason it is malformed"""
+        if not isinstance(line, dict):
+            return 'Each line must be an object'
+        try:
+            account_id = int(line['account_id'])
+            if not 0 < account_id <= MAX_ACCOUNT_ID:
+                raise ValueError
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return 'Each line needs an account_id'
+        try:
+            return (account_id, JournalPostingService._cents(line.get('debit_amount')),
+                    JournalPostingService._cents(line.get('credit_amount')))
+        except ValueError as error:
+            return str(error)
+
+    @staticmethod
+    def _parse(entries):
+        """Flatten entries into per-line arrays; returns (dates, arrays, errors) with at most one error per entry"""
+        dates, errors = [], []
+        entry_index, account_ids, debits, credits = [], [], [], []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                dates.append(None)
+                errors.append({'entry': index, 'error': 'Each entry must be an object'})
+                continue
+            try:
+                day = entry.get('entry_date') or date.today()
+                dates.append(day if isinstance(day, date) else datetime.strptime(day, '%Y-%m-%d').date())
+            except (TypeError, ValueError):
+                dates.append(None)
+                errors.append({'entry': index, 'error': 'entry_date must be formatted as YYYY-MM-DD'})
+                continue
+            lines = entry.get('lines') or []
+            if not isinstance(lines, list):
+                errors.append({'entry': index, 'error': 'lines must be a list'})
+                continue
+            parsed = []
+            for line in lines:
+                result = JournalPostingService._parse_line(line)
+                if isinstance(result, str):
+                    errors.append({'entry': index, 'error': result})
+                    break
+                parsed.append(result)
+            else:
+                # Lines of an entry with a malformed line are left out, so the batch checks only see whole entries
+                for account_id, debit, credit in parsed:
+                    entry_index.append(index)
+                    account_ids.append(account_id)
+                    debits.append(debit)
+                    credits.append(credit)
+        arrays = (np.array(entry_index, dtype=np.int64), np.array(account_ids, dtype=np.int64),
+                  np.array(debits, dtype=np.int64), np.array(credits, dtype=np.int64))
+        return dates, arrays, errors
+
+    @staticmethod
+    def validate(connection, entries):
+        """Check every entry at once: two or more one-sided positive lines on live accounts, debits equal to credits.
+
+        Returns (dates, (entry_index, account_ids, debits, credits), per-entry debit and credit
+        totals in cents, errors).
+        """
+        dates, (entry_index, account_ids, debits, credits), errors = JournalPostingService._parse(entries)
+        count = len(entries)
+        total_debit = np.zeros(count, dtype=np.int64)
+        total_credit = np.zeros(count, dtype=np.int64)
+        np.add.at(total_debit, entry_index, debits)
+        np.add.at(total_credit, entry_index, credits)
+        line_counts = np.bincount(entry_index, minlength=count)
+
+        bad_lines = (debits < 0) | (credits < 0) | ((debits > 0) == (credits > 0))
+        known = connection.execute(
+            select(accounts.c.id).where(accounts.c.id.in_(np.unique(account_ids).tolist()),
+                                        accounts.c.is_deleted == False, accounts.c.is_active == True)
+        ).scalars().all() if account_ids.size else []
+        unknown = ~np.isin(account_ids, np.array(known, dtype=np.int64))
+
+        checks = [
+            (line_counts < 2, 'An entry needs at least two lines'),
+            (total_debit != total_credit, 'Debits and credits must be equal'),
+            (np.bincount(entry_index[bad_lines], minlength=count) > 0,
+             'Each line must have either a positive debit or a positive credit'),
+            (np.bincount(entry_index[unknown], minlength=count) > 0, 'Lines must use active accounts'),
+        ]
+        # An entry that failed to parse only reports that error
+        malformed = {error['entry'] for error in errors}
+        for failed, message in checks:
+            errors.extend({'entry': int(index), 'error': message} for index in np.flatnonzero(failed)
+                          if index not in malformed)
+        errors.sort(key=lambda error: error['entry'])
+        return dates, (entry_index, account_ids, debits, credits), (total_debit, total_credit), errors
+
+    @staticmethod
+    def post(entries, user_id=None, status='posted'):
+        """Validate and insert a batch of entries with their lines in one transaction.
+
+        Entry numbers come from one sequence reservation, entries and lines go in
+        with one executemany each, and account_balances gets one increment per
+        (account, period) of the batch. Raises JournalBatchError without writing
+        anything when any entry is invalid.
+        """
+        connection = db.session.connection()
+        dates, (entry_index, account_ids, debits, credits), (total_debit, total_credit), errors = \
+            JournalPostingService.validate(connection, entries)
+        if errors:
+            raise JournalBatchError(errors)
+        if not entries:
+            return {'entries': 0, 'lines': 0, 'entry_ids': [], 'entry_numbers': []}
+
+        now = datetime.utcnow()
+        numbers = next_document_numbers(connection, 'JE', len(entries), seed_column=journal_entries.c.entry_number)
+        ids = connection.execute(
+            insert(journal_entries).returning(journal_entries.c.id, sort_by_parameter_order=True),
+            [{
+                'entry_number': numbers[index], 'entry_date': dates[index], 'reference': entry.get('reference'),
+                'description': entry.get('description'), 'total_debit': Decimal(int(total_debit[index])) / 100,
+                'total_credit': Decimal(int(total_credit[index])) / 100, 'status': status,
+                'created_by_id': user_id, 'created_at': now, 'updated_at': now, 'is_deleted': False,
+            } for index, entry in enumerate(entries)]
+        ).scalars().all()
+
+        descriptions = [line.get('description') for entry in entries for line in entry.get('lines') or ()]
+        connection.execute(insert(journal_lines), [{
+            'journal_entry_id': ids[index], 'account_id': account_id, 'description': description,
+            'debit_amount': Decimal(debit) / 100, 'credit_amount': Decimal(credit) / 100,
+            'created_at': now, 'updated_at': now, 'is_deleted': False,
+        } for index, account_id, debit, credit, description in zip(
+            entry_index.tolist(), account_ids.tolist(), debits.tolist(), credits.tolist(), descriptions)])
+
+        if status == 'posted':
+            periods = np.array([fiscal_period(day) for day in dates], dtype=np.int64)[entry_index]
+            keys, inverse = np.unique(np.column_stack([account_ids, periods]), axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            sums = np.zeros((len(keys), 3), dtype=np.int64)
+            np.add.at(sums, inverse, np.column_stack([debits, credits, np.ones_like(debits)]))
+            for (account_id, period), (debit, credit, lines) in zip(keys.tolist(), sums.tolist()):
+                LedgerService.add(connection, account_id, period, Decimal(debit) / 100, Decimal(credit) / 100, lines)
+            ordinals = np.array([day.toordinal() for day in dates], dtype=np.int64)[entry_index]
+            keys, inverse = np.unique(np.column_stack([account_ids, ordinals]), axis=0, return_inverse=True)
+            nets = np.zeros(len(keys), dtype=np.int64)
+            np.add.at(nets, inverse.ravel(), debits - credits)
+            for (account_id, ordinal), net in zip(keys.tolist(), nets.tolist()):
+                BudgetService.record(connection, account_id, date.fromordinal(ordinal), Decimal(net) / 100)
+
+        from app.reports.jobs import ReportJobService
+        ReportJobService.invalidate(connection, {journal_entries.name, journal_lines.name, account_balances.name})
+        db.session.commit()
+        return {'entries': len(ids), 'lines': int(entry_index.size), 'entry_ids': ids, 'entry_numbers': numbers}
+
+class AccountTreeService:
+    """Chart of accounts as a materialized-path tree: maintenance, subtree rollups and the cached tree"""
+
+    @staticmethod
+    def _parent_path(connection, parent_id):
+        """Path and depth of ``parent_id``, derived from its ancestors when it has no stored path yet"""
+        if not parent_id:
+            return '/', -1
+        chain = []
+        while parent_id:
+            row = connection.execute(
+                select(accounts.c.path, accounts.c.depth, accounts.c.parent_account_id)
+                .where(accounts.c.id == parent_id)).first()
+            if row is None or parent_id in chain:
+                raise ValueError('Parent account does not exist')
+            if row.path:
+                path, depth = row.path, row.depth
+                break
+            # Accounts created before paths were stored are placed by walking up their parent links
+            chain.append(parent_id)
+            parent_id = row.parent_account_id
+        else:
+            path, depth = '/', -1
+        for account_id in reversed(chain):
+            path, depth = f'{path}{account_id}/', depth + 1
+        return path, depth
+
+    @staticmethod
+    def insert_node(connection, target):
+        parent_path, parent_depth = AccountTreeService._parent_path(connection, target.parent_account_id)
+        path, depth = f'{parent_path}{target.id}/', parent_depth + 1
+        connection.execute(update(accounts).where(accounts.c.id == target.id).values(path=path, depth=depth))
+        set_committed_value(target, 'path', path)
+        set_committed_value(target, 'depth', depth)
+
+    @staticmethod
+    def check_move(connection, account_id, new_parent_id):
+        """Refuse to move an account under itself or one of its own sub-accounts"""
+        if new_parent_id:
+            parent_path, _ = AccountTreeService._parent_path(connection, new_parent_id)
+            if f'/{account_id}/' in parent_path:
+                raise ValueError('An account cannot be moved under itself or one of its sub-accounts')
+
+    @staticmethod
+    def move_node(connection, target):
+        """Re-root the account's subtree below its new parent with one UPDATE"""
+        old = connection.execute(
+            select(accounts.c.path, accounts.c.depth).where(accounts.c.id == target.id)).first()
+        parent_path, parent_depth = AccountTreeService._parent_path(connection, target.parent_account_id)
+        path, depth = f'{parent_path}{target.id}/', parent_depth + 1
+        connection.execute(
+            update(accounts).where(accounts.c.path.like(old.path + '%'))
+            .values(path=literal(path) + func.substr(accounts.c.path, len(old.path) + 1),
+                    depth=accounts.c.depth + (depth - old.depth)))
+        set_committed_value(target, 'path', path)
+        set_committed_value(target, 'depth', depth)
+
+    @staticmethod
+    def rebuild():
+        """Recompute every path from parent_account_id, one level of the tree at a time"""
+        rows = db.session.execute(select(accounts.c.id, accounts.c.parent_account_id)).all()
+        children = {}
+        for row in rows:
+            children.setdefault(row.parent_account_id, []).append(row.id)
+        values, level = [], [(account_id, '/', 0) for account_id in children.get(None, [])]
+        while level:
+            values.extend({'account_id': account_id, 'new_path': f'{parent_path}{account_id}/', 'new_depth': depth}
+                          for account_id, parent_path, depth in level)
+            level = [(child_id, f'{parent_path}{account_id}/', depth + 1)
+                     for account_id, parent_path, depth in level for child_id in children.get(account_id, [])]
+        if values:
+            db.session.execute(
+                update(accounts).where(accounts.c.id == bindparam('account_id'))
+                .values(path=bindparam('new_path'), depth=bindparam('new_depth'))
+                .execution_options(synchronize_session=False), values)
+        db.session.commit()
+        account_tree_cache.invalidate('tree')
+        return len(values)
+
+    @staticmethod
+    def rollups(period_to, period_from=None, account_id=None):
+        """Debit and credit totals of each account's whole subtree (or of ``account_id``'s) in one statement"""
+        root, node = aliased(ChartOfAccounts), aliased(ChartOfAccounts)
+        periods = [account_balances.c.account_id == node.id, account_balances.c.period <= period_to]
+        if period_from is not None:
+            periods.append(account_balances.c.period >= period_from)
+        statement = (
+            select(root.id, root.account_type,
+                   func.coalesce(func.sum(account_balances.c.debit_total), 0).label('debit'),
+                   func.coalesce(func.sum(account_balances.c.credit_total), 0).label('credit'))
+            .join(node, node.path.like(root.path + '%'))
+            .outerjoin(account_balances, and_(*periods))
+            .group_by(root.id, root.account_type)
+        )
+        if account_id is not None:
+            statement = statement.where(root.id == account_id)
+        result = {}
+        for row in db.session.execute(statement):
+            debit, credit = Decimal(row.debit), Decimal(row.credit)
+            net = credit - debit if (row.account_type or '').lower() in CREDIT_NORMAL_TYPES else debit - credit
+            result[row.id] = {'debit': _money(debit), 'credit': _money(credit), 'balance': _money(net)}
+        return result
+
+    @staticmethod
+    def tree():
+        """Live accounts as {'roots': [...], 'accounts': {id: node}}, cached per process until the chart changes"""
+        ttl = current_app.config.get('ACCOUNT_TREE_CACHE_TTL', 300)
+        return account_tree_cache.get_or_set('tree', AccountTreeService._build, ttl)
+
+    @staticmethod
+    def _build():
+        rows = db.session.execute(
+            select(accounts.c.id, accounts.c.parent_account_id, accounts.c.account_code, accounts.c.account_name,
+                   accounts.c.account_type, accounts.c.is_active, accounts.c.path, accounts.c.depth)
+            .where(accounts.c.is_deleted == False)
+            .order_by(accounts.c.account_code)
+        ).all()
+        nodes = {row.id: {
+            'id': row.id,
+            'account_code': row.account_code,
+            'account_name': row.account_name,
+            'account_type': row.account_type,
+            'is_active': row.is_active,
+            'path': row.path,
+            'depth': row.depth,
+            'children': [],
+        } for row in rows}
+        roots = []
+        for row in rows:
+            parent = nodes.get(row.parent_account_id)
+            (parent['children'] if parent else roots).append(nodes[row.id])
+        return {'roots': roots, 'accounts': nodes}
+
+    @staticmethod
+    def full_name(account):
+        nodes = AccountTreeService.tree()['accounts']
+        names = [nodes[ancestor_id]['account_name'] for ancestor_id in account.ancestor_ids[:-1]
+                 if ancestor_id in nodes]
+        return ' - '.join(names + [account.account_name])
+
+# Drop the cached account tree once a transaction touching the chart of accounts commits
+invalidate_on_commit('account_tree', ChartOfAccounts, lambda: account_tree_cache.invalidate('tree'))
+
+@backfill('chart_of_accounts')
+def backfill_account_paths():
+    return AccountTreeService.rebuild()
+
+class OverdueInvoiceService:
+    """Flip sent invoices past their due date to overdue in bulk, with audit rows and notifications"""
+
+    JOB_NAME = 'overdue_invoice_sweep'
+
+    @staticmethod
+    def _audit_user(connection):
+        """The user audit rows are recorded under: OVERDUE_SWEEP_USER_ID, else the first active admin"""
+        user_id = current_app.config.get('OVERDUE_SWEEP_USER_ID')
+        if user_id:
+            return user_id
+        return connection.execute(
+            select(users.c.id).where(users.c.role == 'admin', users.c.is_active == True, users.c.is_deleted == False)
+            .order_by(users.c.id).limit(1)
+        ).scalar()
+
+    @staticmethod
+    def sweep(today=None):
+        """Mark every sent invoice whose due date has passed as overdue.
+
+        The run flips them with one UPDATE (found through the status and due date
+        index, so only invoices that fell due since they were sent are read),
+        refreshes their search documents, writes audit rows and notifications in
+        executemany batches and records the run day as the watermark, all in one
+        transaction. Returns the number of invoices marked overdue.
+        """
+        from app.main.search import SearchService
+        from app.main.services import DashboardService, NotificationService
+        from app.reports.jobs import ReportJobService
+
+        today = today or date.today()
+        batch_size = current_app.config.get('OVERDUE_SWEEP_BATCH_SIZE', 1000)
+        connection = db.session.connection()
+        # No lower bound on due_date: an invoice sent after its due date has to be caught as well
+        conditions = [Invoice.overdue_on(today), invoices.c.status == 'sent', invoices.c.is_deleted == False]
+
+        now = datetime.utcnow()
+        statement = update(invoices).where(*conditions).values(status='overdue', updated_at=now)
+        if connection.dialect.update_returning:
+            invoice_ids = connection.execute(statement.returning(invoices.c.id)).scalars().all()
+        else:
+            invoice_ids = connection.execute(select(invoices.c.id).where(*conditions)).scalars().all()
+            for start in range(0, len(invoice_ids), batch_size):
+                connection.execute(statement.where(invoices.c.id.in_(invoice_ids[start:start + batch_size])))
+
+        # The bulk UPDATE skips the mapper events that keep search documents current
+        SearchService.reindex(connection, 'invoice', invoice_ids, batch_size)
+
+        user_id = OverdueInvoiceService._audit_user(connection)
+        if invoice_ids and user_id:
+            rows = [{
+                'user_id': user_id, 'action': 'update', 'table_name': invoices.name, 'record_id': invoice_id,
+                'old_values': '{"status": "sent"}', 'new_values': '{"status": "overdue"}',
+                'created_at': now, 'updated_at': now, 'is_deleted': False,
+            } for invoice_id in invoice_ids]
+            for start in range(0, len(rows), batch_size):
+                connection.execute(insert(audit_logs), rows[start:start + batch_size])
+        for start in range(0, len(invoice_ids), batch_size):
+            NotificationService.notify_overdue_invoices(connection, today, invoice_ids[start:start + batch_size],
+                                                        batch_size)
+
+        connection.execute(
+            update(job_states).where(job_states.c.name == OverdueInvoiceService.JOB_NAME)
+            .values(watermark=today, last_count=len(invoice_ids), updated_at=now))
+        if invoice_ids:
+            ReportJobService.invalidate(connection, {invoices.name})
+        db.session.commit()
+        if invoice_ids:
+            DashboardService.invalidate({invoices.name})
+        return len(invoice_ids)
+
+@scheduler.job(OverdueInvoiceService.JOB_NAME, 'OVERDUE_SWEEP_INTERVAL')
+def sweep_overdue_invoices():
+    return OverdueInvoiceService.sweep()
+
+class ReceivablesService:
+    """Accounts-receivable aging computed in the database from open invoice balances"""
+
+    @staticmethod
+    def _open(as_of, customer_id=None):
+        conditions = [Invoice.is_open, invoices.c.is_deleted == False, invoices.c.issue_date <= as_of]
+        if customer_id is not None:
+            conditions.append(invoices.c.customer_id == customer_id)
+        return conditions
+
+    @staticmethod
+    def _bucket_columns(as_of):
+        """One SUM(CASE) per bucket, comparing due_date with fixed cut-off dates so no per-row date math runs"""
+        columns = []
+        for key, first, last in AGING_BUCKETS:
+            conditions = []
+            if first is not None:
+                conditions.append(invoices.c.due_date <= as_of - timedelta(days=first))
+            if last is not None:
+                conditions.append(invoices.c.due_date >= as_of - timedelta(days=last))
+            columns.append(func.coalesce(func.sum(case((and_(*conditions), invoices.c.balance_due), else_=0)),
+                                         0).label(f'bucket_{key}'))
+        return columns
+
+    @staticmethod
+    def aging(as_of=None, customer_id=None):
+        """Open balances per customer split into aging buckets, in one grouped query"""
+        as_of = as_of or date.today()
+        totals = (
+            select(invoices.c.customer_id, func.count(invoices.c.id).label('invoice_count'),
+                   func.sum(invoices.c.balance_due).label('total'), *ReceivablesService._bucket_columns(as_of))
+            .where(*ReceivablesService._open(as_of, customer_id))
+            .group_by(invoices.c.customer_id)
+            .subquery()
+        )
+        rows = db.session.execute(
+            select(totals, customers.c.company_name, customers.c.customer_code)
+            .join(customers, customers.c.id == totals.c.customer_id)
+            .order_by(totals.c.total.desc())
+        ).all()
+        keys = [key for key, first, last in AGING_BUCKETS]
+        grand = dict.fromkeys(keys + ['total'], Decimal(0))
+        result = []
+        for row in rows:
+            buckets = {key: Decimal(row._mapping[f'bucket_{key}'] or 0) for key in keys}
+            for key, value in buckets.items():
+                grand[key] += value
+            grand['total'] += Decimal(row.total or 0)
+            result.append(dict({key: _money(value) for key, value in buckets.items()},
+                               customer_id=row.customer_id, company_name=row.company_name,
+                               customer_code=row.customer_code, invoice_count=row.invoice_count,
+                               total=_money(row.total)))
+        return {
+            'as_of': as_of.isoformat(),
+            'buckets': keys,
+            'customers': result,
+            'totals': {key: _money(value) for key, value in grand.items()},
+        }
+
+    @staticmethod
+    def open_invoices(customer_id, as_of=None):
+        """A customer's open invoices with days past due as of ``as_of``, oldest due first"""
+        as_of = as_of or date.today()
+        days = day_diff(invoices.c.due_date, literal(as_of))
+        rows = db.session.execute(
+            select(invoices.c.id, invoices.c.invoice_number, invoices.c.issue_date, invoices.c.due_date,
+                   invoices.c.status, invoices.c.total_amount, invoices.c.balance_due,
+                   case((days > 0, days), else_=0).label('days_overdue'))
+            .where(*ReceivablesService._open(as_of, customer_id))
+            .order_by(invoices.c.due_date, invoices.c.id)
+        ).all()
+        return [{
+            'id': row.id,
+            'invoice_number': row.invoice_number,
+            'issue_date': row.issue_date.isoformat(),
+            'due_date': row.due_date.isoformat(),
+            'status': row.status,
+            'total_amount': _money(row.total_amount),
+            'balance_due': _money(row.balance_due),
+            'days_overdue': row.days_overdue,
+        } for row in rows]
+
+class BudgetService:
+    """Budget-vs-actual kept incrementally: postings queue (account, day) deltas that are applied
+    to the matching budget lines once per transaction, just before it commits.
+
+    Posted journal lines are the only source of actuals. Expenses carry no link to the entry that
+    books them, so counting approved expenses as well would add every journalled expense twice.
+    """
+
+    @staticmethod
+    def record(connection, account_id, day, amount):
+        """Queue a debit-minus-credit ``amount`` posted to an account on ``day``"""
+        if not amount or not account_id or day is None:
+            return
+        deltas = connection.info.setdefault(_BUDGET_DELTAS_KEY, {})
+        deltas[(account_id, day)] = deltas.get((account_id, day), 0) + Decimal(amount)
+
+    @staticmethod
+    def mark(connection, line_ids):
+        """Queue budget lines whose actuals must be recomputed (new lines, moved accounts or date ranges)"""
+        connection.info.setdefault(_BUDGET_RECOMPUTE_KEY, set()).update(line_ids)
+
+    @staticmethod
+    def pending(connection):
+        """Whether the connection's transaction has queued deltas or recomputes"""
+        return _BUDGET_DELTAS_KEY in connection.info or _BUDGET_RECOMPUTE_KEY in connection.info
+
+    @staticmethod
+    def discard(info):
+        """Drop queued deltas and recomputes from a connection's info"""
+        info.pop(_BUDGET_DELTAS_KEY, None)
+        info.pop(_BUDGET_RECOMPUTE_KEY, None)
+
+    @staticmethod
+    def flush(connection):
+        """Apply the transaction's queued deltas and recomputes; called before commit"""
+        deltas = connection.info.pop(_BUDGET_DELTAS_KEY, None)
+        recompute = connection.info.pop(_BUDGET_RECOMPUTE_KEY, None)
+        if deltas:
+            BudgetService.apply(connection, deltas, exclude=recompute or ())
+        if recompute:
+            BudgetService.recompute(connection, recompute)
+
+    @staticmethod
+    def apply(connection, deltas, exclude=()):
+        """Add {(account, day): amount} deltas to every budget line whose budget covers the day,
+        reading the affected lines in one query and updating them with one executemany"""
+        by_account = {}
+        for (account_id, day), amount in deltas.items():
+            if amount:
+                by_account.setdefault(account_id, []).append((day, amount))
+        if not by_account:
+            return 0
+        days = [day for (account_id, day) in deltas]
+        rows = connection.execute(
+            select(budget_lines.c.id, budget_lines.c.account_id, budgets.c.start_date, budgets.c.end_date,
+                   accounts.c.account_type)
+            .join(budgets, budgets.c.id == budget_lines.c.budget_id)
+            .join(accounts, accounts.c.id == budget_lines.c.account_id)
+            .where(budget_lines.c.account_id.in_(list(by_account)), budget_lines.c.is_deleted == False,
+                   budgets.c.start_date <= max(days), budgets.c.end_date >= min(days))
+        ).all()
+        params = []
+        for row in rows:
+            if row.id in exclude:
+                continue
+            delta = sum((amount for day, amount in by_account[row.account_id]
+                         if row.start_date <= day <= row.end_date), Decimal(0))
+            if delta:
+                sign = -1 if (row.account_type or '').lower() in CREDIT_NORMAL_TYPES else 1
+                params.append({'line_id': row.id, 'delta': sign * delta})
+        if params:
+            connection.execute(
+                update(budget_lines).where(budget_lines.c.id == bindparam('line_id'))
+                .values(actual_amount=func.coalesce(budget_lines.c.actual_amount, 0) + bindparam('delta'),
+                        variance=func.coalesce(budget_lines.c.variance, 0) + bindparam('delta'),
+                        updated_at=datetime.utcnow()), params)
+        return len(params)
+
+    @staticmethod
+    def recompute(connection, line_ids=None):
+        """Set actual_amount and variance of budget lines (all when ``line_ids`` is None) from the ledger"""
+        in_budget = (budgets.c.id == budget_lines.c.budget_id)
+        posted = (
+            select(func.coalesce(func.sum(journal_lines.c.debit_amount - journal_lines.c.credit_amount), 0))
+            .select_from(journal_lines.join(journal_entries, journal_entries.c.id == journal_lines.c.journal_entry_id))
+            .join(budgets, in_budget)
+            .where(journal_lines.c.account_id == budget_lines.c.account_id, journal_lines.c.is_deleted == False,
+                   journal_entries.c.status == 'posted', journal_entries.c.is_deleted == False,
+                   journal_entries.c.entry_date >= budgets.c.start_date,
+                   journal_entries.c.entry_date <= budgets.c.end_date)
+            .scalar_subquery()
+        )
+        account_type = select(func.lower(accounts.c.account_type)).where(
+            accounts.c.id == budget_lines.c.account_id).scalar_subquery()
+        sign = case((account_type.in_(CREDIT_NORMAL_TYPES), -1), else_=1)
+        conditions = [] if line_ids is None else [budget_lines.c.id.in_(list(line_ids))]
+        now = datetime.utcnow()
+        connection.execute(update(budget_lines).where(*conditions)
+                           .values(actual_amount=sign * posted, updated_at=now))
+        return connection.execute(
+            update(budget_lines).where(*conditions)
+            .values(variance=budget_lines.c.actual_amount - budget_lines.c.budgeted_amount)).rowcount
+
+    @staticmethod
+    def rebuild():
+        """Recompute every budget line's actuals from posted journal lines"""
+        count = BudgetService.recompute(db.session.connection())
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def budget(budget_id):
+        """A budget and its lines as stored: no ledger aggregation happens on read"""
+        budget = db.session.get(Budget, budget_id)
+        if budget is None or budget.is_deleted:
+            return None
+        rows = db.session.execute(
+            select(budget_lines.c.id, budget_lines.c.account_id, accounts.c.account_code, accounts.c.account_name,
+                   budget_lines.c.budgeted_amount, budget_lines.c.actual_amount, budget_lines.c.variance)
+            .join(accounts, accounts.c.id == budget_lines.c.account_id)
+            .where(budget_lines.c.budget_id == budget_id, budget_lines.c.is_deleted == False)
+            .order_by(accounts.c.account_code)
+        ).all()
+        lines = [{
+            'id': row.id,
+            'account_id': row.account_id,
+            'account_code': row.account_code,
+            'account_name': row.account_name,
+            'budgeted_amount': _money(row.budgeted_amount),
+            'actual_amount': _money(row.actual_amount),
+            'variance': _money(row.variance),
+            'variance_percentage': round(float(row.variance or 0) / float(row.budgeted_amount) * 100, 2)
+            if row.budgeted_amount else 0,
+        } for row in rows]
+        return {
+            'id': budget.id,
+            'name': budget.name,
+            'fiscal_year': budget.fiscal_year,
+            'start_date': budget.start_date.isoformat(),
+            'end_date': budget.end_date.isoformat(),
+            'status': budget.status,
+            'total_budget': _money(budget.total_budget),
+            'lines': lines,
+            'total_budgeted': _money(sum(Decimal(str(line['budgeted_amount'])) for line in lines)),
+            'total_actual': _money(sum(Decimal(str(line['actual_amount'])) for line in lines)),
+        }
+
+@event.listens_for(Session, 'after_begin')
+def track_budget_connection(session, transaction, connection):
+    session.info.setdefault(_BUDGET_CONNECTIONS_KEY, []).append(connection)
+
+# Fold the transaction's queued budget deltas in after its last flush, just before it commits.
+# Only connections the transaction already holds are checked, so read-only commits open none.
+@event.listens_for(Session, 'before_commit')
+def apply_budget_deltas(session):
+    if not session.in_transaction():
+        return
+    session.flush()
+    for connection in session.info.get(_BUDGET_CONNECTIONS_KEY, ()):
+        if BudgetService.pending(connection):
+            BudgetService.flush(connection)
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def forget_budget_connections(session):
+    session.info.pop(_BUDGET_CONNECTIONS_KEY, None)
+
+# Deltas are only applied through the Session; a commit made on the Connection or Engine directly,
+# a rollback, or a connection going back to the pool drops them so they cannot leak into the
+# next transaction that checks the connection out
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def discard_budget_deltas(conn):
+    BudgetService.discard(conn.info)
+
+@event.listens_for(Pool, 'reset')
+@event.listens_for(Pool, 'checkin')
+def discard_budget_deltas_on_checkin(dbapi_connection, connection_record, *args):
+    if connection_record is not None:
+        BudgetService.discard(connection_record.info)
@@ -1,5 +1,6 @@
 from app.core.extensions import db
 from app.models.base import BaseModel
+from app.core.sequences import next_document_number
 from datetime import datetime, date
 from decimal import Decimal
 from sqlalchemy import event
@@ -355,11 +356,7 @@ def generate_position_code(mapper, connection, target):
 @event.listens_for(Employee, 'before_insert')
 def generate_employee_id(mapper, connection, target):
     if not target.employee_id:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(employee_id, 4) AS INTEGER)) FROM employees WHERE employee_id LIKE 'EMP%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.employee_id = f"EMP{next_num:06d}"
+        target.employee_id = next_document_number(connection, 'EMP', Employee.__table__.c.employee_id)
 
 @event.listens_for(LeaveType, 'before_insert')
 def generate_leave_type_code(mapper, connection, target):
@@ -4,4 +4,5 @@ bp = Blueprint('inventory', __name__)
 
 # Import models to register them with SQLAlchemy
 from app.inventory import models
-from app.inventory import routes
\ No newline at end of file
+from app.inventory import routes
+from app.inventory import commands
\ No newline at end of file
@@ -0,0 +1,9 @@
+import click
+from app.inventory import bp
+from app.inventory.services import StockLevelService
+
+@bp.cli.command('rebuild-stock-levels')
+def rebuild_stock_levels():
+    """Rebuild stock_levels and the category rollup from stock movements."""
+    count = StockLevelService.rebuild()
+    click.echo(f"Rebuilt {count} stock levels")
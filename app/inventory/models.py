@@ -1,8 +1,9 @@
 from app.core.extensions import db
 from app.models.base import BaseModel
+from app.core.sequences import next_document_number
 from datetime import datetime
 from decimal import Decimal
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 
 class ProductCategory(BaseModel):
     __tablename__ = 'product_categories'
@@ -177,9 +178,67 @@ class StockMovement(BaseModel):
             return abs(self.quantity) * self.unit_cost
         return 0
 
+    @property
+    def stock_delta(self):
+        """Signed change this movement makes to on-hand stock"""
+        if self.is_deleted:
+            return 0
+        return stock_delta(self.movement_type, self.quantity)
+
     def __repr__(self):
         return f'<StockMovement {self.movement_type}: {self.quantity} of Product {self.product_id}>'
 
+def stock_delta(movement_type, quantity):
+    """Signed stock change for a movement: in/out use the absolute quantity,
+    transfers and adjustments carry their own sign"""
+    quantity = quantity or 0
+    if movement_type == 'in':
+        return abs(quantity)
+    if movement_type == 'out':
+        return -abs(quantity)
+    return quantity
+
+class StockLevel(BaseModel):
+    """On-hand quantity and value per product and warehouse, maintained from stock movements"""
+    __tablename__ = 'stock_levels'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'warehouse_id', name='uq_stock_levels_product_warehouse'),
+    )
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouses.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+
+    product = db.relationship('Product', backref='stock_levels')
+    warehouse = db.relationship('Warehouse', backref='stock_levels')
+
+    @property
+    def average_cost(self):
+        """Weighted average unit cost of the stock on hand"""
+        if self.quantity:
+            return self.total_value / self.quantity
+        return 0
+
+    def __repr__(self):
+        return f'<StockLevel Product:{self.product_id} Warehouse:{self.warehouse_id}: {self.quantity}>'
+
+class StockCategoryLevel(BaseModel):
+    """Stock rolled up per product category and warehouse"""
+    __tablename__ = 'stock_category_levels'
+    __table_args__ = (
+        db.UniqueConstraint('category_id', 'warehouse_id', name='uq_stock_category_levels_key'),
+    )
+
+    category_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = uncategorized
+    warehouse_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    stocked_items = db.Column(db.Integer, nullable=False, default=0)  # products with quantity > 0
+
+    def __repr__(self):
+        return f'<StockCategoryLevel Category:{self.category_id} Warehouse:{self.warehouse_id}>'
+
 class StockAdjustment(BaseModel):
     __tablename__ = 'stock_adjustments'
     
@@ -233,17 +292,45 @@ def generate_category_code(mapper, connection, target):
 @event.listens_for(Warehouse, 'before_insert')
 def generate_warehouse_code(mapper, connection, target):
     if not target.code:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(code, 3) AS INTEGER)) FROM warehouses WHERE code LIKE 'WH%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.code = f"WH{next_num:03d}"
+        target.code = next_document_number(connection, 'WH', Warehouse.__table__.c.code, width=3)
 
 @event.listens_for(StockAdjustment, 'before_insert')
 def generate_adjustment_number(mapper, connection, target):
     if not target.adjustment_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(adjustment_number, 4) AS INTEGER)) FROM stock_adjustments WHERE adjustment_number LIKE 'ADJ%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.adjustment_number = f"ADJ{next_num:06d}"
\ No newline at end of file
+        target.adjustment_number = next_document_number(connection, 'ADJ', StockAdjustment.__table__.c.adjustment_number)
+
+# Keep stock_levels in step with movements
+@event.listens_for(StockMovement, 'before_insert')
+def assign_movement_cost(mapper, connection, target):
+    if target.unit_cost is None:
+        from app.inventory.services import StockLevelService
+        target.unit_cost = StockLevelService.unit_cost(connection, target.product_id, target.warehouse_id,
+                                                       target.stock_delta)
+
+@event.listens_for(StockMovement, 'after_insert')
+def apply_stock_movement(mapper, connection, target):
+    from app.inventory.services import StockLevelService
+    StockLevelService.apply(connection, target.product_id, target.warehouse_id,
+                            target.stock_delta, target.unit_cost)
+    if target.stock_delta < 0:
+        from app.main.services import NotificationService
+        NotificationService.notify_low_stock(connection, target.product_id, target.stock_delta)
+
+@event.listens_for(StockMovement, 'before_update')
+def reapply_stock_movement(mapper, connection, target):
+    from app.inventory.services import StockLevelService
+    StockLevelService.reverse_stored(connection, target.id)
+    StockLevelService.apply(connection, target.product_id, target.warehouse_id,
+                            target.stock_delta, target.unit_cost)
+
+@event.listens_for(StockMovement, 'before_delete')
+def reverse_stock_movement(mapper, connection, target):
+    from app.inventory.services import StockLevelService
+    StockLevelService.reverse_stored(connection, target.id)
+
+@event.listens_for(Product, 'before_update')
+def move_product_category_stock(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.category_id.history.has_changes() or state.attrs.category.history.has_changes():
+        from app.inventory.services import StockLevelService
+        StockLevelService.move_category(connection, target.id, target.category_id)
\ No newline at end of file
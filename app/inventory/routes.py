@@ -1,10 +1,37 @@
 from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from app.inventory import bp
+from app.inventory.models import Product, ProductCategory, Warehouse, StockMovement
+from app.core.export import export_response, stream_query
 
 @bp.route('/products')
 @login_required
 def products():
+    category_filter = request.args.get('category_id', type=int)
+    status_filter = request.args.get('status', '')
+    search = request.args.get('search', '')
+    
+    query = Product.query.filter_by(is_deleted=False)
+    if category_filter:
+        query = query.filter(Product.category_id == category_filter)
+    if status_filter:
+        query = query.filter(Product.status == status_filter)
+    if search:
+        query = query.filter(Product.name.contains(search) | Product.sku.contains(search))
+    
+    export = export_response(
+        request.args.get('export'), 'products',
+        ['SKU', 'Name', 'Barcode', 'Category', 'Type', 'Cost Price', 'Selling Price',
+         'Current Stock', 'Available Stock', 'Min Stock', 'Status'],
+        stream_query(
+            query.outerjoin(ProductCategory, ProductCategory.id == Product.category_id)
+            .with_entities(Product.sku, Product.name, Product.barcode, ProductCategory.name, Product.product_type,
+                           Product.cost_price, Product.selling_price, Product.current_stock,
+                           Product.available_stock, Product.min_stock_level, Product.status)
+            .order_by(Product.name, Product.id)))
+    if export:
+        return export
+    
     return render_template('inventory/products.html')
 
 @bp.route('/products/add', methods=['GET', 'POST'])
@@ -98,6 +125,31 @@ def stock_adjustment():
 @bp.route('/stock/movements')
 @login_required
 def stock_movements():
+    product_filter = request.args.get('product_id', type=int)
+    warehouse_filter = request.args.get('warehouse_id', type=int)
+    type_filter = request.args.get('movement_type', '')
+    
+    query = StockMovement.query.filter_by(is_deleted=False)
+    if product_filter:
+        query = query.filter(StockMovement.product_id == product_filter)
+    if warehouse_filter:
+        query = query.filter(StockMovement.warehouse_id == warehouse_filter)
+    if type_filter:
+        query = query.filter(StockMovement.movement_type == type_filter)
+    
+    export = export_response(
+        request.args.get('export'), 'stock_movements',
+        ['Date', 'SKU', 'Product', 'Warehouse', 'Type', 'Quantity', 'Unit Cost', 'Reference Type', 'Reference'],
+        stream_query(
+            query.join(Product, Product.id == StockMovement.product_id)
+            .join(Warehouse, Warehouse.id == StockMovement.warehouse_id)
+            .with_entities(StockMovement.movement_date, Product.sku, Product.name, Warehouse.name,
+                           StockMovement.movement_type, StockMovement.quantity, StockMovement.unit_cost,
+                           StockMovement.reference_type, StockMovement.reference_id)
+            .order_by(StockMovement.movement_date.desc(), StockMovement.id)))
+    if export:
+        return export
+    
     movements = []   # TODO: Get from database
     products = []    # TODO: Get from database
     warehouses = []  # TODO: Get from database
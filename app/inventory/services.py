@@ -0,0 +1,303 @@
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import select, update, delete, func, case, literal
+from app.core.extensions import db
+from app.core.schema import backfill
+from app.core.sql import increment
+from app.reports.jobs import ReportJobService
+from app.inventory.models import (
+    Product, ProductCategory, Warehouse, StockMovement, StockLevel, StockCategoryLevel, stock_delta
+)
+
+products = Product.__table__
+movements = StockMovement.__table__
+stock_levels = StockLevel.__table__
+category_levels = StockCategoryLevel.__table__
+
+class StockLevelService:
+    @staticmethod
+    def unit_cost(connection, product_id, warehouse_id, delta):
+        """Cost basis for a movement without one: average cost for issues, product cost otherwise"""
+        if delta < 0:
+            level = connection.execute(
+                select(stock_levels.c.quantity, stock_levels.c.total_value).where(
+                    stock_levels.c.product_id == product_id, stock_levels.c.warehouse_id == warehouse_id)
+            ).first()
+            if level and level.quantity > 0:
+                return (Decimal(level.total_value) / level.quantity).quantize(Decimal('0.01'))
+        return connection.execute(select(products.c.cost_price).where(products.c.id == product_id)).scalar()
+
+    @staticmethod
+    def apply(connection, product_id, warehouse_id, delta, unit_cost):
+        """Apply a signed quantity change to stock_levels, the category rollup and the product"""
+        if not delta:
+            return
+        value = Decimal(delta) * Decimal(unit_cost or 0)
+
+        increment(connection, stock_levels,
+                  {'product_id': product_id, 'warehouse_id': warehouse_id},
+                  {'quantity': delta, 'total_value': value})
+        quantity = connection.execute(
+            select(stock_levels.c.quantity).where(
+                stock_levels.c.product_id == product_id, stock_levels.c.warehouse_id == warehouse_id)
+        ).scalar()
+        stocked = int(quantity > 0) - int(quantity - delta > 0)
+
+        category_id = connection.execute(
+            select(products.c.category_id).where(products.c.id == product_id)).scalar()
+        increment(connection, category_levels,
+                  {'category_id': category_id or 0, 'warehouse_id': warehouse_id},
+                  {'quantity': delta, 'total_value': value, 'stocked_items': stocked})
+
+        current = func.coalesce(products.c.current_stock, 0) + delta
+        available = current - func.coalesce(products.c.reserved_stock, 0)
+        connection.execute(
+            update(products).where(products.c.id == product_id).values(
+                current_stock=current,
+                available_stock=case((available > 0, available), else_=0))
+        )
+
+    @staticmethod
+    def reverse_stored(connection, movement_id):
+        """Undo the effect of a movement as it is currently stored"""
+        row = connection.execute(select(movements).where(movements.c.id == movement_id)).first()
+        if row and not row.is_deleted:
+            StockLevelService.apply(connection, row.product_id, row.warehouse_id,
+                                    -stock_delta(row.movement_type, row.quantity), row.unit_cost)
+
+    @staticmethod
+    def move_category(connection, product_id, new_category_id):
+        """Shift a product's stock between category rollups before its category changes"""
+        old_category_id = connection.execute(
+            select(products.c.category_id).where(products.c.id == product_id)).scalar()
+        if (old_category_id or 0) == (new_category_id or 0):
+            return
+        levels = connection.execute(
+            select(stock_levels.c.warehouse_id, stock_levels.c.quantity, stock_levels.c.total_value)
+            .where(stock_levels.c.product_id == product_id)
+        ).all()
+        for level in levels:
+            stocked = int(level.quantity > 0)
+            for category_id, sign in ((old_category_id, -1), (new_category_id, 1)):
+                increment(connection, category_levels,
+                          {'category_id': category_id or 0, 'warehouse_id': level.warehouse_id},
+                          {'quantity': sign * level.quantity,
+                           'total_value': sign * Decimal(level.total_value),
+                           'stocked_items': sign * stocked})
+
+    @staticmethod
+    def rebuild():
+        """Replay all movements into stock_levels and the category rollup"""
+        now = datetime.utcnow()
+        audit = [literal(now, db.DateTime), literal(now, db.DateTime), literal(False, db.Boolean)]
+        delta = case(
+            (movements.c.movement_type == 'in', func.abs(movements.c.quantity)),
+            (movements.c.movement_type == 'out', -func.abs(movements.c.quantity)),
+            else_=movements.c.quantity
+        )
+        cost = func.coalesce(movements.c.unit_cost, products.c.cost_price, 0)
+
+        connection = db.session.connection()
+        connection.execute(delete(category_levels))
+        connection.execute(delete(stock_levels))
+        connection.execute(stock_levels.insert().from_select(
+            ['product_id', 'warehouse_id', 'quantity', 'total_value', 'created_at', 'updated_at', 'is_deleted'],
+            select(movements.c.product_id, movements.c.warehouse_id,
+                   func.sum(delta), func.sum(delta * cost), *audit)
+            .select_from(movements.join(products, products.c.id == movements.c.product_id))
+            .where(movements.c.is_deleted == False)
+            .group_by(movements.c.product_id, movements.c.warehouse_id)
+        ))
+        connection.execute(category_levels.insert().from_select(
+            ['category_id', 'warehouse_id', 'quantity', 'total_value', 'stocked_items',
+             'created_at', 'updated_at', 'is_deleted'],
+            select(func.coalesce(products.c.category_id, 0), stock_levels.c.warehouse_id,
+                   func.sum(stock_levels.c.quantity), func.sum(stock_levels.c.total_value),
+                   func.sum(case((stock_levels.c.quantity > 0, 1), else_=0)), *audit)
+            .select_from(stock_levels.join(products, products.c.id == stock_levels.c.product_id))
+            .group_by(func.coalesce(products.c.category_id, 0), stock_levels.c.warehouse_id)
+        ))
+
+        on_hand = func.coalesce(
+            select(func.sum(stock_levels.c.quantity))
+            .where(stock_levels.c.product_id == products.c.id)
+            .scalar_subquery(), 0)
+        available = on_hand - func.coalesce(products.c.reserved_stock, 0)
+        connection.execute(update(products).values(
+            current_stock=on_hand,
+            available_stock=case((available > 0, available), else_=0)))
+        ReportJobService.invalidate(connection, {'stock_levels', 'stock_category_levels'})
+        db.session.commit()
+        return db.session.query(func.count(StockLevel.id)).scalar()
+
+class InventoryReportService:
+    """Inventory report figures, aggregated from stock_levels and its category rollup"""
+
+    @staticmethod
+    def _product_stock(query, warehouse_id):
+        """Join the on-hand quantity used for status checks onto a Product query"""
+        if warehouse_id:
+            query = query.outerjoin(StockLevel, (StockLevel.product_id == Product.id) &
+                                    (StockLevel.warehouse_id == warehouse_id))
+            return query, func.coalesce(StockLevel.quantity, 0)
+        return query, func.coalesce(Product.current_stock, 0)
+
+    @staticmethod
+    def _status_conditions(stock):
+        minimum = func.coalesce(Product.min_stock_level, 0)
+        maximum = func.coalesce(Product.max_stock_level, 0)
+        return {
+            'out_of_stock': stock <= 0,
+            'low_stock': (stock > 0) & (stock <= minimum),
+            'overstock': (maximum > 0) & (stock > maximum),
+            'in_stock': (stock > minimum) & ((maximum == 0) | (stock <= maximum)),
+        }
+
+    @staticmethod
+    def _product_query(warehouse_id=None, category_id=None, stock_status=None, product_type=None):
+        query = db.session.query(Product).filter(Product.is_deleted == False)
+        if category_id:
+            query = query.filter(Product.category_id == category_id)
+        if product_type:
+            query = query.filter(Product.product_type == product_type)
+        query, stock = InventoryReportService._product_stock(query, warehouse_id)
+        if stock_status in ('out_of_stock', 'low_stock', 'overstock', 'in_stock'):
+            query = query.filter(Product.track_inventory == True,
+                                 InventoryReportService._status_conditions(stock)[stock_status])
+        return query, stock
+
+    @staticmethod
+    def metrics(warehouse_id=None, category_id=None, stock_status=None, product_type=None):
+        query, stock = InventoryReportService._product_query(warehouse_id, category_id, stock_status, product_type)
+        conditions = InventoryReportService._status_conditions(stock)
+        tracked = Product.track_inventory == True
+
+        def counter(condition):
+            return func.coalesce(func.sum(case((tracked & condition, 1), else_=0)), 0)
+
+        row = query.with_entities(
+            func.count(Product.id),
+            func.coalesce(func.sum(case((Product.status == 'active', 1), else_=0)), 0),
+            counter(conditions['low_stock']),
+            counter(conditions['out_of_stock']),
+            counter(conditions['in_stock']),
+            counter(conditions['overstock']),
+        ).one()
+
+        return {
+            'total_products': row[0],
+            'active_products': row[1],
+            'total_inventory_value': InventoryReportService.total_value(
+                warehouse_id, category_id, stock_status, product_type),
+            'low_stock_items': row[2],
+            'out_of_stock_items': row[3],
+            'in_stock_items': row[4],
+            'overstock_items': row[5]
+        }
+
+    @staticmethod
+    def total_value(warehouse_id=None, category_id=None, stock_status=None, product_type=None):
+        if stock_status or product_type:
+            # Product-level filters need the per-product summary
+            query, _ = InventoryReportService._product_query(warehouse_id, category_id, stock_status, product_type)
+            query = query.join(StockLevel, StockLevel.product_id == Product.id) if not warehouse_id else query
+            return float(query.with_entities(func.coalesce(func.sum(StockLevel.total_value), 0)).scalar() or 0)
+
+        query = db.session.query(func.coalesce(func.sum(StockCategoryLevel.total_value), 0))
+        if warehouse_id:
+            query = query.filter(StockCategoryLevel.warehouse_id == warehouse_id)
+        if category_id:
+            query = query.filter(StockCategoryLevel.category_id == category_id)
+        return float(query.scalar() or 0)
+
+    @staticmethod
+    def category_breakdown(warehouse_id=None):
+        """Value and stocked item count per category (items are product/warehouse pairs)"""
+        query = (
+            db.session.query(
+                StockCategoryLevel.category_id,
+                func.coalesce(ProductCategory.name, 'Uncategorized').label('name'),
+                func.sum(StockCategoryLevel.total_value).label('value'),
+                func.sum(StockCategoryLevel.stocked_items).label('count'))
+            .outerjoin(ProductCategory, ProductCategory.id == StockCategoryLevel.category_id)
+            .group_by(StockCategoryLevel.category_id, ProductCategory.name)
+            .having(func.sum(StockCategoryLevel.quantity) != 0)
+            .order_by(db.desc('value'))
+        )
+        if warehouse_id:
+            query = query.filter(StockCategoryLevel.warehouse_id == warehouse_id)
+        return [{'id': r.category_id, 'name': r.name, 'value': float(r.value or 0), 'count': int(r.count or 0)}
+                for r in query]
+
+    @staticmethod
+    def warehouse_breakdown(category_id=None):
+        query = (
+            db.session.query(
+                Warehouse.id,
+                Warehouse.name,
+                func.sum(StockCategoryLevel.total_value).label('value'),
+                func.sum(StockCategoryLevel.stocked_items).label('count'))
+            .join(StockCategoryLevel, StockCategoryLevel.warehouse_id == Warehouse.id)
+            .group_by(Warehouse.id, Warehouse.name)
+            .order_by(db.desc('value'))
+        )
+        if category_id:
+            query = query.filter(StockCategoryLevel.category_id == category_id)
+        rows = query.all()
+        total = sum(float(r.value or 0) for r in rows)
+        return [{
+            'id': r.id,
+            'name': r.name,
+            'value': float(r.value or 0),
+            'count': int(r.count or 0),
+            'percentage': float(r.value or 0) / total * 100 if total else 0,
+        } for r in rows]
+
+    @staticmethod
+    def _product_rows(query, stock, limit):
+        rows = (
+            query.outerjoin(ProductCategory, ProductCategory.id == Product.category_id)
+            .with_entities(Product.id, Product.name, Product.sku, Product.cost_price,
+                           Product.min_stock_level, Product.max_stock_level,
+                           ProductCategory.name.label('category_name'), stock.label('stock'))
+            .limit(limit)
+            .all()
+        )
+        return [{
+            'id': r.id,
+            'name': r.name,
+            'sku': r.sku,
+            'category': {'name': r.category_name} if r.category_name else None,
+            'current_stock': int(r.stock or 0),
+            'reorder_level': r.min_stock_level or 0,
+            'maximum_stock': r.max_stock_level or 0,
+            'cost_price': float(r.cost_price or 0),
+            'unit': None,
+        } for r in rows]
+
+    @staticmethod
+    def products(warehouse_id=None, category_id=None, stock_status=None, product_type=None, limit=100):
+        query, stock = InventoryReportService._product_query(warehouse_id, category_id, stock_status, product_type)
+        return InventoryReportService._product_rows(query.order_by(Product.name), stock, limit)
+
+    @staticmethod
+    def low_stock_products(warehouse_id=None, category_id=None, product_type=None, limit=100):
+        query, stock = InventoryReportService._product_query(warehouse_id, category_id, 'low_stock', product_type)
+        return InventoryReportService._product_rows(query.order_by(stock), stock, limit)
+
+    @staticmethod
+    def export_query(warehouse_id=None, category_id=None, stock_status=None, product_type=None):
+        """Product stock rows matching the report filters, for streaming export"""
+        query, stock = InventoryReportService._product_query(warehouse_id, category_id, stock_status, product_type)
+        return (
+            query.outerjoin(ProductCategory, ProductCategory.id == Product.category_id)
+            .with_entities(Product.sku, Product.name, ProductCategory.name.label('category'),
+                           Product.product_type, stock.label('stock'), Product.min_stock_level,
+                           Product.max_stock_level, Product.cost_price,
+                           (stock * func.coalesce(Product.cost_price, 0)).label('stock_value'))
+            .order_by(Product.name, Product.id)
+        )
+
+@backfill('stock_levels', 'stock_category_levels')
+def backfill_stock_levels():
+    return StockLevelService.rebuild()
@@ -2,4 +2,5 @@ from flask import Blueprint
 
 bp = Blueprint('main', __name__)
 
-from app.main import routes
\ No newline at end of file
+from app.main import routes
+from app.main import commands
\ No newline at end of file
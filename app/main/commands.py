@@ -0,0 +1,18 @@
+import click
+from app.core import schema
+from app.main import bp
+from app.main.search import SearchService
+
+@bp.cli.command('rebuild-search-index')
+@click.option('--batch-size', default=1000, show_default=True, help='Documents inserted per statement.')
+def rebuild_search_index(batch_size):
+    """Rebuild the global search index from customers, products, invoices, orders, suppliers, employees and projects."""
+    count = SearchService.rebuild(batch_size=batch_size)
+    click.echo(f"Indexed {count} records")
+
+@bp.cli.command('upgrade-schema')
+def upgrade_schema():
+    """Add tables, columns and indexes missing from an existing database, then backfill them."""
+    changes = schema.upgrade()
+    for kind in ('tables', 'columns', 'indexes', 'backfills'):
+        click.echo(f"{kind.capitalize()}: {', '.join(changes[kind]) or 'none'}")
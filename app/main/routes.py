@@ -1,36 +1,20 @@
-from flask import render_template, redirect, url_for, jsonify
+from flask import render_template, redirect, url_for, jsonify, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from app.main import bp
 from app.core.extensions import db
-from app.models.user import User
+from app.main.services import DashboardService, NotificationService
+from app.main.search import SearchService
+from app.main.typeahead import TypeaheadService, TYPEAHEAD_SOURCES
+from app.models.notification import Notification
+import json
+import time
 
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    # Get real dashboard statistics from database
-    total_users = User.query.filter_by(is_deleted=False).count()
-    active_users = User.query.filter_by(is_active=True, is_deleted=False).count()
-    admin_users = User.query.filter_by(role='admin', is_deleted=False).count()
-    
-    stats = {
-        'total_users': total_users,
-        'active_users': active_users,
-        'admin_users': admin_users,
-        'inactive_users': total_users - active_users
-    }
-    
-    # Get recent user activities (last 5 users created)
-    recent_users = User.query.filter_by(is_deleted=False).order_by(User.created_at.desc()).limit(5).all()
-    
-    recent_activities = []
-    for user in recent_users:
-        activity = {
-            'type': 'user',
-            'description': f'New user registered: {user.full_name}',
-            'time': user.created_at.strftime('%Y-%m-%d %H:%M'),
-            'importance': 'normal' if user.role == 'employee' else 'important'
-        }
-        recent_activities.append(activity)
+    # Counters come from one aggregate query per module, cached for DASHBOARD_CACHE_TTL seconds
+    stats = DashboardService.stats()
+    recent_activities = DashboardService.recent_users()
     
     return render_template('dashboard/index.html', stats=stats, recent_activities=recent_activities)
 
@@ -72,100 +56,114 @@ def help_page():
 @bp.route('/api/notifications')
 @login_required
 def api_notifications():
-    # Mock notifications data
-    notifications = [
-        {
-            'id': 1,
-            'title': 'System Alert',
-            'message': 'Database backup failed - immediate attention required',
-            'type': 'critical',
-            'read': False,
-            'created_at': '2 minutes ago'
-        },
-        {
-            'id': 2,
-            'title': 'Payment Overdue',
-            'message': 'Invoice #INV-001 is 5 days overdue',
-            'type': 'warning',
-            'read': False,
-            'created_at': '1 hour ago'
-        },
-        {
-            'id': 3,
-            'title': 'Low Stock Alert',
-            'message': '5 products are running low on inventory',
-            'type': 'info',
-            'read': False,
-            'created_at': '3 hours ago'
-        }
-    ]
-    
-    unread_count = len([n for n in notifications if not n['read']])
+    notifications = NotificationService.recent(current_user.id)
     
     return jsonify({
-        'notifications': notifications,
-        'unread_count': unread_count
+        'notifications': [n.to_dict() for n in notifications],
+        'unread_count': NotificationService.unread_count(current_user.id)
     })
 
 @bp.route('/api/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_notifications_read():
-    # In a real app, you would update the database here
-    return jsonify({'success': True})
+    marked = NotificationService.mark_read(current_user.id)
+    return jsonify({'success': True, 'marked': marked})
+
+@bp.route('/api/notifications/<int:id>/read', methods=['POST'])
+@login_required
+def mark_notification_read(id):
+    marked = NotificationService.mark_read(current_user.id, [id])
+    return jsonify({'success': True, 'marked': marked})
+
+def _last_notification_id(user_id):
+    return db.session.query(db.func.max(Notification.id)).filter_by(user_id=user_id).scalar() or 0
+
+@bp.route('/api/notifications/stream')
+@login_required
+def notification_stream():
+    """Server-Sent Events feed of new notifications and the unread count, for a bounded lifetime.
+
+    Each check reads only the user's counter row; notifications are fetched when
+    it changed. The browser reconnects when the stream ends and resumes from
+    Last-Event-ID. 204 tells it to fall back to polling.
+    """
+    config = current_app.config
+    lifetime = config.get('NOTIFICATION_STREAM_SECONDS', 300)
+    if not lifetime:
+        return '', 204
+    user_id = current_user.id
+    interval = config.get('NOTIFICATION_STREAM_INTERVAL', 5)
+    heartbeat = config.get('NOTIFICATION_STREAM_HEARTBEAT', 15)
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    if last_id is None:
+        last_id = _last_notification_id(user_id)
+    
+    def events():
+        nonlocal last_id
+        yield f'retry: {int(interval * 1000)}\n\n'
+        version = None
+        deadline = time.monotonic() + lifetime
+        quiet_since = time.monotonic()
+        while True:
+            current, unread = NotificationService.version(user_id)
+            if current != version:
+                for notification in NotificationService.recent(user_id, after_id=last_id):
+                    last_id = notification.id
+                    yield f'id: {last_id}\nevent: notification\ndata: {json.dumps(notification.to_dict())}\n\n'
+                version = current
+                yield f'id: {last_id}\nevent: unread\ndata: {json.dumps({"unread_count": unread})}\n\n'
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= heartbeat:
+                yield ': heartbeat\n\n'
+                quiet_since = time.monotonic()
+            # Return the connection to the pool between checks
+            db.session.rollback()
+            if time.monotonic() + interval > deadline:
+                return
+            time.sleep(interval)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/notifications/poll')
+@login_required
+def notification_poll():
+    """Fallback for browsers without the stream: new notifications and the unread count once the
+    user's counter row differs from ``version``"""
+    user_id = current_user.id
+    last_id = request.args.get('last_id', type=int)
+    if last_id is None:
+        last_id = _last_notification_id(user_id)
+    
+    version, unread = NotificationService.version(user_id)
+    changed = version != request.args.get('version')
+    new = NotificationService.recent(user_id, after_id=last_id) if changed else []
+    return jsonify({
+        'version': version,
+        'unread_count': unread,
+        'last_id': new[-1].id if new else last_id,
+        'notifications': [n.to_dict() for n in new],
+        'retry_after': current_app.config.get('NOTIFICATION_POLL_SECONDS', 30),
+    })
 
 @bp.route('/api/search', methods=['POST'])
 @login_required
 def api_search():
-    from flask import request
-    
-    data = request.get_json()
-    query = data.get('query', '').lower()
+    data = request.get_json(silent=True) or {}
+    limit = 25 if data.get('detailed') else 10
     
-    # Mock search results
-    all_results = [
-        {
-            'title': 'Dashboard',
-            'description': 'Main dashboard with statistics and overview',
-            'url': '/dashboard',
-            'icon': 'fas fa-tachometer-alt',
-            'category': 'Navigation'
-        },
-        {
-            'title': 'Customers',
-            'description': 'Manage customer information and contacts',
-            'url': '/sales/customers',
-            'icon': 'fas fa-users',
-            'category': 'Sales'
-        },
-        {
-            'title': 'Products',
-            'description': 'Product catalog and inventory management',
-            'url': '/inventory/products',
-            'icon': 'fas fa-box',
-            'category': 'Inventory'
-        },
-        {
-            'title': 'Invoices',
-            'description': 'Create and manage invoices',
-            'url': '/finance/invoices',
-            'icon': 'fas fa-file-invoice',
-            'category': 'Finance'
-        },
-        {
-            'title': 'Employees',
-            'description': 'Employee management and HR functions',
-            'url': '/hr/employees',
-            'icon': 'fas fa-user-tie',
-            'category': 'HR'
-        }
-    ]
+    # Ranked matches from the full-text index, limited to modules the user's role may see
+    results = SearchService.search(data.get('query', ''), role=current_user.role, limit=limit)
     
-    # Filter results based on query
-    results = []
-    for item in all_results:
-        if (query in item['title'].lower() or 
-            query in item['description'].lower() or 
-            query in item['category'].lower()):
-            results.append(item)
+    return jsonify(results)
+
+@bp.route('/api/typeahead/<source>')
+@login_required
+def api_typeahead(source):
+    if source not in TYPEAHEAD_SOURCES:
+        return jsonify({'error': f'Unknown typeahead source: {source}'}), 404
+    limit = min(request.args.get('limit', 10, type=int), 50)
     
-    return jsonify(results[:10])  # Limit to 10 results
\ No newline at end of file
+    return jsonify(TypeaheadService.search(source, request.args.get('q', ''), limit=limit))
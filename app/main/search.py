@@ -0,0 +1,261 @@
+import re
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, inspect, select, insert, update, delete, text, or_, and_
+from app.core.extensions import db
+from app.core.schema import backfill
+from app.models.search_document import SearchDocument
+from app.sales.models import Customer, SalesOrder
+from app.inventory.models import Product
+from app.finance.models import Invoice
+from app.procurement.models import Supplier
+from app.hr.models import Employee
+from app.projects.models import Project
+
+search_documents = SearchDocument.__table__
+
+# Modules whose records only some roles may find; anything not listed is visible to every user
+MODULE_ROLES = {
+    'finance': ('admin', 'manager'),
+    'hr': ('admin', 'manager'),
+}
+
+MODULE_CATEGORIES = {
+    'sales': 'Sales',
+    'inventory': 'Inventory',
+    'finance': 'Finance',
+    'procurement': 'Procurement',
+    'hr': 'HR',
+    'projects': 'Projects',
+}
+
+class Searchable:
+    """How one model is turned into a search document"""
+
+    def __init__(self, entity_type, model, module, icon, url, title, subtitle, fields):
+        self.entity_type = entity_type
+        self.model = model
+        self.module = module
+        self.icon = icon
+        self.url = url            # url(id) -> path of the detail page
+        self.title = title        # title(record) -> str
+        self.subtitle = subtitle  # subtitle(record) -> str
+        self.fields = fields      # attributes whose text is indexed; changes to them trigger a reindex
+
+    def document(self, record):
+        values = (getattr(record, field) for field in self.fields)
+        return {
+            'entity_type': self.entity_type,
+            'entity_id': record.id,
+            'module': self.module,
+            'title': self.title(record)[:200],
+            'subtitle': (self.subtitle(record) or '')[:300],
+            'body': ' '.join(str(value) for value in values if value),
+            'url': self.url(record.id),
+        }
+
+def _join(*parts):
+    return ' · '.join(part for part in parts if part)
+
+SEARCHABLES = [
+    Searchable('customer', Customer, 'sales', 'fas fa-user',
+               lambda id: f'/sales/customers/{id}',
+               lambda r: r.company_name,
+               lambda r: _join(r.customer_code, r.contact_person, r.email),
+               ('customer_code', 'company_name', 'contact_person', 'email', 'phone', 'city', 'country')),
+    Searchable('product', Product, 'inventory', 'fas fa-box',
+               lambda id: f'/inventory/products/{id}',
+               lambda r: r.name,
+               lambda r: _join(f'SKU {r.sku}', r.barcode),
+               ('name', 'sku', 'barcode', 'short_description')),
+    Searchable('invoice', Invoice, 'finance', 'fas fa-file-invoice',
+               lambda id: f'/finance/invoices/{id}',
+               lambda r: f'Invoice {r.invoice_number}',
+               lambda r: _join(r.status and r.status.title(), r.due_date and f'due {r.due_date.isoformat()}'),
+               ('invoice_number', 'status', 'due_date')),
+    Searchable('sales_order', SalesOrder, 'sales', 'fas fa-shopping-cart',
+               lambda id: f'/sales/orders/{id}',
+               lambda r: f'Order {r.order_number}',
+               lambda r: _join(r.status and r.status.title(), r.reference_number),
+               ('order_number', 'reference_number', 'status')),
+    Searchable('supplier', Supplier, 'procurement', 'fas fa-truck',
+               lambda id: f'/procurement/suppliers/{id}',
+               lambda r: r.company_name,
+               lambda r: _join(r.supplier_code, r.contact_person, r.email),
+               ('supplier_code', 'company_name', 'contact_person', 'email', 'phone')),
+    Searchable('employee', Employee, 'hr', 'fas fa-user-tie',
+               lambda id: f'/hr/employees/{id}',
+               lambda r: ' '.join(part for part in (r.first_name, r.middle_name, r.last_name) if part),
+               lambda r: _join(r.employee_id, r.personal_email),
+               ('employee_id', 'first_name', 'middle_name', 'last_name', 'personal_email', 'phone')),
+    Searchable('project', Project, 'projects', 'fas fa-project-diagram',
+               lambda id: f'/projects/{id}',
+               lambda r: r.name,
+               lambda r: _join(r.project_code, r.status and r.status.title()),
+               ('project_code', 'name', 'description', 'status')),
+]
+
+ICONS = {searchable.entity_type: searchable.icon for searchable in SEARCHABLES}
+
+class SearchService:
+    """Global search over the search_documents index (SQLite FTS5 ranked by BM25, LIKE elsewhere)"""
+
+    @staticmethod
+    def allowed_modules(role):
+        """Modules a role may search, or None when unrestricted"""
+        restricted = [module for module, roles in MODULE_ROLES.items() if role not in roles]
+        if not restricted:
+            return None
+        return [module for module in MODULE_CATEGORIES if module not in restricted]
+
+    @staticmethod
+    def terms(query):
+        """Lower-cased word tokens of a query; single characters are dropped as too unselective"""
+        return [term for term in re.findall(r'\w+', query.lower()) if len(term) > 1][:8]
+
+    @staticmethod
+    def search(query, role=None, limit=10):
+        terms = SearchService.terms(query or '')
+        if not terms:
+            return []
+        modules = SearchService.allowed_modules(role)
+        if db.engine.dialect.name == 'sqlite':
+            rows = SearchService._search_fts(terms, modules, limit)
+        else:
+            rows = SearchService._search_like(terms, modules, limit)
+        return [{
+            'title': row.title,
+            'description': row.subtitle or '',
+            'url': row.url,
+            'icon': ICONS.get(row.entity_type, 'fas fa-search'),
+            'category': MODULE_CATEGORIES.get(row.module, row.module.title()),
+        } for row in rows]
+
+    @staticmethod
+    def _search_fts(terms, modules, limit):
+        # Earlier words must match whole; the last one is still being typed so it matches as a prefix
+        match = ' '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+        cap = current_app.config.get('SEARCH_RANK_CANDIDATES', 1000)
+        candidates = db.session.execute(text(
+            'SELECT rowid FROM search_documents_fts WHERE search_documents_fts MATCH :match LIMIT :cap'
+        ), {'match': match, 'cap': cap + 1}).all()
+        if len(candidates) <= cap:
+            return SearchService._fts_rows(match, modules, 'search_documents_fts.rank', limit)
+        # Scoring every match of a very broad query is too slow for typeahead; take the newest
+        # title matches, then the newest body matches, which the FTS index can walk in order
+        rows = SearchService._fts_rows('{title} : (%s)' % match, modules, 'search_documents_fts.rowid DESC', limit)
+        if len(rows) < limit:
+            seen = {(row.entity_type, row.url) for row in rows}
+            rows += [row for row in SearchService._fts_rows(match, modules, 'search_documents_fts.rowid DESC', limit)
+                     if (row.entity_type, row.url) not in seen]
+        return rows[:limit]
+
+    @staticmethod
+    def _fts_rows(match, modules, order_by, limit):
+        module_filter = ''
+        params = {'match': match, 'limit': limit}
+        if modules is not None:
+            module_filter = 'AND d.module IN ({})'.format(', '.join(f':m{i}' for i in range(len(modules))))
+            params.update({f'm{i}': module for i, module in enumerate(modules)})
+        return db.session.execute(text(
+            'SELECT d.entity_type, d.module, d.title, d.subtitle, d.url '
+            'FROM search_documents_fts JOIN search_documents d ON d.id = search_documents_fts.rowid '
+            f'WHERE search_documents_fts MATCH :match {module_filter} '
+            f'ORDER BY {order_by} LIMIT :limit'
+        ), params).all()
+
+    @staticmethod
+    def _search_like(terms, modules, limit):
+        c = search_documents.c
+        statement = select(c.entity_type, c.module, c.title, c.subtitle, c.url).where(and_(*[
+            or_(c.title.ilike(f'%{term}%'), c.body.ilike(f'%{term}%')) for term in terms
+        ]))
+        if modules is not None:
+            statement = statement.where(c.module.in_(modules))
+        return db.session.execute(statement.order_by(c.title).limit(limit)).all()
+
+    @staticmethod
+    def index(connection, searchable, record):
+        """Insert or refresh the document for a record, or drop it once the record is soft-deleted"""
+        if record.is_deleted:
+            SearchService.remove(connection, searchable, record.id)
+            return
+        document = searchable.document(record)
+        now = datetime.utcnow()
+        c = search_documents.c
+        result = connection.execute(
+            update(search_documents)
+            .where(c.entity_type == searchable.entity_type, c.entity_id == record.id)
+            .values(updated_at=now, **document))
+        if not result.rowcount:
+            connection.execute(insert(search_documents).values(
+                created_at=now, updated_at=now, is_deleted=False, **document))
+
+    @staticmethod
+    def remove(connection, searchable, entity_id):
+        c = search_documents.c
+        connection.execute(delete(search_documents)
+                           .where(c.entity_type == searchable.entity_type, c.entity_id == entity_id))
+
+    @staticmethod
+    def reindex(connection, entity_type, ids, batch_size=1000):
+        """Refresh the documents of records changed by bulk Core statements, which skip the mapper events"""
+        searchable = next(searchable for searchable in SEARCHABLES if searchable.entity_type == entity_type)
+        table = searchable.model.__table__
+        for start in range(0, len(ids), batch_size):
+            rows = connection.execute(select(table).where(table.c.id.in_(ids[start:start + batch_size]))).all()
+            for row in rows:
+                SearchService.index(connection, searchable, row)
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """Recreate every document from the source tables; returns the number indexed"""
+        connection = db.session.connection()
+        connection.execute(delete(search_documents))
+        total = 0
+        for searchable in SEARCHABLES:
+            query = (searchable.model.query
+                     .filter(searchable.model.is_deleted == False)
+                     .order_by(searchable.model.id)
+                     .yield_per(batch_size))
+            batch = []
+            now = datetime.utcnow()
+            for record in query:
+                batch.append(dict(searchable.document(record), created_at=now, updated_at=now, is_deleted=False))
+                if len(batch) >= batch_size:
+                    connection.execute(insert(search_documents), batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                connection.execute(insert(search_documents), batch)
+                total += len(batch)
+        if connection.dialect.name == 'sqlite':
+            connection.execute(text("INSERT INTO search_documents_fts(search_documents_fts) VALUES('optimize')"))
+        db.session.commit()
+        return total
+
+# Keep the index in step with the source records on the flushing connection
+def _register(searchable):
+    watched = set(searchable.fields) | {'is_deleted'}
+
+    def index_inserted(mapper, connection, target):
+        SearchService.index(connection, searchable, target)
+
+    def index_updated(mapper, connection, target):
+        state = inspect(target)
+        if any(state.attrs[field].history.has_changes() for field in watched):
+            SearchService.index(connection, searchable, target)
+
+    def remove_deleted(mapper, connection, target):
+        SearchService.remove(connection, searchable, target.id)
+
+    event.listen(searchable.model, 'after_insert', index_inserted)
+    event.listen(searchable.model, 'after_update', index_updated)
+    event.listen(searchable.model, 'after_delete', remove_deleted)
+
+for _searchable in SEARCHABLES:
+    _register(_searchable)
+
+@backfill('search_documents')
+def backfill_search_index():
+    return SearchService.rebuild()
@@ -0,0 +1,283 @@
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import func, case, select, insert, update, exists
+from app.core.cache import TTLCache, on_commit
+from app.core.extensions import db
+from app.core.sql import increment
+from app.models.user import User
+from app.models.notification import Notification, NotificationCounter
+from app.sales.models import SalesOrder
+from app.finance.models import Invoice
+from app.inventory.models import Product
+
+# Orders that still need work; draft, delivered and cancelled orders are not open
+OPEN_ORDER_STATUSES = ('pending', 'confirmed', 'processing', 'shipped')
+
+dashboard_cache = TTLCache()
+
+users = User.__table__
+notifications = Notification.__table__
+notification_counters = NotificationCounter.__table__
+invoices = Invoice.__table__
+
+class DashboardService:
+    """Dashboard counters, one conditional-aggregate query per module, cached per process"""
+
+    # Cache key -> tables whose committed changes invalidate it
+    MODULE_TABLES = {
+        'users': {'users'},
+        'recent_users': {'users'},
+        'sales': {'sales_orders'},
+        'finance': {'invoices'},
+        'inventory': {'products', 'stock_movements'},
+    }
+
+    @staticmethod
+    def _cached(key, compute):
+        ttl = current_app.config.get('DASHBOARD_CACHE_TTL', 30)
+        return dashboard_cache.get_or_set(key, compute, ttl)
+
+    @staticmethod
+    def user_stats():
+        def compute():
+            row = db.session.query(
+                func.count(User.id),
+                func.coalesce(func.sum(case((User.is_active == True, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((User.role == 'admin', 1), else_=0)), 0),
+            ).filter(User.is_deleted == False).one()
+            return {
+                'total_users': row[0],
+                'active_users': row[1],
+                'admin_users': row[2],
+                'inactive_users': row[0] - row[1],
+            }
+        return DashboardService._cached('users', compute)
+
+    @staticmethod
+    def sales_stats():
+        def compute():
+            is_open = SalesOrder.status.in_(OPEN_ORDER_STATUSES)
+            row = db.session.query(
+                func.coalesce(func.sum(case((is_open, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((is_open, SalesOrder.total_amount), else_=0)), 0),
+            ).filter(SalesOrder.is_deleted == False).one()
+            return {'open_orders': row[0], 'open_orders_value': float(row[1])}
+        return DashboardService._cached('sales', compute)
+
+    @staticmethod
+    def finance_stats():
+        def compute():
+            row = db.session.query(
+                func.coalesce(func.sum(case((Invoice.is_overdue, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((Invoice.is_overdue, Invoice.balance_due), else_=0)), 0),
+            ).filter(Invoice.is_deleted == False).one()
+            return {'overdue_invoices': row[0], 'overdue_amount': float(row[1])}
+        return DashboardService._cached('finance', compute)
+
+    @staticmethod
+    def inventory_stats():
+        def compute():
+            stock = func.coalesce(Product.current_stock, 0)
+            row = db.session.query(
+                func.coalesce(func.sum(case(((stock > 0) & (stock <= func.coalesce(Product.min_stock_level, 0)), 1),
+                                            else_=0)), 0),
+                func.coalesce(func.sum(case((stock <= 0, 1), else_=0)), 0),
+            ).filter(Product.is_deleted == False, Product.track_inventory == True).one()
+            return {'low_stock_items': row[0], 'out_of_stock_items': row[1]}
+        return DashboardService._cached('inventory', compute)
+
+    @staticmethod
+    def recent_users(limit=5):
+        def compute():
+            rows = (
+                db.session.query(User.first_name, User.last_name, User.role, User.created_at)
+                .filter(User.is_deleted == False)
+                .order_by(User.created_at.desc())
+                .limit(limit)
+                .all()
+            )
+            return [{
+                'type': 'user',
+                'description': f'New user registered: {r.first_name} {r.last_name}',
+                'time': r.created_at.strftime('%Y-%m-%d %H:%M'),
+                'importance': 'normal' if r.role == 'employee' else 'important'
+            } for r in rows]
+        return DashboardService._cached('recent_users', compute)
+
+    @staticmethod
+    def stats():
+        stats = {}
+        stats.update(DashboardService.user_stats())
+        stats.update(DashboardService.sales_stats())
+        stats.update(DashboardService.finance_stats())
+        stats.update(DashboardService.inventory_stats())
+        return stats
+
+    @staticmethod
+    def invalidate(tables):
+        keys = [key for key, sources in DashboardService.MODULE_TABLES.items() if sources & tables]
+        dashboard_cache.invalidate(*keys)
+
+class NotificationService:
+    """Store, count and mark notifications; producers call notify() on the flushing connection"""
+
+    @staticmethod
+    def recipients(connection, roles=('admin', 'manager')):
+        """Active users holding one of ``roles``"""
+        return connection.execute(
+            select(users.c.id).where(users.c.role.in_(roles), users.c.is_active == True,
+                                     users.c.is_deleted == False)
+        ).scalars().all()
+
+    @staticmethod
+    def notify(connection, user_ids, title, message, type='info', category='system', link=None,
+               source_type=None, source_id=None):
+        """Insert one notification per user with a single executemany and bump their unread counters"""
+        user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id]
+        if not user_ids:
+            return 0
+        now = datetime.utcnow()
+        connection.execute(insert(notifications), [{
+            'user_id': user_id, 'title': title, 'message': message, 'type': type, 'category': category,
+            'link': link, 'source_type': source_type, 'source_id': source_id, 'read': False,
+            'created_at': now, 'updated_at': now, 'is_deleted': False,
+        } for user_id in user_ids])
+        for user_id in user_ids:
+            increment(connection, notification_counters, {'user_id': user_id}, {'unread': 1},
+                      created_at=now, updated_at=now, is_deleted=False)
+        return len(user_ids)
+
+    @staticmethod
+    def unread_count(user_id):
+        count = db.session.query(NotificationCounter.unread).filter_by(user_id=user_id).scalar()
+        return max(count or 0, 0)
+
+    @staticmethod
+    def version(user_id):
+        """(token, unread count) from the user's counter row; the token changes with every notify and mark-read"""
+        row = db.session.execute(
+            select(notification_counters.c.unread, notification_counters.c.updated_at)
+            .where(notification_counters.c.user_id == user_id)
+        ).first()
+        if row is None:
+            return '0', 0
+        return f'{row.unread}:{row.updated_at.isoformat()}', max(row.unread, 0)
+
+    @staticmethod
+    def recent(user_id, limit=20, after_id=None):
+        query = Notification.query.filter(Notification.user_id == user_id, Notification.is_deleted == False)
+        if after_id is not None:
+            return query.filter(Notification.id > after_id).order_by(Notification.id).all()
+        return query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def mark_read(user_id, notification_ids=None):
+        """Mark the user's unread notifications (or just ``notification_ids``) read with one UPDATE"""
+        statement = update(notifications).where(notifications.c.user_id == user_id,
+                                                notifications.c.read == False)
+        if notification_ids is not None:
+            statement = statement.where(notifications.c.id.in_(notification_ids))
+        now = datetime.utcnow()
+        marked = db.session.execute(statement.values(read=True, read_at=now, updated_at=now)).rowcount
+        if marked:
+            db.session.execute(
+                update(notification_counters)
+                .where(notification_counters.c.user_id == user_id)
+                .values(unread=notification_counters.c.unread - marked, updated_at=now))
+        db.session.commit()
+        return marked
+
+    @staticmethod
+    def notify_many(connection, user_ids, messages, batch_size=1000):
+        """Send every message (dicts of notify() arguments) to every user.
+
+        Rows go in with executemany batches of ``batch_size`` and each user's
+        unread counter is bumped once for the whole set.
+        """
+        user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id]
+        if not user_ids or not messages:
+            return 0
+        now = datetime.utcnow()
+        rows = [{
+            'user_id': user_id, 'title': message['title'], 'message': message['message'],
+            'type': message.get('type', 'info'), 'category': message.get('category', 'system'),
+            'link': message.get('link'), 'source_type': message.get('source_type'),
+            'source_id': message.get('source_id'), 'read': False,
+            'created_at': now, 'updated_at': now, 'is_deleted': False,
+        } for message in messages for user_id in user_ids]
+        for start in range(0, len(rows), batch_size):
+            connection.execute(insert(notifications), rows[start:start + batch_size])
+        for user_id in user_ids:
+            increment(connection, notification_counters, {'user_id': user_id}, {'unread': len(messages)},
+                      created_at=now, updated_at=now, is_deleted=False)
+        return len(rows)
+
+    @staticmethod
+    def notify_overdue_invoices(connection, today=None, invoice_ids=None, batch_size=1000):
+        """Notify finance approvers once about every invoice (of ``invoice_ids``) that has gone overdue"""
+        today = today or date.today()
+        already_sent = exists().where(notifications.c.source_type == 'invoice',
+                                      notifications.c.source_id == invoices.c.id,
+                                      notifications.c.category == 'invoice_overdue')
+        statement = (
+            select(invoices.c.id, invoices.c.invoice_number, invoices.c.due_date)
+            .where(invoices.c.is_deleted == False, Invoice.overdue_on(today), ~already_sent)
+        )
+        if invoice_ids is not None:
+            if not invoice_ids:
+                return 0
+            statement = statement.where(invoices.c.id.in_(invoice_ids))
+        rows = connection.execute(statement).all()
+        if not rows:
+            return 0
+        NotificationService.notify_many(connection, NotificationService.recipients(connection), [{
+            'title': 'Payment Overdue',
+            'message': f'Invoice #{row.invoice_number} is {(today - row.due_date).days} days overdue',
+            'type': 'warning', 'category': 'invoice_overdue', 'link': f'/finance/invoices/{row.id}',
+            'source_type': 'invoice', 'source_id': row.id,
+        } for row in rows], batch_size)
+        return len(rows)
+
+    @staticmethod
+    def notify_low_stock(connection, product_id, delta):
+        """Notify when a stock decrease takes a product to or below its minimum level"""
+        product = connection.execute(
+            select(Product.__table__.c.name, Product.__table__.c.sku, Product.__table__.c.current_stock,
+                   Product.__table__.c.min_stock_level, Product.__table__.c.track_inventory)
+            .where(Product.__table__.c.id == product_id)
+        ).first()
+        if product is None or not product.track_inventory:
+            return
+        minimum = product.min_stock_level or 0
+        current = product.current_stock or 0
+        if not (current - delta > minimum >= current):
+            return
+        out = current <= 0
+        NotificationService.notify(
+            connection, NotificationService.recipients(connection),
+            'Out of Stock' if out else 'Low Stock Alert',
+            f'{product.name} ({product.sku}) is {"out of stock" if out else f"down to {current} units"}',
+            type='critical' if out else 'warning', category='low_stock',
+            link=f'/inventory/products/{product_id}',
+            source_type='product', source_id=product_id)
+
+    @staticmethod
+    def notify_approval(connection, source_type, source_id, status, submitter_id, approver_ids, label, link=None):
+        """Ask approvers to review a pending submission, or tell the submitter the decision"""
+        if status == 'pending':
+            NotificationService.notify(
+                connection, [user_id for user_id in approver_ids if user_id != submitter_id],
+                'Approval Required', f'{label} is awaiting your approval',
+                type='info', category='approval', link=link, source_type=source_type, source_id=source_id)
+        elif status in ('approved', 'rejected'):
+            NotificationService.notify(
+                connection, [submitter_id], f'{label} {status.title()}', f'{label} was {status}',
+                type='success' if status == 'approved' else 'warning', category='approval',
+                link=link, source_type=source_type, source_id=source_id)
+
+# Drop cached counters once a transaction touching their tables commits
+def _collect_dashboard_tables(session, obj, tables):
+    if hasattr(obj, '__table__'):
+        tables.add(obj.__table__.name)
+
+on_commit('dashboard_tables', None, _collect_dashboard_tables, DashboardService.invalidate, factory=set)
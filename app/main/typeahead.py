@@ -0,0 +1,138 @@
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import inspect, select
+from app.core.cache import on_commit
+from app.core.extensions import db
+from app.core.prefix_index import PrefixIndex, prefix_terms
+from app.models.user import User
+from app.sales.models import Customer
+from app.inventory.models import Product
+from app.procurement.models import Supplier
+from app.hr.models import Employee
+
+class TypeaheadSource:
+    """A picker's records: which rows are offered and how they are labelled and matched"""
+
+    def __init__(self, name, model, columns, active, label, detail, terms):
+        self.name = name
+        self.model = model
+        self.columns = columns  # attributes read by the callables below
+        self.active = active    # active(record) -> whether it can be picked
+        self.label = label
+        self.detail = detail
+        self.terms = terms      # terms(record) -> values whose words are matched
+
+    def entry(self, record):
+        return record.id, self.label(record), self.detail(record) or '', prefix_terms(*self.terms(record))
+
+def _full_name(*parts):
+    return ' '.join(part for part in parts if part)
+
+TYPEAHEAD_SOURCES = {source.name: source for source in [
+    TypeaheadSource('customers', Customer, ('company_name', 'customer_code', 'contact_person', 'status'),
+                    lambda r: r.status in (None, 'active'),
+                    lambda r: r.company_name,
+                    lambda r: r.customer_code,
+                    lambda r: (r.company_name, r.customer_code, r.contact_person)),
+    TypeaheadSource('products', Product, ('name', 'sku', 'barcode', 'status'),
+                    lambda r: r.status in (None, 'active'),
+                    lambda r: r.name,
+                    lambda r: r.sku,
+                    lambda r: (r.name, r.sku, r.barcode)),
+    TypeaheadSource('suppliers', Supplier, ('company_name', 'supplier_code', 'contact_person', 'status'),
+                    lambda r: r.status in (None, 'active'),
+                    lambda r: r.company_name,
+                    lambda r: r.supplier_code,
+                    lambda r: (r.company_name, r.supplier_code, r.contact_person)),
+    TypeaheadSource('employees', Employee,
+                    ('first_name', 'middle_name', 'last_name', 'employee_id', 'employment_status'),
+                    lambda r: r.employment_status != 'terminated',
+                    lambda r: _full_name(r.first_name, r.middle_name, r.last_name),
+                    lambda r: r.employee_id,
+                    lambda r: (r.first_name, r.middle_name, r.last_name, r.employee_id)),
+    TypeaheadSource('users', User, ('first_name', 'last_name', 'username', 'email', 'is_active'),
+                    lambda r: bool(r.is_active),
+                    lambda r: _full_name(r.first_name, r.last_name) or r.username,
+                    lambda r: r.email,
+                    lambda r: (r.first_name, r.last_name, r.username, r.email)),
+]}
+
+SOURCE_BY_MODEL = {source.model: source for source in TYPEAHEAD_SOURCES.values()}
+
+class TypeaheadIndexes:
+    """Per-process prefix indexes, built on first use and patched from committed ORM changes.
+
+    Other processes' commits are not seen by the ORM events here, so each index
+    is also rebuilt from the database every TYPEAHEAD_REBUILD_SECONDS.
+    """
+
+    def __init__(self, rebuild_seconds):
+        self.rebuild_seconds = rebuild_seconds
+        self._indexes = {}  # name -> (PrefixIndex, built_at)
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        built = self._indexes.get(name)
+        if built is None or time.monotonic() - built[1] > self.rebuild_seconds:
+            with self._lock:
+                built = self._indexes.get(name)
+                if built is None or time.monotonic() - built[1] > self.rebuild_seconds:
+                    built = (self._build(TYPEAHEAD_SOURCES[name]), time.monotonic())
+                    self._indexes[name] = built
+        return built[0]
+
+    @staticmethod
+    def _build(source):
+        table = source.model.__table__
+        rows = db.session.execute(
+            select(table.c.id, *[table.c[column] for column in source.columns])
+            .where(table.c.is_deleted == False)
+        )
+        index = PrefixIndex()
+        index.load(source.entry(row) for row in rows if source.active(row))
+        return index
+
+    def apply(self, changes):
+        """Patch built indexes with {(source name, id): entry or None}"""
+        for (name, id), entry in changes.items():
+            built = self._indexes.get(name)
+            if built is None:
+                continue
+            if entry is None:
+                built[0].remove(id)
+            else:
+                built[0].add(*entry)
+
+def get_typeahead_indexes():
+    indexes = current_app.extensions.get('typeahead')
+    if indexes is None:
+        indexes = TypeaheadIndexes(current_app.config.get('TYPEAHEAD_REBUILD_SECONDS', 300))
+        current_app.extensions['typeahead'] = indexes
+    return indexes
+
+class TypeaheadService:
+    """Top-N prefix matches for the picker endpoints"""
+
+    @staticmethod
+    def search(name, query, limit=10):
+        return get_typeahead_indexes().get(name).search(query, limit)
+
+# Record picker-relevant changes at flush time, while their attributes are loaded,
+# and apply them to this process's indexes only once the transaction commits
+def _collect_typeahead_changes(session, obj, changes):
+    source = SOURCE_BY_MODEL[type(obj)]
+    if obj in session.deleted:
+        changes[(source.name, obj.id)] = None
+        return
+    state = inspect(obj)
+    if obj in session.new or any(state.attrs[column].history.has_changes()
+                                 for column in source.columns + ('is_deleted',)):
+        live = not obj.is_deleted and source.active(obj)
+        changes[(source.name, obj.id)] = source.entry(obj) if live else None
+
+def _apply_typeahead_changes(changes):
+    if has_app_context():
+        get_typeahead_indexes().apply(changes)
+
+on_commit('typeahead_changes', tuple(SOURCE_BY_MODEL), _collect_typeahead_changes, _apply_typeahead_changes)
@@ -3,4 +3,9 @@ from .user import User
 from .role import Role
 from .permission import Permission
 from .company import Company
-from .audit_log import AuditLog
\ No newline at end of file
+from .audit_log import AuditLog
+from .document_sequence import DocumentSequence
+from .notification import Notification, NotificationCounter
+from .search_document import SearchDocument
+from .document_blob import DocumentBlob
+from .scheduled_job import ScheduledJobState
@@ -0,0 +1,12 @@
+from app.core.extensions import db
+from app.models.base import BaseModel
+
+class DocumentBlob(BaseModel):
+    """One stored file per distinct content, shared by every document version with that SHA-256"""
+    __tablename__ = 'document_blobs'
+
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+
+    def __repr__(self):
+        return f'<DocumentBlob {self.sha256[:12]} ({self.size} bytes)>'
@@ -0,0 +1,18 @@
+from app.core.extensions import db
+from app.models.base import BaseModel
+
+class DocumentSequence(BaseModel):
+    __tablename__ = 'document_sequences'
+    __table_args__ = (
+        db.UniqueConstraint('prefix', 'company_id', 'fiscal_year', name='uq_document_sequences_key'),
+    )
+
+    prefix = db.Column(db.String(20), nullable=False)
+    company_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = shared by all companies
+    fiscal_year = db.Column(db.Integer, nullable=False, default=0)  # 0 = never resets
+
+    # First number not yet handed out to any process
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+    def __repr__(self):
+        return f'<DocumentSequence {self.prefix} company:{self.company_id} FY{self.fiscal_year}>'
@@ -0,0 +1,50 @@
+from app.core.extensions import db
+from app.models.base import BaseModel
+
+class Notification(BaseModel):
+    __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_created', 'user_id', 'read', 'created_at'),
+        db.Index('ix_notifications_source', 'source_type', 'source_id', 'category'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.String(500), nullable=False)
+    type = db.Column(db.String(20), nullable=False, default='info')  # info, success, warning, critical
+    category = db.Column(db.String(50), nullable=False, default='system')  # invoice_overdue, low_stock, approval, ...
+    link = db.Column(db.String(200))
+
+    # Record that produced the notification, used to avoid repeating it
+    source_type = db.Column(db.String(50))
+    source_id = db.Column(db.Integer)
+
+    read = db.Column(db.Boolean, nullable=False, default=False)
+    read_at = db.Column(db.DateTime)
+
+    user = db.relationship('User', backref=db.backref('notifications', lazy='dynamic'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'message': self.message,
+            'type': self.type,
+            'category': self.category,
+            'link': self.link,
+            'read': self.read,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<Notification {self.id} User:{self.user_id} {self.category}>'
+
+class NotificationCounter(BaseModel):
+    """Unread notification count per user, kept in step with every insert and mark-read"""
+    __tablename__ = 'notification_counters'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<NotificationCounter User:{self.user_id} {self.unread}>'
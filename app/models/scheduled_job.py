@@ -0,0 +1,15 @@
+from app.core.extensions import db
+from app.models.base import BaseModel
+
+class ScheduledJobState(BaseModel):
+    """Last run and progress watermark of an in-process scheduled job, shared by every worker"""
+    __tablename__ = 'scheduled_job_states'
+
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    last_run_at = db.Column(db.DateTime)
+    # First value the next run still has to examine (e.g. the first due date not yet swept)
+    watermark = db.Column(db.Date)
+    last_count = db.Column(db.Integer, default=0)
+
+    def __repr__(self):
+        return f'<ScheduledJobState {self.name} watermark:{self.watermark}>'
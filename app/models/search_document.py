@@ -0,0 +1,45 @@
+from sqlalchemy import DDL, event
+from app.core.extensions import db
+from app.models.base import BaseModel
+
+class SearchDocument(BaseModel):
+    """One searchable record per indexed entity, kept in sync by ORM events in app.main.search"""
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_documents_entity'),
+    )
+
+    entity_type = db.Column(db.String(30), nullable=False)  # customer, product, invoice, ...
+    entity_id = db.Column(db.Integer, nullable=False)
+    module = db.Column(db.String(30), nullable=False)  # used for permission filtering
+    title = db.Column(db.String(200), nullable=False)
+    subtitle = db.Column(db.String(300))
+    body = db.Column(db.Text)
+    url = db.Column(db.String(200), nullable=False)
+
+    def __repr__(self):
+        return f'<SearchDocument {self.entity_type}:{self.entity_id}>'
+
+# On SQLite the documents are indexed by an external-content FTS5 table that
+# triggers keep in step with search_documents; other databases fall back to LIKE
+_search_fts_ddl = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5("
+    "title, body, content='search_documents', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    # Title matches weigh ten times more than body matches when ranking by BM25
+    "INSERT INTO search_documents_fts(search_documents_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO search_documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+for statement in _search_fts_ddl:
+    event.listen(SearchDocument.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(SearchDocument.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS search_documents_fts').execute_if(dialect='sqlite'))
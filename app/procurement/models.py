@@ -1,8 +1,9 @@
 from app.core.extensions import db
 from app.models.base import BaseModel
+from app.core.sequences import next_document_number
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import event
+from sqlalchemy import event, inspect
 
 class SupplierCategory(BaseModel):
     __tablename__ = 'supplier_categories'
@@ -152,6 +153,7 @@ class PurchaseOrder(BaseModel):
     supplier_id = db.Column(db.Integer, db.ForeignKey('suppliers.id'), nullable=False)
     buyer_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     requisition_id = db.Column(db.Integer, db.ForeignKey('purchase_requisitions.id'))
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), index=True)  # charged to this project
     
     # Dates
     order_date = db.Column(db.Date, nullable=False, default=date.today)
@@ -183,6 +185,7 @@ class PurchaseOrder(BaseModel):
     supplier = db.relationship('Supplier', backref='purchase_orders')
     buyer = db.relationship('User', backref='purchase_orders')
     requisition = db.relationship('PurchaseRequisition', backref='purchase_orders')
+    project = db.relationship('Project', backref='purchase_orders')
 
     def calculate_totals(self):
         """Calculate order totals"""
@@ -326,35 +329,40 @@ class SupplierEvaluation(BaseModel):
 @event.listens_for(Supplier, 'before_insert')
 def generate_supplier_code(mapper, connection, target):
     if not target.supplier_code:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(supplier_code, 5) AS INTEGER)) FROM suppliers WHERE supplier_code LIKE 'SUPP%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.supplier_code = f"SUPP{next_num:06d}"
+        target.supplier_code = next_document_number(connection, 'SUPP', Supplier.__table__.c.supplier_code)
 
 @event.listens_for(PurchaseRequisition, 'before_insert')
 def generate_requisition_number(mapper, connection, target):
     if not target.requisition_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(requisition_number, 3) AS INTEGER)) FROM purchase_requisitions WHERE requisition_number LIKE 'PR%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.requisition_number = f"PR{next_num:06d}"
+        target.requisition_number = next_document_number(connection, 'PR', PurchaseRequisition.__table__.c.requisition_number)
 
 @event.listens_for(PurchaseOrder, 'before_insert')
 def generate_po_number(mapper, connection, target):
     if not target.po_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(po_number, 3) AS INTEGER)) FROM purchase_orders WHERE po_number LIKE 'PO%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.po_number = f"PO{next_num:06d}"
+        target.po_number = next_document_number(connection, 'PO', PurchaseOrder.__table__.c.po_number)
 
 @event.listens_for(GoodsReceipt, 'before_insert')
 def generate_receipt_number(mapper, connection, target):
     if not target.receipt_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(receipt_number, 3) AS INTEGER)) FROM goods_receipts WHERE receipt_number LIKE 'GR%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.receipt_number = f"GR{next_num:06d}"
\ No newline at end of file
+        target.receipt_number = next_document_number(connection, 'GR', GoodsReceipt.__table__.c.receipt_number)
+
+# Purchase orders charged to a project count towards its cost ledger once confirmed
+_PROJECT_COST_FIELDS = ('project_id', 'total_amount', 'status', 'is_deleted')
+
+@event.listens_for(PurchaseOrder, 'after_insert')
+def apply_purchase_order_cost(mapper, connection, target):
+    from app.projects.services import ProjectCostService
+    ProjectCostService.apply_purchase_order(connection, target)
+
+@event.listens_for(PurchaseOrder, 'before_update')
+def reapply_purchase_order_cost(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _PROJECT_COST_FIELDS):
+        from app.projects.services import ProjectCostService
+        ProjectCostService.reverse_stored_purchase_order(connection, target.id)
+        ProjectCostService.apply_purchase_order(connection, target)
+
+@event.listens_for(PurchaseOrder, 'before_delete')
+def reverse_purchase_order_cost(mapper, connection, target):
+    from app.projects.services import ProjectCostService
+    ProjectCostService.reverse_stored_purchase_order(connection, target.id)
@@ -4,4 +4,5 @@ bp = Blueprint('projects', __name__)
 
 # Import models to register them with SQLAlchemy
 from app.projects import models
-from app.projects import routes
\ No newline at end of file
+from app.projects import routes
+from app.projects import commands
\ No newline at end of file
@@ -0,0 +1,266 @@
+import threading
+import time
+from datetime import date, timedelta
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import inspect, select, or_
+from app.core.cache import on_commit
+from app.core.extensions import db
+from app.models.user import User
+from app.projects.models import Project, ProjectResource
+from app.projects.services import CLOSED_PROJECT_STATUSES, week_start
+
+projects = Project.__table__
+project_resources = ProjectResource.__table__
+users = User.__table__
+
+# Resource columns that decide where and how much a row allocates
+ALLOCATION_FIELDS = ('user_id', 'project_id', 'allocation_percentage', 'start_date', 'end_date',
+                     'is_active', 'is_deleted')
+
+BUCKETS = ('day', 'week', 'month')
+
+def _allocation(values):
+    """(user, project, percent, start, end) of a resource row, or None when it allocates nothing"""
+    user_id, project_id, percentage, start_date, end_date, is_active, is_deleted = values
+    if is_deleted or is_active is False or not user_id or not start_date:
+        return None
+    return user_id, project_id, float(100 if percentage is None else percentage), start_date, end_date
+
+def _committed(state, field):
+    """A column's value as of the last flush, before this flush's change"""
+    history = state.attrs[field].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.object, field)
+
+class CapacityWindowError(ValueError):
+    """A query range reaching outside the days the matrix keeps"""
+
+class CapacityMatrix:
+    """Allocation percentage per user and day, summed over every active project.
+
+    Rows are users (appended as they first appear) and columns are consecutive
+    days from ``origin``; open-ended assignments run to the end of the window.
+    The matrix is built with one difference-array pass and patched in place
+    by adding or taking out single resource rows.
+    """
+
+    def __init__(self, origin, days):
+        self.origin = origin
+        self.days = days
+        self.rows = {}
+        self.user_ids = []
+        self.matrix = np.zeros((0, days), dtype=np.float32)
+        self.closed_projects = set()
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def column(self, day):
+        return min(max((day - self.origin).days, 0), self.days)
+
+    def _row(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            row = self.rows[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.matrix = np.vstack([self.matrix, np.zeros((1, self.days), dtype=np.float32)])
+        return row
+
+    def load(self, allocations, closed_projects):
+        """Fill the matrix from (user, project, percent, start, end) tuples in one vectorized pass"""
+        allocations = [a for a in allocations if a is not None and a[1] not in closed_projects]
+        user_ids = list(dict.fromkeys(a[0] for a in allocations))
+        rows = {user_id: row for row, user_id in enumerate(user_ids)}
+        diff = np.zeros((len(user_ids), self.days + 1), dtype=np.float64)
+        if allocations:
+            row_index = np.array([rows[a[0]] for a in allocations])
+            percentages = np.array([a[2] for a in allocations])
+            starts = np.array([self.column(a[3]) for a in allocations])
+            ends = np.array([self.column(a[4] + timedelta(days=1)) if a[4] else self.days for a in allocations])
+            np.add.at(diff, (row_index, starts), percentages)
+            np.add.at(diff, (row_index, ends), -percentages)
+        with self._lock:
+            self.user_ids, self.rows = user_ids, rows
+            self.matrix = np.cumsum(diff, axis=1)[:, :self.days].astype(np.float32)
+            self.closed_projects = set(closed_projects)
+
+    def add(self, allocation, sign=1):
+        """Add (+1) or take out (-1) one resource row's allocation"""
+        if allocation is None or allocation[1] in self.closed_projects:
+            return
+        user_id, project_id, percentage, start_date, end_date = allocation
+        start = self.column(start_date)
+        end = self.column(end_date + timedelta(days=1)) if end_date else self.days
+        if start >= end:
+            return
+        with self._lock:
+            row = self._row(user_id)
+            self.matrix[row, start:end] += sign * percentage
+
+    def window(self, date_from, date_to):
+        """Column range [start, end) of a date range; raises CapacityWindowError outside the matrix"""
+        last = self.origin + timedelta(days=self.days - 1)
+        if date_from < self.origin or date_to > last:
+            raise CapacityWindowError(f'Capacity is only available from {self.origin.isoformat()} '
+                                      f'to {last.isoformat()}')
+        return self.column(date_from), self.column(date_to + timedelta(days=1))
+
+    def over_allocations(self, date_from, date_to, threshold=100.0):
+        """Users above ``threshold`` percent on any day of the range, worst first"""
+        start, end = self.window(date_from, date_to)
+        if end <= start:
+            return []
+        with self._lock:
+            block = self.matrix[:, start:end]
+            over = block > threshold + 1e-6
+            counts = over.sum(axis=1)
+            peaks = block.max(axis=1)
+            first = over.argmax(axis=1)
+            user_ids = list(self.user_ids)
+        result = [{
+            'user_id': user_ids[row],
+            'peak_allocation': round(float(peaks[row]), 2),
+            'days_over': int(counts[row]),
+            'first_day': (self.origin + timedelta(days=start + int(first[row]))).isoformat(),
+        } for row in np.flatnonzero(counts)]
+        return sorted(result, key=lambda item: (-item['peak_allocation'], -item['days_over']))
+
+    def available(self, date_from, date_to, percentage, user_ids=None):
+        """Users (of ``user_ids``, default everyone allocated) with ``percentage`` free every day of the range"""
+        start, end = self.window(date_from, date_to)
+        with self._lock:
+            peaks = self.matrix[:, start:end].max(axis=1) if end > start else np.zeros(len(self.user_ids))
+            rows = dict(self.rows)
+        candidates = user_ids if user_ids is not None else list(rows)
+        result = []
+        for user_id in candidates:
+            row = rows.get(user_id)
+            peak = float(peaks[row]) if row is not None else 0.0
+            if peak + percentage <= 100.0 + 1e-6:
+                result.append({'user_id': user_id, 'peak_allocation': round(peak, 2),
+                               'available_percentage': round(100.0 - peak, 2)})
+        return result
+
+    def heatmap(self, date_from, date_to, bucket='week'):
+        """Peak allocation per user and day, week or month of the range, for users allocated in it"""
+        start, end = self.window(date_from, date_to)
+        days = [self.origin + timedelta(days=column) for column in range(start, end)]
+        if bucket == 'week':
+            keys = [week_start(day) for day in days]
+        elif bucket == 'month':
+            keys = [day.replace(day=1) for day in days]
+        else:
+            keys = days
+        offsets = [i for i, key in enumerate(keys) if i == 0 or key != keys[i - 1]]
+        with self._lock:
+            block = self.matrix[:, start:end]
+            allocated = np.flatnonzero(block.any(axis=1)) if end > start else np.zeros(0, dtype=np.int64)
+            values = (np.maximum.reduceat(block[allocated], offsets, axis=1)
+                      if offsets and allocated.size else np.zeros((allocated.size, len(offsets))))
+            user_ids = [self.user_ids[row] for row in allocated]
+        return {
+            'periods': [keys[i].isoformat() for i in offsets],
+            'user_ids': user_ids,
+            'values': np.round(values, 1).tolist(),
+        }
+
+class CapacityService:
+    """Over-allocation, availability and heatmap queries over the per-process capacity matrix"""
+
+    @staticmethod
+    def build():
+        config = current_app.config
+        origin = date.today() - timedelta(days=config.get('CAPACITY_PAST_DAYS', 31))
+        days = config.get('CAPACITY_PAST_DAYS', 31) + config.get('CAPACITY_FUTURE_DAYS', 366)
+        matrix = CapacityMatrix(origin, days)
+        closed = db.session.execute(
+            select(projects.c.id).where(or_(projects.c.is_deleted == True,
+                                            projects.c.status.in_(CLOSED_PROJECT_STATUSES)))
+        ).scalars().all()
+        rows = db.session.execute(
+            select(*[project_resources.c[field] for field in ALLOCATION_FIELDS])
+            .where(project_resources.c.is_deleted == False, project_resources.c.is_active == True,
+                   or_(project_resources.c.end_date == None, project_resources.c.end_date >= origin))
+        )
+        matrix.load((_allocation(row) for row in rows), closed)
+        return matrix
+
+    @staticmethod
+    def matrix():
+        """The current app's matrix, rebuilt every CAPACITY_REBUILD_SECONDS and when the day rolls over"""
+        matrix = current_app.extensions.get('capacity_matrix')
+        stale = matrix is None or time.monotonic() - matrix.built_at > current_app.config.get(
+            'CAPACITY_REBUILD_SECONDS', 300)
+        if stale or matrix.origin != date.today() - timedelta(days=current_app.config.get('CAPACITY_PAST_DAYS', 31)):
+            matrix = current_app.extensions['capacity_matrix'] = CapacityService.build()
+        return matrix
+
+    @staticmethod
+    def user_names(user_ids):
+        rows = db.session.execute(
+            select(users.c.id, users.c.first_name, users.c.last_name, users.c.username)
+            .where(users.c.id.in_(user_ids))
+        ).all()
+        return {row.id: ' '.join(part for part in (row.first_name, row.last_name) if part) or row.username
+                for row in rows}
+
+    @staticmethod
+    def over_allocations(date_from, date_to, threshold=100.0):
+        result = CapacityService.matrix().over_allocations(date_from, date_to, threshold)
+        names = CapacityService.user_names([item['user_id'] for item in result])
+        for item in result:
+            item['name'] = names.get(item['user_id'])
+        return result
+
+    @staticmethod
+    def available(date_from, date_to, percentage, user_ids=None):
+        """Active users who can take on ``percentage`` more for the whole range"""
+        if user_ids is None:
+            user_ids = db.session.execute(
+                select(users.c.id).where(users.c.is_active == True, users.c.is_deleted == False)
+            ).scalars().all()
+        result = CapacityService.matrix().available(date_from, date_to, percentage, user_ids)
+        names = CapacityService.user_names([item['user_id'] for item in result])
+        for item in result:
+            item['name'] = names.get(item['user_id'])
+        return result
+
+    @staticmethod
+    def heatmap(date_from, date_to, bucket='week'):
+        heatmap = CapacityService.matrix().heatmap(date_from, date_to, bucket)
+        names = CapacityService.user_names(heatmap['user_ids'])
+        heatmap['users'] = [{'id': user_id, 'name': names.get(user_id)} for user_id in heatmap.pop('user_ids')]
+        return heatmap
+
+# Patch this process's matrix once the transaction that changed resource rows commits;
+# a project opening or closing changes which rows count, so the matrix is rebuilt instead
+def _collect_capacity_changes(session, obj, pending):
+    state = inspect(obj)
+    if isinstance(obj, ProjectResource):
+        if obj in session.dirty and not any(state.attrs[field].history.has_changes()
+                                            for field in ALLOCATION_FIELDS):
+            return
+        before = None if obj in session.new else _allocation([_committed(state, f) for f in ALLOCATION_FIELDS])
+        after = None if obj in session.deleted else _allocation([getattr(obj, f) for f in ALLOCATION_FIELDS])
+        pending.setdefault('changes', []).append((before, after))
+    elif obj not in session.new:
+        if state.attrs.status.history.has_changes() or state.attrs.is_deleted.history.has_changes():
+            pending['stale'] = True
+
+def _apply_capacity_changes(pending):
+    if not has_app_context():
+        return
+    matrix = current_app.extensions.get('capacity_matrix')
+    if matrix is None:
+        return
+    if pending.get('stale'):
+        current_app.extensions.pop('capacity_matrix', None)
+        return
+    for before, after in pending.get('changes', ()):
+        matrix.add(before, -1)
+        matrix.add(after, 1)
+
+on_commit('capacity_changes', (ProjectResource, Project), _collect_capacity_changes, _apply_capacity_changes)
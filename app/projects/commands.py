@@ -0,0 +1,36 @@
+import click
+from app.projects import bp
+from app.projects.services import TimeRollupService, ProjectCostService, TaskTreeService
+from app.projects.documents import DocumentService
+
+@bp.cli.command('rebuild-time-summaries')
+def rebuild_time_summaries():
+    """Rebuild the per-project, user and week time summaries from time entries."""
+    count = TimeRollupService.rebuild()
+    click.echo(f"Rebuilt {count} time summaries")
+
+@bp.cli.command('rebuild-cost-ledgers')
+def rebuild_cost_ledgers():
+    """Rebuild project cost ledgers and actual_cost from expenses, time entries and purchase orders."""
+    count = ProjectCostService.rebuild()
+    click.echo(f"Rebuilt cost ledgers for {count} projects")
+
+@bp.cli.command('rebuild-task-closures')
+def rebuild_task_closures():
+    """Rebuild the task hierarchy closure table from parent task links."""
+    count = TaskTreeService.rebuild()
+    click.echo(f"Rebuilt {count} task closure rows")
+
+@bp.cli.command('collect-document-blobs')
+def collect_document_blobs():
+    """Delete stored document content that no document version refers to."""
+    count = DocumentService.collect_garbage()
+    click.echo(f"Removed {count} unreferenced document blobs")
+
+@bp.cli.command('backfill-document-versions')
+def backfill_document_versions():
+    """Import documents uploaded before versioning into the content store as their first version."""
+    imported, missing = DocumentService.backfill()
+    click.echo(f"Imported {imported} documents")
+    if missing:
+        click.echo(f"Skipped {len(missing)} documents whose file is missing: {', '.join(map(str, missing))}")
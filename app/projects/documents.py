@@ -0,0 +1,178 @@
+import mimetypes
+import os
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete, exists, func, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+from app.core.extensions import db
+from app.core.schema import backfill
+from app.core.storage import get_document_store
+from app.core.utils import allowed_file
+from app.models.document_blob import DocumentBlob
+from app.projects.models import ProjectDocument, ProjectDocumentVersion
+
+document_blobs = DocumentBlob.__table__
+document_versions = ProjectDocumentVersion.__table__
+
+# Uploads that lose a race for a blob row or version number are recorded again up to this many times
+UPLOAD_ATTEMPTS = 3
+
+class DocumentService:
+    """Project documents over the content-addressed store; versions reference shared blobs"""
+
+    @staticmethod
+    def allowed(filename):
+        return allowed_file(filename, current_app.config.get('DOCUMENT_EXTENSIONS', set()))
+
+    @staticmethod
+    def upload(project_id, file, user_id, name=None, description=None, document=None):
+        """Store an upload as a new document, or as the next version of ``document``.
+
+        Content already stored is not written again, and re-uploading a
+        document's current content does not add a version. Concurrent uploads
+        of the same blob or of versions of one document are retried. Returns
+        the document and the version holding the content.
+        """
+        file_name = secure_filename(file.filename) or 'document'
+        sha256, size, created = get_document_store().put(file.stream)
+        for attempt in range(UPLOAD_ATTEMPTS):
+            try:
+                return DocumentService._record(project_id, sha256, size, file_name, file.mimetype or None, user_id,
+                                               name, description, document)
+            except IntegrityError:
+                # Another upload inserted the same blob or version number first; rollback expires
+                # ``document``, so the next attempt sees its committed versions
+                db.session.rollback()
+                if attempt == UPLOAD_ATTEMPTS - 1:
+                    raise
+
+    @staticmethod
+    def _record(project_id, sha256, size, file_name, content_type, user_id, name, description, document):
+        # Touching an existing blob row keeps garbage collection off it until this version is recorded
+        if not db.session.execute(update(document_blobs).where(document_blobs.c.sha256 == sha256)
+                                  .values(updated_at=datetime.utcnow())).rowcount:
+            db.session.add(DocumentBlob(sha256=sha256, size=size))
+
+        if document is not None and document.sha256 == sha256:
+            return document, DocumentService.version(document)
+
+        number = 1
+        if document is not None:
+            number += db.session.query(func.coalesce(func.max(document_versions.c.version_number), 0)).filter(
+                document_versions.c.document_id == document.id).scalar()
+        else:
+            document = ProjectDocument(project_id=project_id, name=name or os.path.splitext(file_name)[0],
+                                       description=description)
+            db.session.add(document)
+        document.file_path = get_document_store().relative_path(sha256)
+        document.file_size = size
+        document.file_type = file_name.rsplit('.', 1)[1].lower() if '.' in file_name else None
+        document.sha256 = sha256
+        document.uploaded_by_id = user_id
+        document.version = f'{number}.0'
+        version = ProjectDocumentVersion(document=document, version_number=number, sha256=sha256,
+                                         file_name=file_name, file_size=size,
+                                         content_type=content_type, uploaded_by_id=user_id)
+        db.session.add(version)
+        db.session.commit()
+        return document, version
+
+    @staticmethod
+    def version(document, number=None):
+        """A document's version by number, or its latest"""
+        query = ProjectDocumentVersion.query.filter_by(document_id=document.id, is_deleted=False)
+        if number is not None:
+            return query.filter_by(version_number=number).first()
+        return query.order_by(ProjectDocumentVersion.version_number.desc()).first()
+
+    @staticmethod
+    def send(version, as_attachment=True):
+        return get_document_store().send(version.sha256, version.file_name, version.content_type, as_attachment)
+
+    @staticmethod
+    def to_dict(document):
+        return {
+            'id': document.id,
+            'name': document.name,
+            'description': document.description,
+            'file_type': document.file_type,
+            'file_size': document.file_size,
+            'version': document.version,
+            'sha256': document.sha256,
+            'versions': [{
+                'version_number': version.version_number,
+                'file_name': version.file_name,
+                'file_size': version.file_size,
+                'content_type': version.content_type,
+                'sha256': version.sha256,
+                'uploaded_by_id': version.uploaded_by_id,
+                'uploaded_at': version.created_at.isoformat(),
+            } for version in document.versions if not version.is_deleted],
+        }
+
+    @staticmethod
+    def collect_garbage(grace=None):
+        """Delete blobs no document version has referred to for ``grace`` seconds; returns how many were removed.
+
+        Deduplicated uploads touch the stored file before they record their
+        version, so a blob an upload is still being attached to is kept.
+        """
+        if grace is None:
+            grace = current_app.config.get('DOCUMENT_GC_GRACE_SECONDS', 3600)
+        cutoff = datetime.utcnow() - timedelta(seconds=grace)
+        referenced = exists().where(document_versions.c.sha256 == document_blobs.c.sha256)
+        orphans = db.session.execute(
+            select(document_blobs.c.sha256).where(~referenced, document_blobs.c.updated_at < cutoff)
+        ).scalars().all()
+        if orphans:
+            db.session.execute(delete(document_blobs).where(document_blobs.c.sha256.in_(orphans)))
+        db.session.commit()
+        store = get_document_store()
+        for sha256 in orphans:
+            store.delete(sha256, older_than=grace)
+        return len(orphans)
+
+    @staticmethod
+    def _legacy_path(file_path):
+        """Where a document stored before the content store keeps its file, or None"""
+        root = os.path.normpath(os.path.join(current_app.root_path, '..'))
+        candidates = [file_path] if os.path.isabs(file_path) else [
+            os.path.join(root, current_app.config.get('UPLOAD_FOLDER', 'uploads'), file_path),
+            os.path.join(root, file_path),
+        ]
+        return next((path for path in candidates if os.path.isfile(path)), None)
+
+    @staticmethod
+    def backfill():
+        """Import documents uploaded before versioning (sha256 NULL) into the store as version 1.
+
+        Returns (imported, missing) where missing lists the ids of documents whose file is gone.
+        """
+        store = get_document_store()
+        imported, missing = 0, []
+        for document in ProjectDocument.query.filter(ProjectDocument.sha256 == None).all():
+            path = DocumentService._legacy_path(document.file_path or '')
+            if path is None:
+                missing.append(document.id)
+                continue
+            with open(path, 'rb') as stream:
+                sha256, size, created = store.put(stream)
+            if not db.session.query(exists().where(document_blobs.c.sha256 == sha256)).scalar():
+                db.session.add(DocumentBlob(sha256=sha256, size=size))
+                db.session.flush()
+            file_name = os.path.basename(path)
+            if not document.versions:
+                db.session.add(ProjectDocumentVersion(
+                    document=document, version_number=1, sha256=sha256, file_name=file_name, file_size=size,
+                    content_type=mimetypes.guess_type(file_name)[0], uploaded_by_id=document.uploaded_by_id))
+            document.file_path = store.relative_path(sha256)
+            document.file_size = size
+            document.sha256 = sha256
+            db.session.commit()
+            imported += 1
+        return imported, missing
+
+@backfill('project_documents')
+def backfill_documents():
+    return DocumentService.backfill()
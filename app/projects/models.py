@@ -1,8 +1,10 @@
 from app.core.extensions import db
 from app.models.base import BaseModel
+from app.core.sequences import next_document_number
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import event
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
 
 class ProjectCategory(BaseModel):
     __tablename__ = 'project_categories'
@@ -79,11 +81,9 @@ class Project(BaseModel):
         return date.today() > self.end_date and self.status not in ['completed', 'cancelled']
 
     def calculate_progress(self):
-        """Calculate progress based on completed tasks"""
-        if self.tasks:
-            completed_tasks = len([task for task in self.tasks if task.status == 'completed'])
-            total_tasks = len(self.tasks)
-            self.progress_percentage = (completed_tasks / total_tasks) * 100 if total_tasks > 0 else 0
+        """Calculate progress from leaf tasks weighted by estimated hours, at any depth"""
+        from app.projects.services import TaskTreeService
+        self.progress_percentage = TaskTreeService.project_progress(self.id)
 
     def __repr__(self):
         return f'<Project {self.project_code}: {self.name}>'
@@ -139,6 +139,9 @@ class ProjectTask(BaseModel):
 
 class TimeEntry(BaseModel):
     __tablename__ = 'time_entries'
+    __table_args__ = (
+        db.Index('ix_time_entries_project_date', 'project_id', 'date'),
+    )
     
     # Entry Information
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
@@ -175,6 +178,82 @@ class TimeEntry(BaseModel):
     def __repr__(self):
         return f'<TimeEntry {self.user_id}: {self.hours}h on {self.date}>'
 
+class ProjectTaskClosure(BaseModel):
+    """Every ancestor/descendant pair of the task hierarchy, including each task with itself at depth 0"""
+    __tablename__ = 'project_task_closures'
+    __table_args__ = (
+        db.UniqueConstraint('ancestor_id', 'descendant_id', name='uq_project_task_closures_pair'),
+        db.Index('ix_project_task_closures_descendant', 'descendant_id', 'depth'),
+    )
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('project_tasks.id'), nullable=False)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('project_tasks.id'), nullable=False)
+    depth = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<ProjectTaskClosure {self.ancestor_id}->{self.descendant_id} ({self.depth})>'
+
+class ProjectTaskDependency(BaseModel):
+    """Finish-to-start link: the successor may start lag_days after the predecessor finishes"""
+    __tablename__ = 'project_task_dependencies'
+    __table_args__ = (
+        db.UniqueConstraint('predecessor_id', 'successor_id', name='uq_project_task_dependencies_pair'),
+        db.Index('ix_project_task_dependencies_project', 'project_id'),
+        db.Index('ix_project_task_dependencies_successor', 'successor_id'),
+    )
+
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    predecessor_id = db.Column(db.Integer, db.ForeignKey('project_tasks.id'), nullable=False)
+    successor_id = db.Column(db.Integer, db.ForeignKey('project_tasks.id'), nullable=False)
+    lag_days = db.Column(db.Integer, nullable=False, default=0)
+
+    # Relationships
+    project = db.relationship('Project', backref='task_dependencies')
+    predecessor = db.relationship('ProjectTask', foreign_keys=[predecessor_id], backref='successor_links')
+    successor = db.relationship('ProjectTask', foreign_keys=[successor_id], backref='predecessor_links')
+
+    def __repr__(self):
+        return f'<ProjectTaskDependency {self.predecessor_id}->{self.successor_id} (+{self.lag_days}d)>'
+
+class ProjectTimeSummary(BaseModel):
+    """Logged hours per project, user and ISO week, kept in step with time entries"""
+    __tablename__ = 'project_time_summaries'
+    __table_args__ = (
+        db.UniqueConstraint('project_id', 'user_id', 'week_start', name='uq_project_time_summaries_key'),
+    )
+
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)  # Monday of the ISO week
+
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    hours = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    billable_hours = db.Column(db.Numeric(10, 2), nullable=False, default=0)
+    billable_amount = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ProjectTimeSummary Project:{self.project_id} User:{self.user_id} {self.week_start}>'
+
+class ProjectCostLedger(BaseModel):
+    """Running project spend by source; projects.actual_cost is kept equal to its total"""
+    __tablename__ = 'project_cost_ledgers'
+
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, unique=True)
+
+    expense_cost = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # approved project expenses
+    labor_hours = db.Column(db.Numeric(10, 2), nullable=False, default=0)  # billable hours
+    labor_cost = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # billable hours x resource rate
+    purchase_cost = db.Column(db.Numeric(15, 2), nullable=False, default=0)  # confirmed and received POs
+
+    project = db.relationship('Project', backref=db.backref('cost_ledger', uselist=False))
+
+    @property
+    def total_cost(self):
+        return self.expense_cost + self.labor_cost + self.purchase_cost
+
+    def __repr__(self):
+        return f'<ProjectCostLedger Project:{self.project_id} {self.total_cost}>'
+
 class ProjectMilestone(BaseModel):
     __tablename__ = 'project_milestones'
     
@@ -232,10 +311,11 @@ class ProjectDocument(BaseModel):
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     
-    # File Information
+    # File Information (mirrors the current version)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer)
     file_type = db.Column(db.String(50))
+    sha256 = db.Column(db.String(64), db.ForeignKey('document_blobs.sha256'))
     
     # Metadata
     uploaded_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -248,6 +328,29 @@ class ProjectDocument(BaseModel):
     def __repr__(self):
         return f'<ProjectDocument {self.name} (Project: {self.project_id})>'
 
+class ProjectDocumentVersion(BaseModel):
+    """One uploaded revision of a document, pointing at its content blob"""
+    __tablename__ = 'project_document_versions'
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'version_number', name='uq_project_document_versions_number'),
+        db.Index('ix_project_document_versions_sha256', 'sha256'),
+    )
+
+    document_id = db.Column(db.Integer, db.ForeignKey('project_documents.id'), nullable=False)
+    version_number = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), db.ForeignKey('document_blobs.sha256'), nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(100))
+    uploaded_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+
+    # Relationships
+    document = db.relationship('ProjectDocument', backref=db.backref('versions', order_by='ProjectDocumentVersion.version_number'))
+    uploaded_by = db.relationship('User')
+
+    def __repr__(self):
+        return f'<ProjectDocumentVersion {self.document_id} v{self.version_number}>'
+
 class ProjectExpense(BaseModel):
     __tablename__ = 'project_expenses'
     
@@ -287,8 +390,117 @@ class ProjectExpense(BaseModel):
 @event.listens_for(Project, 'before_insert')
 def generate_project_code(mapper, connection, target):
     if not target.project_code:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(project_code, 5) AS INTEGER)) FROM projects WHERE project_code LIKE 'PROJ%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.project_code = f"PROJ{next_num:06d}"
\ No newline at end of file
+        target.project_code = next_document_number(connection, 'PROJ', Project.__table__.c.project_code)
+
+# Approval notifications
+def _notify_project_expense_approval(connection, target):
+    from app.main.services import NotificationService
+    manager_id = connection.execute(
+        select(Project.__table__.c.manager_id).where(Project.__table__.c.id == target.project_id)).scalar()
+    NotificationService.notify_approval(
+        connection, 'project_expense', target.id, target.status, target.submitted_by_id, [manager_id],
+        f'Project expense "{target.description}"', link=f'/projects/{target.project_id}/expenses')
+
+@event.listens_for(ProjectExpense, 'after_insert')
+def notify_project_expense_submitted(mapper, connection, target):
+    _notify_project_expense_approval(connection, target)
+
+@event.listens_for(ProjectExpense, 'after_update')
+def notify_project_expense_status(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        _notify_project_expense_approval(connection, target)
+
+# Keep project_time_summaries in step with time entries
+_TIME_SUMMARY_FIELDS = ('project_id', 'user_id', 'date', 'hours', 'is_billable', 'billable_amount', 'is_deleted')
+
+@event.listens_for(TimeEntry, 'after_insert')
+def apply_time_entry(mapper, connection, target):
+    from app.projects.services import TimeRollupService
+    TimeRollupService.apply_entry(connection, target)
+
+@event.listens_for(TimeEntry, 'before_update')
+def reapply_time_entry(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _TIME_SUMMARY_FIELDS):
+        from app.projects.services import TimeRollupService
+        TimeRollupService.reverse_stored(connection, target.id)
+        TimeRollupService.apply_entry(connection, target)
+
+@event.listens_for(TimeEntry, 'before_delete')
+def reverse_time_entry(mapper, connection, target):
+    from app.projects.services import TimeRollupService
+    TimeRollupService.reverse_stored(connection, target.id)
+
+# Keep project_cost_ledgers and projects.actual_cost in step with expenses and resource rates;
+# labor cost follows time entries through TimeRollupService.apply
+_EXPENSE_COST_FIELDS = ('project_id', 'amount', 'status', 'is_deleted')
+_RESOURCE_RATE_FIELDS = ('project_id', 'user_id', 'hourly_rate', 'start_date', 'is_active', 'is_deleted')
+
+@event.listens_for(ProjectExpense, 'after_insert')
+def apply_project_expense_cost(mapper, connection, target):
+    from app.projects.services import ProjectCostService
+    ProjectCostService.apply_expense(connection, target)
+
+@event.listens_for(ProjectExpense, 'before_update')
+def reapply_project_expense_cost(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in _EXPENSE_COST_FIELDS):
+        from app.projects.services import ProjectCostService
+        ProjectCostService.reverse_stored_expense(connection, target.id)
+        ProjectCostService.apply_expense(connection, target)
+
+@event.listens_for(ProjectExpense, 'before_delete')
+def reverse_project_expense_cost(mapper, connection, target):
+    from app.projects.services import ProjectCostService
+    ProjectCostService.reverse_stored_expense(connection, target.id)
+
+def _resource_projects(target):
+    """Projects whose labor rates a resource change can affect, before and after it"""
+    old_project = inspect(target).attrs.project_id.history.deleted
+    return {target.project_id, old_project[0] if old_project else target.project_id}
+
+@event.listens_for(Session, 'after_flush')
+def reprice_resource_labor(session, flush_context):
+    # Once per flush rather than per row: mapper events run for a whole batch of rows before and
+    # after its statements, so per-row repricing would count a user's hours once for every row
+    project_ids = set()
+    for target in session.new | session.deleted:
+        if isinstance(target, ProjectResource):
+            project_ids |= _resource_projects(target)
+    for target in session.dirty:
+        if isinstance(target, ProjectResource) and any(
+                inspect(target).attrs[field].history.has_changes() for field in _RESOURCE_RATE_FIELDS):
+            project_ids |= _resource_projects(target)
+    project_ids.discard(None)
+    if project_ids:
+        from app.projects.services import ProjectCostService
+        ProjectCostService.reprice_labor(session.connection(), sorted(project_ids))
+
+# Keep project_task_closures in step with the parent_task_id adjacency list
+@event.listens_for(ProjectTask, 'after_insert')
+def add_task_closure(mapper, connection, target):
+    from app.projects.services import TaskTreeService
+    TaskTreeService.insert_node(connection, target.id, target.parent_task_id)
+
+@event.listens_for(ProjectTask, 'before_update')
+def check_task_move(mapper, connection, target):
+    if inspect(target).attrs.parent_task_id.history.has_changes():
+        from app.projects.services import TaskTreeService
+        TaskTreeService.check_move(connection, target.id, target.parent_task_id)
+
+@event.listens_for(ProjectTask, 'after_update')
+def move_task_closure(mapper, connection, target):
+    if inspect(target).attrs.parent_task_id.history.has_changes():
+        from app.projects.services import TaskTreeService
+        TaskTreeService.move_node(connection, target.id, target.parent_task_id)
+
+@event.listens_for(ProjectTask, 'before_delete')
+def remove_task_closure(mapper, connection, target):
+    from app.projects.services import TaskTreeService
+    TaskTreeService.remove_node(connection, target.id)
+
+@event.listens_for(ProjectTaskDependency, 'before_insert')
+@event.listens_for(ProjectTaskDependency, 'before_update')
+def check_task_dependency(mapper, connection, target):
+    from app.projects.scheduling import ScheduleService
+    ScheduleService.check_dependency(connection, target)
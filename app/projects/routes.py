@@ -1,36 +1,55 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import login_required, current_user
 from app.projects import bp
 from app.projects.models import (
     Project, ProjectCategory, ProjectTask, TimeEntry, 
-    ProjectMilestone, ProjectResource, ProjectDocument, ProjectExpense
+    ProjectMilestone, ProjectResource, ProjectDocument, ProjectExpense, ProjectTaskDependency
 )
+from app.projects.services import TimeRollupService, ProjectStatsService, TaskTreeService, ProjectSnapshotService
+from app.projects.scheduling import ScheduleService, CycleError
+from app.projects.capacity import CapacityService, CapacityWindowError, BUCKETS
+from app.projects.documents import DocumentService
 from app.sales.models import Customer
 from app.models.user import User
 from app.core.extensions import db
-from datetime import datetime, date
+from app.core.export import export_response, stream_query
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date, timedelta
 from decimal import Decimal
 
 @bp.route('/')
 @login_required
 def index():
     """Project dashboard with overview statistics"""
-    projects = Project.query.filter_by(is_deleted=False).all()
-    
-    # Calculate statistics
-    active_projects = len([p for p in projects if p.status == 'active'])
-    completed_projects = len([p for p in projects if p.status == 'completed'])
-    overdue_projects = len([p for p in projects if p.end_date < date.today() and p.status not in ['completed', 'cancelled']])
+    # Counts come from one grouped query, cached for PROJECT_STATS_CACHE_TTL seconds
+    stats = ProjectStatsService.stats()
     
     # Get recent projects
-    recent_projects = Project.query.filter_by(is_deleted=False).order_by(Project.created_at.desc()).limit(10).all()
+    recent_projects = (Project.query.options(joinedload(Project.manager))
+                       .filter_by(is_deleted=False).order_by(Project.created_at.desc()).limit(10).all())
     
     return render_template('projects/index.html', 
                          projects=recent_projects,
-                         active_count=active_projects,
-                         completed_count=completed_projects,
-                         overdue_count=overdue_projects,
-                         total_projects=len(projects))
+                         stats=stats,
+                         active_count=stats['active'],
+                         completed_count=stats['completed'],
+                         overdue_count=stats['overdue'],
+                         total_projects=stats['total'])
+
+def _project_list_query(status_filter='', category_filter='', search=''):
+    """Projects matching the list filters, shared by the paginated view and its export"""
+    query = Project.query.filter_by(is_deleted=False)
+    
+    if status_filter:
+        query = query.filter(Project.status == status_filter)
+    if category_filter:
+        query = query.filter(Project.category_id == category_filter)
+    if search:
+        query = query.filter(Project.name.contains(search))
+    
+    return query
 
 @bp.route('/list')
 @login_required
@@ -41,14 +60,21 @@ def project_list():
     category_filter = request.args.get('category', '')
     search = request.args.get('search', '')
     
-    query = Project.query.filter_by(is_deleted=False)
-    
-    if status_filter:
-        query = query.filter(Project.status == status_filter)
-    if category_filter:
-        query = query.filter(Project.category_id == category_filter)
-    if search:
-        query = query.filter(Project.name.contains(search))
+    query = _project_list_query(status_filter, category_filter, search)
+    
+    export = export_response(
+        request.args.get('export'), 'projects',
+        ['Code', 'Name', 'Category', 'Client', 'Status', 'Priority', 'Start Date', 'End Date',
+         'Budget', 'Actual Cost', 'Progress %'],
+        stream_query(
+            query.outerjoin(ProjectCategory, ProjectCategory.id == Project.category_id)
+            .outerjoin(Customer, Customer.id == Project.client_id)
+            .with_entities(Project.project_code, Project.name, ProjectCategory.name, Customer.company_name,
+                           Project.status, Project.priority, Project.start_date, Project.end_date,
+                           Project.budget, Project.actual_cost, Project.progress_percentage)
+            .order_by(Project.created_at.desc(), Project.id)))
+    if export:
+        return export
     
     projects = query.order_by(Project.created_at.desc()).paginate(
         page=page, per_page=20, error_out=False)
@@ -68,13 +94,8 @@ def create_project():
     """Create new project"""
     if request.method == 'POST':
         try:
-            # Generate project code
-            last_project = Project.query.order_by(Project.id.desc()).first()
-            next_number = (last_project.id + 1) if last_project else 1
-            project_code = f"PROJ{next_number:06d}"
-            
+            # project_code is allocated from the PROJ sequence on insert
             project = Project(
-                project_code=project_code,
                 name=request.form['name'],
                 description=request.form.get('description', ''),
                 category_id=request.form.get('category_id') or None,
@@ -98,45 +119,31 @@ def create_project():
             db.session.rollback()
             flash(f'Error creating project: {str(e)}', 'error')
     
+    # Managers and clients are picked through the /api/typeahead endpoints
     categories = ProjectCategory.query.filter_by(is_deleted=False).all()
-    managers = User.query.filter_by(is_active=True).all()
-    clients = Customer.query.filter_by(is_deleted=False).all()
     
     return render_template('projects/create.html',
-                         categories=categories,
-                         managers=managers,
-                         clients=clients)
+                         categories=categories)
 
 @bp.route('/<int:id>')
 @login_required
 def project_detail(id):
     """Project detail view with tasks, milestones, and progress"""
-    project = Project.query.get_or_404(id)
-    
-    # Get project tasks
-    tasks = ProjectTask.query.filter_by(project_id=id, is_deleted=False).all()
-    
-    # Get project milestones
-    milestones = ProjectMilestone.query.filter_by(project_id=id, is_deleted=False).order_by(ProjectMilestone.due_date).all()
-    
-    # Get recent time entries
-    recent_time_entries = TimeEntry.query.filter_by(project_id=id, is_deleted=False).order_by(TimeEntry.date.desc()).limit(10).all()
-    
-    # Get project resources
-    resources = ProjectResource.query.filter_by(project_id=id, is_deleted=False).all()
+    snapshot = ProjectSnapshotService.load(id)
+    if snapshot is None:
+        abort(404)
     
-    # Calculate progress statistics
-    total_tasks = len(tasks)
-    completed_tasks = len([t for t in tasks if t.status == 'completed'])
-    progress_percentage = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
+    return render_template('projects/detail.html', date=date, **snapshot)
+
+@bp.route('/<int:id>/snapshot')
+@login_required
+def project_snapshot(id):
+    """The project detail graph as JSON"""
+    snapshot = ProjectSnapshotService.load(id)
+    if snapshot is None:
+        return jsonify({'error': 'Project not found'}), 404
     
-    return render_template('projects/detail.html',
-                         project=project,
-                         tasks=tasks,
-                         milestones=milestones,
-                         time_entries=recent_time_entries,
-                         resources=resources,
-                         progress_percentage=progress_percentage)
+    return jsonify(ProjectSnapshotService.to_dict(snapshot))
 
 @bp.route('/<int:id>/tasks')
 @login_required
@@ -158,6 +165,19 @@ def project_tasks(id):
     if assignee_filter:
         query = query.filter(ProjectTask.assigned_to_id == assignee_filter)
     
+    export = export_response(
+        request.args.get('export'), f'{project.project_code}_tasks',
+        ['Task', 'Status', 'Priority', 'Assigned To', 'Start Date', 'Due Date', 'Completed Date',
+         'Estimated Hours', 'Actual Hours', 'Progress %'],
+        stream_query(
+            query.outerjoin(User, User.id == ProjectTask.assigned_to_id)
+            .with_entities(ProjectTask.name, ProjectTask.status, ProjectTask.priority, User.username,
+                           ProjectTask.start_date, ProjectTask.due_date, ProjectTask.completed_date,
+                           ProjectTask.estimated_hours, ProjectTask.actual_hours, ProjectTask.progress_percentage)
+            .order_by(ProjectTask.priority.desc(), ProjectTask.due_date, ProjectTask.id)))
+    if export:
+        return export
+    
     tasks = query.order_by(ProjectTask.priority.desc(), ProjectTask.due_date).paginate(
         page=page, per_page=20, error_out=False)
     
@@ -171,6 +191,78 @@ def project_tasks(id):
                          priority_filter=priority_filter,
                          assignee_filter=assignee_filter)
 
+@bp.route('/<int:id>/task-rollups')
+@login_required
+def task_rollups(id):
+    """Subtree hours and weighted progress for every task of a project as JSON"""
+    project = Project.query.get_or_404(id)
+    
+    return jsonify({
+        'project_id': project.id,
+        'progress': TaskTreeService.project_progress(project.id),
+        'tasks': [dict(rollup, task_id=task_id)
+                  for task_id, rollup in TaskTreeService.project_rollups(project.id).items()],
+    })
+
+@bp.route('/tasks/<int:task_id>/subtree')
+@login_required
+def task_subtree(task_id):
+    """A task with all its subtasks, nested, plus the subtree rollup as JSON"""
+    tree = TaskTreeService.subtree(task_id)
+    if tree is None:
+        return jsonify({'error': 'Task not found'}), 404
+    
+    return jsonify(dict(tree, rollup=TaskTreeService.subtree_rollup(task_id)))
+
+@bp.route('/<int:id>/schedule')
+@login_required
+def project_schedule(id):
+    """Earliest and latest task dates, slack and the critical path as JSON"""
+    try:
+        schedule = ScheduleService.schedule(id)
+    except CycleError as e:
+        return jsonify({'error': str(e), 'task_ids': e.nodes}), 409
+    if schedule is None:
+        return jsonify({'error': 'Project not found'}), 404
+    
+    return jsonify(schedule)
+
+@bp.route('/tasks/<int:task_id>/dependencies', methods=['POST'])
+@login_required
+def add_task_dependency(task_id):
+    """Make a task start only after another task of the same project finishes"""
+    task = ProjectTask.query.get_or_404(task_id)
+    data = request.get_json(silent=True) or request.form.to_dict()
+    try:
+        predecessor_id = int(data.get('predecessor_id'))
+        lag_days = int(data.get('lag_days') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'predecessor_id and lag_days must be integers'}), 400
+    
+    dependency = ProjectTaskDependency(predecessor_id=predecessor_id, successor_id=task.id, lag_days=lag_days)
+    db.session.add(dependency)
+    try:
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'These tasks are already linked'}), 409
+    
+    return jsonify({'id': dependency.id, 'predecessor_id': dependency.predecessor_id,
+                    'successor_id': dependency.successor_id, 'lag_days': dependency.lag_days}), 201
+
+@bp.route('/dependencies/<int:id>', methods=['DELETE'])
+@login_required
+def remove_task_dependency(id):
+    """Remove a task dependency"""
+    dependency = ProjectTaskDependency.query.get_or_404(id)
+    db.session.delete(dependency)
+    db.session.commit()
+    
+    return jsonify({'success': True})
+
 @bp.route('/<int:id>/time-entries')
 @login_required
 def project_time_entries(id):
@@ -183,20 +275,36 @@ def project_time_entries(id):
     user_filter = request.args.get('user', '')
     
     query = TimeEntry.query.filter_by(project_id=id, is_deleted=False)
+    start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+    end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
     
-    if date_from:
-        query = query.filter(TimeEntry.date >= datetime.strptime(date_from, '%Y-%m-%d').date())
-    if date_to:
-        query = query.filter(TimeEntry.date <= datetime.strptime(date_to, '%Y-%m-%d').date())
+    if start:
+        query = query.filter(TimeEntry.date >= start)
+    if end:
+        query = query.filter(TimeEntry.date <= end)
     if user_filter:
         query = query.filter(TimeEntry.user_id == user_filter)
     
+    export = export_response(
+        request.args.get('export'), f'{project.project_code}_time_entries',
+        ['Date', 'User', 'Task', 'Hours', 'Billable', 'Hourly Rate', 'Billable Amount', 'Status'],
+        stream_query(
+            query.outerjoin(User, User.id == TimeEntry.user_id)
+            .outerjoin(ProjectTask, ProjectTask.id == TimeEntry.task_id)
+            .with_entities(TimeEntry.date, User.username, ProjectTask.name, TimeEntry.hours,
+                           TimeEntry.is_billable, TimeEntry.hourly_rate, TimeEntry.billable_amount,
+                           TimeEntry.status)
+            .order_by(TimeEntry.date.desc(), TimeEntry.id)))
+    if export:
+        return export
+    
     time_entries = query.order_by(TimeEntry.date.desc()).paginate(
         page=page, per_page=20, error_out=False)
     
-    # Calculate totals
-    total_hours = sum([entry.hours for entry in query.all()])
-    billable_hours = sum([entry.hours for entry in query.all() if entry.is_billable])
+    # Totals come from the weekly summaries plus at most two partial weeks of entries
+    totals = TimeRollupService.totals(id, start, end, user_id=user_filter or None)
+    total_hours = totals['hours']
+    billable_hours = totals['billable_hours']
     
     team_members = User.query.filter_by(is_active=True).all()
     
@@ -210,6 +318,84 @@ def project_time_entries(id):
                          date_to=date_to,
                          user_filter=user_filter)
 
+@bp.route('/<int:id>/timesheet-summary')
+@login_required
+def timesheet_summary(id):
+    """Project hours by user, ISO week and task as JSON"""
+    project = Project.query.get_or_404(id)
+    
+    try:
+        start = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date() if request.args.get('date_from') else None
+        end = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() if request.args.get('date_to') else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD'}), 400
+    
+    return jsonify(TimeRollupService.timesheet_summary(project.id, start, end,
+                                                       user_id=request.args.get('user', type=int)))
+
+def _capacity_range(default_days):
+    """date_from/date_to query arguments, defaulting to today and ``default_days`` ahead"""
+    start = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date() if request.args.get('date_from') else date.today()
+    end = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() if request.args.get('date_to') else start + timedelta(days=default_days)
+    if end < start:
+        raise ValueError
+    return start, end
+
+@bp.route('/capacity/heatmap')
+@login_required
+def capacity_heatmap():
+    """Peak allocation per user and day, week or month across all active projects as JSON"""
+    bucket = request.args.get('bucket', 'week')
+    if bucket not in BUCKETS:
+        return jsonify({'error': f'bucket must be one of {", ".join(BUCKETS)}'}), 400
+    try:
+        start, end = _capacity_range(365)
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD, date_from first'}), 400
+    
+    try:
+        heatmap = CapacityService.heatmap(start, end, bucket)
+    except CapacityWindowError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(dict(heatmap, date_from=start.isoformat(), date_to=end.isoformat(), bucket=bucket))
+
+@bp.route('/capacity/over-allocations')
+@login_required
+def capacity_over_allocations():
+    """Users allocated above a threshold (default 100%) on any day of the range as JSON"""
+    try:
+        start, end = _capacity_range(30)
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD, date_from first'}), 400
+    
+    threshold = request.args.get('threshold', 100.0, type=float)
+    try:
+        users = CapacityService.over_allocations(start, end, threshold)
+    except CapacityWindowError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'date_from': start.isoformat(), 'date_to': end.isoformat(), 'threshold': threshold,
+                    'users': users})
+
+@bp.route('/capacity/availability')
+@login_required
+def capacity_availability():
+    """Active users with at least the requested percentage free on every day of the range as JSON"""
+    try:
+        start, end = _capacity_range(30)
+    except ValueError:
+        return jsonify({'error': 'Dates must be formatted as YYYY-MM-DD, date_from first'}), 400
+    
+    percentage = request.args.get('percentage', 50.0, type=float)
+    try:
+        users = CapacityService.available(start, end, percentage)
+    except CapacityWindowError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'date_from': start.isoformat(), 'date_to': end.isoformat(), 'percentage': percentage,
+                    'users': users})
+
 @bp.route('/<int:id>/milestones')
 @login_required
 def project_milestones(id):
@@ -256,6 +442,53 @@ def project_documents(id):
                          project=project,
                          documents=documents)
 
+@bp.route('/<int:id>/documents/upload', methods=['POST'])
+@login_required
+def upload_document(id):
+    """Upload a new document, or a new version of one with document_id"""
+    project = Project.query.get_or_404(id)
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    if not DocumentService.allowed(file.filename):
+        return jsonify({'error': 'This file type is not allowed'}), 400
+    
+    document = None
+    if request.form.get('document_id'):
+        document = ProjectDocument.query.filter_by(id=request.form.get('document_id', type=int),
+                                                   project_id=project.id, is_deleted=False).first_or_404()
+    document, version = DocumentService.upload(project.id, file, current_user.id,
+                                               name=request.form.get('name'),
+                                               description=request.form.get('description'),
+                                               document=document)
+    return jsonify(DocumentService.to_dict(document)), 201
+
+@bp.route('/documents/<int:document_id>/download')
+@login_required
+def download_document(document_id):
+    """Download a document's latest version, or ?version=n; supports Range requests"""
+    document = ProjectDocument.query.filter_by(id=document_id, is_deleted=False).first_or_404()
+    version = DocumentService.version(document, request.args.get('version', type=int))
+    if version is None:
+        return jsonify({'error': 'Version not found'}), 404
+    
+    return DocumentService.send(version, as_attachment=request.args.get('inline') != '1')
+
+@bp.route('/documents/<int:document_id>/versions')
+@login_required
+def document_versions(document_id):
+    """A document with its version history as JSON"""
+    document = ProjectDocument.query.filter_by(id=document_id, is_deleted=False).first_or_404()
+    return jsonify(DocumentService.to_dict(document))
+
+@bp.route('/documents/<int:document_id>/delete', methods=['POST'])
+@login_required
+def delete_document(document_id):
+    """Soft delete a document; its content is kept until no version refers to it"""
+    document = ProjectDocument.query.filter_by(id=document_id, is_deleted=False).first_or_404()
+    document.soft_delete()
+    return jsonify({'success': True})
+
 @bp.route('/<int:id>/expenses')
 @login_required
 def project_expenses(id):
@@ -270,12 +503,25 @@ def project_expenses(id):
     if status_filter:
         query = query.filter(ProjectExpense.status == status_filter)
     
+    export = export_response(
+        request.args.get('export'), f'{project.project_code}_expenses',
+        ['Date', 'Category', 'Amount', 'Billable', 'Markup %', 'Billable Amount', 'Status'],
+        stream_query(
+            query.with_entities(ProjectExpense.expense_date, ProjectExpense.category, ProjectExpense.amount,
+                                ProjectExpense.is_billable, ProjectExpense.markup_percentage,
+                                ProjectExpense.billable_amount, ProjectExpense.status)
+            .order_by(ProjectExpense.expense_date.desc(), ProjectExpense.id)))
+    if export:
+        return export
+    
     expenses = query.order_by(ProjectExpense.expense_date.desc()).paginate(
         page=page, per_page=20, error_out=False)
     
-    # Calculate totals
-    total_expenses = sum([exp.amount for exp in query.all()])
-    approved_expenses = sum([exp.amount for exp in query.all() if exp.status == 'approved'])
+    # Totals in one aggregate query
+    total_expenses, approved_expenses = query.with_entities(
+        func.coalesce(func.sum(ProjectExpense.amount), 0),
+        func.coalesce(func.sum(ProjectExpense.amount).filter(ProjectExpense.status == 'approved'), 0)
+    ).one()
     
     return render_template('projects/expenses.html',
                          project=project,
@@ -0,0 +1,227 @@
+import math
+import threading
+import time
+from datetime import date
+from flask import current_app, has_app_context
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import aliased
+from app.core.critical_path import CriticalPath, CycleError
+from app.core.cache import on_commit
+from app.core.extensions import db
+from app.projects.models import Project, ProjectTask, ProjectTaskDependency
+
+projects = Project.__table__
+tasks = ProjectTask.__table__
+dependencies = ProjectTaskDependency.__table__
+
+# Task columns that feed a task's duration or release on the schedule
+SCHEDULE_FIELDS = ('start_date', 'due_date', 'estimated_hours', 'status')
+
+def task_duration(start_date, due_date, estimated_hours, status, hours_per_day=8):
+    """Days a task occupies: its planned date span, else its estimate; cancelled tasks take none"""
+    if status == 'cancelled':
+        return 0
+    if start_date and due_date and due_date >= start_date:
+        return (due_date - start_date).days + 1
+    if estimated_hours:
+        return max(1, math.ceil(float(estimated_hours) / hours_per_day))
+    return 1
+
+class ProjectSchedule:
+    """One project's task network as a CriticalPath plus the task id <-> node mapping.
+
+    Days are offsets from the project start date; a task's own start date is a
+    start-no-earlier-than constraint.
+    """
+
+    def __init__(self, project_id, start_date, task_ids, durations, releases, links):
+        self.project_id = project_id
+        self.start_date = start_date
+        self.task_ids = task_ids
+        self.nodes = {task_id: node for node, task_id in enumerate(task_ids)}
+        predecessors, successors, lags = zip(*links) if links else ((), (), ())
+        try:
+            self.network = CriticalPath(durations, releases, predecessors, successors, lags)
+        except CycleError as e:
+            # Links committed concurrently on another connection can close a cycle the insert check missed
+            raise CycleError(str(e), [task_ids[node] for node in e.nodes]) from None
+        self.built_at = time.monotonic()
+
+    def release(self, start_date):
+        return max(0, (start_date - self.start_date).days) if start_date else 0
+
+    def update_task(self, task_id, values, hours_per_day):
+        """Re-time one task from its SCHEDULE_FIELDS values; returns the number of tasks recomputed"""
+        node = self.nodes.get(task_id)
+        if node is None:
+            return 0
+        start_date, due_date, estimated_hours, status = values
+        return self.network.update(node,
+                                   duration=task_duration(start_date, due_date, estimated_hours, status, hours_per_day),
+                                   release=self.release(start_date))
+
+class ProjectSchedules:
+    """Per-process schedules, built on first use and re-timed from committed task changes.
+
+    Structural changes (tasks added or removed, links edited, project moved)
+    drop a project's schedule so the next read rebuilds it; other processes'
+    commits are picked up by rebuilding every SCHEDULE_REBUILD_SECONDS.
+    """
+
+    def __init__(self, rebuild_seconds, hours_per_day):
+        self.rebuild_seconds = rebuild_seconds
+        self.hours_per_day = hours_per_day
+        self._schedules = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_id):
+        schedule = self._schedules.get(project_id)
+        if schedule is None or time.monotonic() - schedule.built_at > self.rebuild_seconds:
+            with self._lock:
+                schedule = self._schedules.get(project_id)
+                if schedule is None or time.monotonic() - schedule.built_at > self.rebuild_seconds:
+                    schedule = ScheduleService.build(project_id, self.hours_per_day)
+                    self._schedules[project_id] = schedule
+        return schedule
+
+    def apply(self, stale, changes):
+        """Drop ``stale`` project ids, then re-time {(project id, task id): values} in built schedules"""
+        for project_id in stale:
+            self._schedules.pop(project_id, None)
+        for (project_id, task_id), values in changes.items():
+            schedule = self._schedules.get(project_id)
+            if schedule is not None:
+                schedule.update_task(task_id, values, self.hours_per_day)
+
+def get_project_schedules():
+    schedules = current_app.extensions.get('project_schedules')
+    if schedules is None:
+        schedules = ProjectSchedules(current_app.config.get('SCHEDULE_REBUILD_SECONDS', 300),
+                                     current_app.config.get('SCHEDULE_HOURS_PER_DAY', 8))
+        current_app.extensions['project_schedules'] = schedules
+    return schedules
+
+class ScheduleService:
+    """Finish-to-start task scheduling: earliest/latest dates, slack and the critical path"""
+
+    @staticmethod
+    def check_dependency(connection, target):
+        """Refuse self links, links across projects and links that would close a cycle"""
+        if target.predecessor_id == target.successor_id:
+            raise ValueError('A task cannot depend on itself')
+        project_ids = dict(connection.execute(
+            select(tasks.c.id, tasks.c.project_id)
+            .where(tasks.c.id.in_([target.predecessor_id, target.successor_id]), tasks.c.is_deleted == False)
+        ).all())
+        if len(project_ids) != 2 or len(set(project_ids.values())) != 1:
+            raise ValueError('Dependent tasks must exist and belong to the same project')
+        target.project_id = project_ids[target.predecessor_id]
+
+        # Walk forward from the successor; reaching the predecessor means the new link closes a loop
+        reachable = (select(dependencies.c.successor_id.label('task_id'))
+                     .where(dependencies.c.predecessor_id == target.successor_id,
+                            dependencies.c.is_deleted == False, dependencies.c.id != target.id)
+                     .cte('reachable', recursive=True))
+        link = aliased(dependencies)
+        reachable = reachable.union(
+            select(link.c.successor_id)
+            .join(reachable, link.c.predecessor_id == reachable.c.task_id)
+            .where(link.c.is_deleted == False, link.c.id != target.id))
+        if connection.execute(select(reachable.c.task_id)
+                              .where(reachable.c.task_id == target.predecessor_id).limit(1)).first():
+            raise ValueError('This dependency would create a cycle')
+
+    @staticmethod
+    def build(project_id, hours_per_day=8):
+        """Load a project's live tasks and links in two queries and schedule them"""
+        start_date = db.session.execute(select(projects.c.start_date).where(projects.c.id == project_id)).scalar()
+        if start_date is None:
+            return None
+        rows = db.session.execute(
+            select(tasks.c.id, *[tasks.c[field] for field in SCHEDULE_FIELDS])
+            .where(tasks.c.project_id == project_id, tasks.c.is_deleted == False)
+            .order_by(tasks.c.id)
+        ).all()
+        task_ids = [row.id for row in rows]
+        nodes = {task_id: node for node, task_id in enumerate(task_ids)}
+        links = [(nodes[row.predecessor_id], nodes[row.successor_id], row.lag_days or 0) for row in db.session.execute(
+            select(dependencies.c.predecessor_id, dependencies.c.successor_id, dependencies.c.lag_days)
+            .where(dependencies.c.project_id == project_id, dependencies.c.is_deleted == False)
+        ) if row.predecessor_id in nodes and row.successor_id in nodes]
+        durations = [task_duration(row.start_date, row.due_date, row.estimated_hours, row.status, hours_per_day)
+                     for row in rows]
+        releases = [max(0, (row.start_date - start_date).days) if row.start_date else 0 for row in rows]
+        return ProjectSchedule(project_id, start_date, task_ids, durations, releases, links)
+
+    @staticmethod
+    def schedule(project_id):
+        """The project's schedule as JSON-ready dicts, or None when the project does not exist"""
+        schedule = get_project_schedules().get(project_id)
+        if schedule is None:
+            return None
+        early_start, early_finish, late_start, late_finish, finish = schedule.network.snapshot()
+        base = schedule.start_date.toordinal()
+
+        def day(offset):
+            return date.fromordinal(base + int(offset)).isoformat()
+
+        # Finishes are exclusive offsets; report the last working day, or the start for zero-length tasks
+        last_early = early_finish - (early_finish > early_start)
+        last_late = late_finish - (late_finish > late_start)
+        slack = late_start - early_start
+        details = {row.id: row for row in db.session.execute(
+            select(tasks.c.id, tasks.c.name, tasks.c.status, tasks.c.assigned_to_id)
+            .where(tasks.c.project_id == project_id)
+        )}
+        task_list = []
+        for node, task_id in enumerate(schedule.task_ids):
+            row = details.get(task_id)
+            task_list.append({
+                'id': task_id,
+                'name': row.name if row else None,
+                'status': row.status if row else None,
+                'assigned_to_id': row.assigned_to_id if row else None,
+                'duration': int(early_finish[node] - early_start[node]),
+                'early_start': day(early_start[node]),
+                'early_finish': day(last_early[node]),
+                'late_start': day(late_start[node]),
+                'late_finish': day(last_late[node]),
+                'slack': int(slack[node]),
+                'critical': bool(slack[node] == 0),
+            })
+        order = schedule.network.order
+        return {
+            'project_id': project_id,
+            'start_date': schedule.start_date.isoformat(),
+            'finish_date': day(max(finish - 1, 0)),
+            'duration_days': finish,
+            'critical_path': [schedule.task_ids[node] for node in order[slack[order] == 0].tolist()],
+            'tasks': task_list,
+        }
+
+# Re-time or drop cached schedules once the transaction that changed their tasks commits
+def _collect_schedule_changes(session, obj, pending):
+    stale = pending.setdefault('stale', set())
+    if isinstance(obj, ProjectTaskDependency):
+        stale.add(obj.project_id)
+        stale.update(inspect(obj).attrs.project_id.history.deleted)
+    elif isinstance(obj, Project):
+        if obj in session.new or inspect(obj).attrs.start_date.history.has_changes():
+            stale.add(obj.id)
+    else:
+        state = inspect(obj)
+        moved = state.attrs.project_id.history
+        if obj in session.new or obj in session.deleted or moved.has_changes() or \
+                state.attrs.is_deleted.history.has_changes():
+            stale.add(obj.project_id)
+            stale.update(moved.deleted)
+        elif any(state.attrs[field].history.has_changes() for field in SCHEDULE_FIELDS):
+            pending.setdefault('changes', {})[(obj.project_id, obj.id)] = \
+                tuple(getattr(obj, field) for field in SCHEDULE_FIELDS)
+
+def _apply_schedule_changes(pending):
+    if (pending.get('stale') or pending.get('changes')) and has_app_context():
+        get_project_schedules().apply(pending.get('stale', ()), pending.get('changes', {}))
+
+on_commit('schedule_changes', (ProjectTaskDependency, Project, ProjectTask),
+          _collect_schedule_changes, _apply_schedule_changes)
@@ -0,0 +1,662 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import select, update, delete, insert, func, case, or_, exists, literal, true, bindparam
+from sqlalchemy.orm import joinedload, selectinload
+from app.core.cache import TTLCache, invalidate_on_commit
+from app.core.extensions import db
+from app.core.schema import backfill
+from app.core.sql import increment
+from app.models.user import User
+from app.procurement.models import PurchaseOrder
+from app.projects.models import (
+    Project, ProjectCategory, TimeEntry, ProjectTask, ProjectTaskClosure, ProjectTimeSummary, ProjectCostLedger,
+    ProjectExpense, ProjectResource, ProjectMilestone
+)
+
+# Purchase orders that commit project spend; drafts and sent orders can still change, cancelled never count
+COMMITTED_PO_STATUSES = ('confirmed', 'received')
+# Projects that can no longer become overdue
+CLOSED_PROJECT_STATUSES = ('completed', 'cancelled')
+
+project_stats_cache = TTLCache()
+
+projects = Project.__table__
+time_entries = TimeEntry.__table__
+time_summaries = ProjectTimeSummary.__table__
+cost_ledgers = ProjectCostLedger.__table__
+project_expenses = ProjectExpense.__table__
+project_resources = ProjectResource.__table__
+purchase_orders = PurchaseOrder.__table__
+tasks = ProjectTask.__table__
+task_closures = ProjectTaskClosure.__table__
+categories = ProjectCategory.__table__
+users = User.__table__
+
+def week_start(day):
+    """Monday of the ISO week containing ``day``"""
+    return day - timedelta(days=day.weekday())
+
+def _iso_week(day):
+    year, week, _ = day.isocalendar()
+    return f'{year}-W{week:02d}'
+
+def _measures(row):
+    return {
+        'entries': row.entry_count,
+        'hours': float(row.hours or 0),
+        'billable_hours': float(row.billable_hours or 0),
+        'billable_amount': float(row.billable_amount or 0),
+    }
+
+def _summary_measures():
+    return [func.coalesce(func.sum(time_summaries.c.entry_count), 0).label('entry_count'),
+            func.coalesce(func.sum(time_summaries.c.hours), 0).label('hours'),
+            func.coalesce(func.sum(time_summaries.c.billable_hours), 0).label('billable_hours'),
+            func.coalesce(func.sum(time_summaries.c.billable_amount), 0).label('billable_amount')]
+
+def _entry_measures():
+    billable = time_entries.c.is_billable == True
+    return [func.count(time_entries.c.id).label('entry_count'),
+            func.coalesce(func.sum(time_entries.c.hours), 0).label('hours'),
+            func.coalesce(func.sum(time_entries.c.hours).filter(billable), 0).label('billable_hours'),
+            func.coalesce(func.sum(time_entries.c.billable_amount).filter(billable), 0).label('billable_amount')]
+
+class TimeRollupService:
+    """Project time totals from project_time_summaries, with SQL aggregates for partial weeks"""
+
+    @staticmethod
+    def apply(connection, project_id, user_id, day, hours, is_billable, billable_amount, sign=1):
+        """Add (or with ``sign=-1`` remove) one entry's hours to its (project, user, week) summary"""
+        hours = Decimal(hours or 0)
+        increment(connection, time_summaries,
+                  {'project_id': project_id, 'user_id': user_id, 'week_start': week_start(day)},
+                  {'entry_count': sign,
+                   'hours': sign * hours,
+                   'billable_hours': sign * hours if is_billable else 0,
+                   'billable_amount': sign * Decimal(billable_amount or 0) if is_billable else 0})
+        if is_billable:
+            ProjectCostService.apply_labor(connection, project_id, user_id, sign * hours)
+
+    @staticmethod
+    def apply_entry(connection, entry):
+        if not entry.is_deleted:
+            TimeRollupService.apply(connection, entry.project_id, entry.user_id, entry.date, entry.hours,
+                                    entry.is_billable, entry.billable_amount)
+
+    @staticmethod
+    def reverse_stored(connection, entry_id):
+        """Undo the effect of a time entry as it is currently stored"""
+        row = connection.execute(select(time_entries).where(time_entries.c.id == entry_id)).first()
+        if row and not row.is_deleted:
+            TimeRollupService.apply(connection, row.project_id, row.user_id, row.date, row.hours,
+                                    row.is_billable, row.billable_amount, sign=-1)
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """Recompute project_time_summaries from time entries"""
+        connection = db.session.connection()
+        connection.execute(delete(time_summaries))
+        rows = connection.execute(
+            select(time_entries.c.project_id, time_entries.c.user_id, time_entries.c.date, *_entry_measures())
+            .where(time_entries.c.is_deleted == False)
+            .group_by(time_entries.c.project_id, time_entries.c.user_id, time_entries.c.date)
+            .execution_options(yield_per=batch_size)
+        )
+        weeks = {}
+        for row in rows:
+            key = (row.project_id, row.user_id, week_start(row.date))
+            totals = weeks.setdefault(key, [0, Decimal(0), Decimal(0), Decimal(0)])
+            totals[0] += row.entry_count
+            totals[1] += Decimal(row.hours)
+            totals[2] += Decimal(row.billable_hours)
+            totals[3] += Decimal(row.billable_amount)
+        values = [{
+            'project_id': project_id, 'user_id': user_id, 'week_start': week,
+            'entry_count': totals[0], 'hours': totals[1], 'billable_hours': totals[2], 'billable_amount': totals[3],
+        } for (project_id, user_id, week), totals in weeks.items()]
+        for start in range(0, len(values), batch_size):
+            connection.execute(insert(time_summaries), values[start:start + batch_size])
+        db.session.commit()
+        return len(values)
+
+    @staticmethod
+    def totals(project_id, date_from=None, date_to=None, user_id=None):
+        """Entry count, hours, billable hours and amount for a project over an optional date range.
+
+        Whole ISO weeks inside the range are read from the summary table; only the
+        partial weeks at either end are aggregated from the time entries themselves.
+        """
+        first_week = week_start(date_from) if date_from else None
+        if date_from and first_week != date_from:
+            first_week += timedelta(days=7)
+        last_week = week_start(date_to) if date_to else None
+        if date_to and date_to.weekday() != 6:
+            last_week -= timedelta(days=7)
+
+        totals = {'entries': 0, 'hours': 0.0, 'billable_hours': 0.0, 'billable_amount': 0.0}
+
+        def add(row):
+            for name, value in _measures(row).items():
+                totals[name] += value
+
+        entry_filters = [time_entries.c.project_id == project_id, time_entries.c.is_deleted == False]
+        if user_id:
+            entry_filters.append(time_entries.c.user_id == user_id)
+
+        if first_week and last_week and first_week > last_week:
+            # Less than one whole week: aggregate the entries directly
+            add(db.session.execute(select(*_entry_measures()).where(
+                *entry_filters, time_entries.c.date >= date_from, time_entries.c.date <= date_to)).one())
+            return totals
+
+        summary_filters = [time_summaries.c.project_id == project_id]
+        if user_id:
+            summary_filters.append(time_summaries.c.user_id == user_id)
+        if first_week:
+            summary_filters.append(time_summaries.c.week_start >= first_week)
+        if last_week:
+            summary_filters.append(time_summaries.c.week_start <= last_week)
+        add(db.session.execute(select(*_summary_measures()).where(*summary_filters)).one())
+
+        edges = []
+        if date_from and date_from < first_week:
+            edges.append(time_entries.c.date.between(date_from, first_week - timedelta(days=1)))
+        if date_to and date_to > last_week + timedelta(days=6):
+            edges.append(time_entries.c.date.between(last_week + timedelta(days=7), date_to))
+        if edges:
+            add(db.session.execute(select(*_entry_measures()).where(*entry_filters, or_(*edges))).one())
+        return totals
+
+    @staticmethod
+    def timesheet_summary(project_id, date_from=None, date_to=None, user_id=None):
+        """Hours by user, ISO week, user-week and task over the ISO weeks overlapping the range"""
+        first_week = week_start(date_from) if date_from else None
+        last_week = week_start(date_to) if date_to else None
+
+        summary_filters = [time_summaries.c.project_id == project_id, time_summaries.c.entry_count != 0]
+        entry_filters = [time_entries.c.project_id == project_id, time_entries.c.is_deleted == False]
+        if user_id:
+            summary_filters.append(time_summaries.c.user_id == user_id)
+            entry_filters.append(time_entries.c.user_id == user_id)
+        if first_week:
+            summary_filters.append(time_summaries.c.week_start >= first_week)
+            entry_filters.append(time_entries.c.date >= first_week)
+        if last_week:
+            summary_filters.append(time_summaries.c.week_start <= last_week)
+            entry_filters.append(time_entries.c.date <= last_week + timedelta(days=6))
+
+        user_weeks = db.session.execute(
+            select(time_summaries.c.user_id, time_summaries.c.week_start, *_summary_measures())
+            .where(*summary_filters)
+            .group_by(time_summaries.c.user_id, time_summaries.c.week_start)
+            .order_by(time_summaries.c.week_start, time_summaries.c.user_id)
+        ).all()
+        names = dict(db.session.execute(
+            select(users.c.id, func.coalesce(users.c.first_name + ' ' + users.c.last_name, users.c.username))
+            .where(users.c.id.in_({row.user_id for row in user_weeks}))
+        ).all()) if user_weeks else {}
+        task_rows = db.session.execute(
+            select(time_entries.c.task_id, tasks.c.name, *_entry_measures())
+            .select_from(time_entries.outerjoin(tasks, tasks.c.id == time_entries.c.task_id))
+            .where(*entry_filters)
+            .group_by(time_entries.c.task_id, tasks.c.name)
+            .order_by(func.sum(time_entries.c.hours).desc())
+        ).all()
+
+        def accumulate(groups, key, row, **labels):
+            group = groups.setdefault(key, dict(labels, entries=0, hours=0.0, billable_hours=0.0,
+                                                billable_amount=0.0))
+            for name, value in _measures(row).items():
+                group[name] += value
+
+        totals, by_user, by_week = {}, {}, {}
+        for row in user_weeks:
+            accumulate(totals, 'all', row)
+            accumulate(by_user, row.user_id, row, user_id=row.user_id, name=names.get(row.user_id))
+            accumulate(by_week, row.week_start, row, week_start=row.week_start.isoformat(),
+                       iso_week=_iso_week(row.week_start))
+
+        return {
+            'project_id': project_id,
+            'week_from': first_week.isoformat() if first_week else None,
+            'week_to': last_week.isoformat() if last_week else None,
+            'totals': totals.get('all', {'entries': 0, 'hours': 0.0, 'billable_hours': 0.0, 'billable_amount': 0.0}),
+            'by_user': sorted(by_user.values(), key=lambda group: -group['hours']),
+            'by_week': list(by_week.values()),
+            'by_user_week': [dict(_measures(row), user_id=row.user_id, week_start=row.week_start.isoformat(),
+                                  iso_week=_iso_week(row.week_start)) for row in user_weeks],
+            'by_task': [dict(_measures(row), task_id=row.task_id, name=row.name or 'No task')
+                        for row in task_rows],
+        }
+
+class ProjectCostService:
+    """Per-project running spend: approved expenses, billable labor at resource rates and committed POs"""
+
+    @staticmethod
+    def add(connection, project_id, expense_cost=0, labor_hours=0, labor_cost=0, purchase_cost=0):
+        """Apply signed deltas to a project's ledger and to projects.actual_cost"""
+        deltas = {name: Decimal(value) for name, value in (
+            ('expense_cost', expense_cost), ('labor_hours', labor_hours),
+            ('labor_cost', labor_cost), ('purchase_cost', purchase_cost)) if value}
+        if not project_id or not deltas:
+            return
+        increment(connection, cost_ledgers, {'project_id': project_id}, deltas)
+        cost = Decimal(expense_cost) + Decimal(labor_cost) + Decimal(purchase_cost)
+        if cost:
+            connection.execute(update(projects).where(projects.c.id == project_id)
+                               .values(actual_cost=func.coalesce(projects.c.actual_cost, 0) + cost))
+
+    @staticmethod
+    def labor_rate(connection, project_id, user_id):
+        """Hourly rate of the user's latest active resource assignment on the project"""
+        rate = connection.execute(
+            select(project_resources.c.hourly_rate)
+            .where(project_resources.c.project_id == project_id, project_resources.c.user_id == user_id,
+                   project_resources.c.is_active == True, project_resources.c.is_deleted == False)
+            .order_by(project_resources.c.start_date.desc(), project_resources.c.id.desc())
+            .limit(1)
+        ).scalar()
+        return Decimal(rate or 0)
+
+    @staticmethod
+    def apply_labor(connection, project_id, user_id, billable_hours):
+        rate = ProjectCostService.labor_rate(connection, project_id, user_id)
+        ProjectCostService.add(connection, project_id, labor_hours=billable_hours, labor_cost=billable_hours * rate)
+
+    @staticmethod
+    def reprice_labor(connection, project_ids):
+        """Set each project's labor cost to its billable hours at the current resource rates.
+
+        Used after resource rates change; adjusts projects.actual_cost by the difference.
+        """
+        for project_id in project_ids:
+            hours = connection.execute(
+                select(time_summaries.c.user_id, func.sum(time_summaries.c.billable_hours))
+                .where(time_summaries.c.project_id == project_id)
+                .group_by(time_summaries.c.user_id)
+            ).all()
+            cost = sum((Decimal(user_hours or 0) * ProjectCostService.labor_rate(connection, project_id, user_id)
+                        for user_id, user_hours in hours), Decimal(0))
+            stored = connection.execute(
+                select(cost_ledgers.c.labor_cost).where(cost_ledgers.c.project_id == project_id)).scalar()
+            ProjectCostService.add(connection, project_id, labor_cost=cost - Decimal(stored or 0))
+
+    @staticmethod
+    def apply_expense(connection, expense, sign=1):
+        if expense.status == 'approved' and not expense.is_deleted:
+            ProjectCostService.add(connection, expense.project_id, expense_cost=sign * Decimal(expense.amount or 0))
+
+    @staticmethod
+    def reverse_stored_expense(connection, expense_id):
+        row = connection.execute(select(project_expenses).where(project_expenses.c.id == expense_id)).first()
+        if row:
+            ProjectCostService.apply_expense(connection, row, sign=-1)
+
+    @staticmethod
+    def apply_purchase_order(connection, order, sign=1):
+        if order.project_id and order.status in COMMITTED_PO_STATUSES and not order.is_deleted:
+            ProjectCostService.add(connection, order.project_id,
+                                   purchase_cost=sign * Decimal(order.total_amount or 0))
+
+    @staticmethod
+    def reverse_stored_purchase_order(connection, order_id):
+        row = connection.execute(select(purchase_orders).where(purchase_orders.c.id == order_id)).first()
+        if row:
+            ProjectCostService.apply_purchase_order(connection, row, sign=-1)
+
+    @staticmethod
+    def rebuild():
+        """Recompute every project's ledger and actual_cost from its source records"""
+        connection = db.session.connection()
+        ledgers = {}
+
+        def add(project_id, name, value):
+            ledger = ledgers.setdefault(project_id, {'expense_cost': Decimal(0), 'labor_hours': Decimal(0),
+                                                     'labor_cost': Decimal(0), 'purchase_cost': Decimal(0)})
+            ledger[name] += Decimal(value or 0)
+
+        for project_id, amount in connection.execute(
+                select(project_expenses.c.project_id, func.sum(project_expenses.c.amount))
+                .where(project_expenses.c.status == 'approved', project_expenses.c.is_deleted == False)
+                .group_by(project_expenses.c.project_id)):
+            add(project_id, 'expense_cost', amount)
+        for project_id, amount in connection.execute(
+                select(purchase_orders.c.project_id, func.sum(purchase_orders.c.total_amount))
+                .where(purchase_orders.c.project_id.isnot(None), purchase_orders.c.is_deleted == False,
+                       purchase_orders.c.status.in_(COMMITTED_PO_STATUSES))
+                .group_by(purchase_orders.c.project_id)):
+            add(project_id, 'purchase_cost', amount)
+        for project_id, user_id, hours in connection.execute(
+                select(time_summaries.c.project_id, time_summaries.c.user_id, func.sum(time_summaries.c.billable_hours))
+                .group_by(time_summaries.c.project_id, time_summaries.c.user_id)
+                .having(func.sum(time_summaries.c.billable_hours) != 0)):
+            add(project_id, 'labor_hours', hours)
+            add(project_id, 'labor_cost', Decimal(hours) * ProjectCostService.labor_rate(connection, project_id, user_id))
+
+        connection.execute(delete(cost_ledgers))
+        if ledgers:
+            connection.execute(insert(cost_ledgers), [dict(ledger, project_id=project_id)
+                                                      for project_id, ledger in ledgers.items()])
+        connection.execute(update(projects).values(actual_cost=0))
+        if ledgers:
+            connection.execute(
+                update(projects).where(projects.c.id == bindparam('project_id'))
+                .values(actual_cost=bindparam('cost')),
+                [{'project_id': project_id,
+                  'cost': ledger['expense_cost'] + ledger['labor_cost'] + ledger['purchase_cost']}
+                 for project_id, ledger in ledgers.items()])
+        db.session.commit()
+        return len(ledgers)
+
+class ProjectStatsService:
+    """Landing page counts from one grouped query over projects, cached per process"""
+
+    @staticmethod
+    def stats():
+        ttl = current_app.config.get('PROJECT_STATS_CACHE_TTL', 30)
+        return project_stats_cache.get_or_set('stats', ProjectStatsService._compute, ttl)
+
+    @staticmethod
+    def _compute():
+        overdue = case((projects.c.end_date < date.today(), 1), else_=0)
+        rows = db.session.execute(
+            select(projects.c.status, projects.c.priority, projects.c.category_id, categories.c.name,
+                   func.count(projects.c.id).label('count'),
+                   func.sum(case((projects.c.status.in_(CLOSED_PROJECT_STATUSES), 0), else_=overdue)).label('overdue'))
+            .select_from(projects.outerjoin(categories, categories.c.id == projects.c.category_id))
+            .where(projects.c.is_deleted == False)
+            .group_by(projects.c.status, projects.c.priority, projects.c.category_id, categories.c.name)
+        ).all()
+
+        stats = {'total': 0, 'active': 0, 'completed': 0, 'overdue': 0,
+                 'by_status': {}, 'by_priority': {}, 'by_category': {}}
+        for row in rows:
+            stats['total'] += row.count
+            stats['overdue'] += row.overdue or 0
+            stats['by_status'][row.status] = stats['by_status'].get(row.status, 0) + row.count
+            stats['by_priority'][row.priority] = stats['by_priority'].get(row.priority, 0) + row.count
+            category = row.name or 'Uncategorized'
+            stats['by_category'][category] = stats['by_category'].get(category, 0) + row.count
+        stats['active'] = stats['by_status'].get('active', 0)
+        stats['completed'] = stats['by_status'].get('completed', 0)
+        return stats
+
+# Drop the cached counts once a transaction touching projects or their categories commits
+invalidate_on_commit('project_stats', (Project, ProjectCategory), lambda: project_stats_cache.invalidate('stats'))
+
+def _audit():
+    now = datetime.utcnow()
+    return [literal(now, db.DateTime), literal(now, db.DateTime), literal(False, db.Boolean)]
+
+_CLOSURE_COLUMNS = ['ancestor_id', 'descendant_id', 'depth', 'created_at', 'updated_at', 'is_deleted']
+
+def _leaf(task_table):
+    """Whether a task has no live subtasks"""
+    children = tasks.alias('children')
+    return ~exists().where(children.c.parent_task_id == task_table.c.id, children.c.is_deleted == False)
+
+def _rollup_columns(task_table):
+    """Subtree hours and leaf progress weighted by estimated hours (1 when unestimated); cancelled leaves are ignored"""
+    counted = _leaf(task_table) & (task_table.c.status != 'cancelled')
+    weight = case((task_table.c.estimated_hours > 0, task_table.c.estimated_hours), else_=1)
+    progress = case((task_table.c.status == 'completed', 100),
+                    else_=func.coalesce(task_table.c.progress_percentage, 0))
+    return [func.count(task_table.c.id).label('task_count'),
+            func.coalesce(func.sum(task_table.c.estimated_hours), 0).label('estimated_hours'),
+            func.coalesce(func.sum(task_table.c.actual_hours), 0).label('actual_hours'),
+            func.sum(case((counted, weight * progress), else_=0)).label('weighted_progress'),
+            func.sum(case((counted, weight), else_=0)).label('weight')]
+
+def _rollup(row):
+    estimated, actual = float(row.estimated_hours or 0), float(row.actual_hours or 0)
+    return {
+        'task_count': row.task_count,
+        'estimated_hours': estimated,
+        'actual_hours': actual,
+        'hours_variance': estimated - actual,
+        'progress': round(float(row.weighted_progress) / float(row.weight), 2) if row.weight else 0.0,
+    }
+
+class TaskTreeService:
+    """Task hierarchy over the project_task_closures closure table; every read is one query at any depth"""
+
+    @staticmethod
+    def insert_node(connection, task_id, parent_id):
+        connection.execute(task_closures.insert().from_select(
+            _CLOSURE_COLUMNS, select(literal(task_id), literal(task_id), literal(0), *_audit())))
+        if parent_id:
+            connection.execute(task_closures.insert().from_select(
+                _CLOSURE_COLUMNS,
+                select(task_closures.c.ancestor_id, literal(task_id), task_closures.c.depth + 1, *_audit())
+                .where(task_closures.c.descendant_id == parent_id)))
+
+    @staticmethod
+    def check_move(connection, task_id, new_parent_id):
+        """Refuse to move a task under itself or one of its own subtasks"""
+        if new_parent_id and connection.execute(
+                select(task_closures.c.id).where(task_closures.c.ancestor_id == task_id,
+                                                 task_closures.c.descendant_id == new_parent_id)).first():
+            raise ValueError('A task cannot be moved under itself or one of its subtasks')
+
+    @staticmethod
+    def move_node(connection, task_id, new_parent_id):
+        """Detach the task's subtree from its old ancestors and attach it below ``new_parent_id``"""
+        subtree = select(task_closures.c.descendant_id).where(task_closures.c.ancestor_id == task_id)
+        connection.execute(delete(task_closures).where(task_closures.c.descendant_id.in_(subtree),
+                                                       task_closures.c.ancestor_id.notin_(subtree)))
+        if new_parent_id:
+            above, below = task_closures.alias('above'), task_closures.alias('below')
+            connection.execute(task_closures.insert().from_select(
+                _CLOSURE_COLUMNS,
+                select(above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1, *_audit())
+                .select_from(above.join(below, true()))
+                .where(above.c.descendant_id == new_parent_id, below.c.ancestor_id == task_id)))
+
+    @staticmethod
+    def remove_node(connection, task_id):
+        connection.execute(delete(task_closures).where(
+            or_(task_closures.c.ancestor_id == task_id, task_closures.c.descendant_id == task_id)))
+
+    @staticmethod
+    def subtree(task_id):
+        """The task and all its live descendants as a nested dict, or None when it does not exist"""
+        rows = db.session.execute(
+            select(tasks.c.id, tasks.c.parent_task_id, tasks.c.name, tasks.c.status, tasks.c.priority,
+                   tasks.c.progress_percentage, tasks.c.estimated_hours, tasks.c.actual_hours,
+                   tasks.c.assigned_to_id, tasks.c.due_date, tasks.c.is_deleted, task_closures.c.depth)
+            .join(task_closures, task_closures.c.descendant_id == tasks.c.id)
+            .where(task_closures.c.ancestor_id == task_id)
+            .order_by(task_closures.c.depth, tasks.c.id)
+        ).all()
+        # Rows arrive shallowest first; a deleted task hands its subtasks to its nearest live ancestor
+        placed = {}
+        for row in rows:
+            parent = placed.get(row.parent_task_id) if row.depth else None
+            if row.is_deleted:
+                placed[row.id] = parent
+                continue
+            node = {
+                'id': row.id,
+                'name': row.name,
+                'status': row.status,
+                'priority': row.priority,
+                'progress_percentage': float(row.progress_percentage or 0),
+                'estimated_hours': float(row.estimated_hours or 0),
+                'actual_hours': float(row.actual_hours or 0),
+                'assigned_to_id': row.assigned_to_id,
+                'due_date': row.due_date.isoformat() if row.due_date else None,
+                'depth': row.depth,
+                'subtasks': [],
+            }
+            placed[row.id] = node
+            if parent is not None:
+                parent['subtasks'].append(node)
+        return placed.get(task_id)
+
+    @staticmethod
+    def subtree_rollup(task_id):
+        """Estimated vs actual hours and weighted progress for a task and everything below it"""
+        row = db.session.execute(
+            select(*_rollup_columns(tasks))
+            .join(task_closures, task_closures.c.descendant_id == tasks.c.id)
+            .where(task_closures.c.ancestor_id == task_id, tasks.c.is_deleted == False)
+        ).one()
+        return _rollup(row)
+
+    @staticmethod
+    def project_rollups(project_id):
+        """Subtree rollups for every task of a project, keyed by task id"""
+        rows = db.session.execute(
+            select(task_closures.c.ancestor_id, *_rollup_columns(tasks))
+            .join(task_closures, task_closures.c.descendant_id == tasks.c.id)
+            .where(tasks.c.project_id == project_id, tasks.c.is_deleted == False)
+            .group_by(task_closures.c.ancestor_id)
+        ).all()
+        return {row.ancestor_id: _rollup(row) for row in rows}
+
+    @staticmethod
+    def project_progress(project_id):
+        """Project progress from its leaf tasks at any depth, weighted by estimated hours"""
+        row = db.session.execute(
+            select(*_rollup_columns(tasks)).where(tasks.c.project_id == project_id, tasks.c.is_deleted == False)
+        ).one()
+        return _rollup(row)['progress']
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """Recreate project_task_closures from the parent_task_id links"""
+        connection = db.session.connection()
+        parents = dict(connection.execute(select(tasks.c.id, tasks.c.parent_task_id)).all())
+        now = datetime.utcnow()
+        values = []
+        for task_id in parents:
+            ancestor, depth, seen = task_id, 0, set()
+            while ancestor is not None and ancestor not in seen:
+                seen.add(ancestor)
+                values.append({'ancestor_id': ancestor, 'descendant_id': task_id, 'depth': depth,
+                               'created_at': now, 'updated_at': now, 'is_deleted': False})
+                ancestor, depth = parents.get(ancestor), depth + 1
+        connection.execute(delete(task_closures))
+        for start in range(0, len(values), batch_size):
+            connection.execute(insert(task_closures), values[start:start + batch_size])
+        db.session.commit()
+        return len(values)
+
+def _person(user):
+    return {'id': user.id, 'name': user.full_name} if user else None
+
+def _day(value):
+    return value.isoformat() if value else None
+
+class ProjectSnapshotService:
+    """The project detail graph in a fixed number of queries, however many tasks it has"""
+
+    # Loader profile for the detail page: to-one references are joined into the project row,
+    # each collection is one SELECT ... IN with its own references joined in
+    DETAIL_OPTIONS = (
+        joinedload(Project.manager),
+        joinedload(Project.client),
+        joinedload(Project.category),
+        joinedload(Project.cost_ledger),
+        selectinload(Project.tasks.and_(ProjectTask.is_deleted == False)).joinedload(ProjectTask.assigned_to),
+        selectinload(Project.milestones.and_(ProjectMilestone.is_deleted == False)),
+        selectinload(Project.resources.and_(ProjectResource.is_deleted == False)).joinedload(ProjectResource.user),
+    )
+
+    @staticmethod
+    def load(project_id, recent_entries=10):
+        """Everything the detail page renders, or None when the project does not exist"""
+        project = (Project.query
+                   .options(*ProjectSnapshotService.DETAIL_OPTIONS)
+                   .filter(Project.id == project_id, Project.is_deleted == False)
+                   .first())
+        if project is None:
+            return None
+        time_entries = (TimeEntry.query
+                        .options(joinedload(TimeEntry.user), joinedload(TimeEntry.task))
+                        .filter(TimeEntry.project_id == project_id, TimeEntry.is_deleted == False)
+                        .order_by(TimeEntry.date.desc(), TimeEntry.id.desc())
+                        .limit(recent_entries)
+                        .all())
+        return {
+            'project': project,
+            'tasks': sorted(project.tasks, key=lambda task: task.id),
+            'milestones': sorted(project.milestones, key=lambda milestone: (milestone.due_date, milestone.id)),
+            'resources': sorted(project.resources, key=lambda resource: resource.id),
+            'time_entries': time_entries,
+            'progress_percentage': TaskTreeService.project_progress(project_id),
+        }
+
+    @staticmethod
+    def to_dict(snapshot):
+        project = snapshot['project']
+        ledger = project.cost_ledger
+        return {
+            'id': project.id,
+            'project_code': project.project_code,
+            'name': project.name,
+            'description': project.description,
+            'status': project.status,
+            'priority': project.priority,
+            'start_date': _day(project.start_date),
+            'end_date': _day(project.end_date),
+            'manager': _person(project.manager),
+            'client': {'id': project.client.id, 'name': project.client.company_name} if project.client else None,
+            'category': project.category.name if project.category else None,
+            'budget': float(project.budget or 0),
+            'actual_cost': float(project.actual_cost or 0),
+            'billable_amount': float(project.billable_amount or 0),
+            'cost_breakdown': {
+                'labor_cost': float(ledger.labor_cost),
+                'labor_hours': float(ledger.labor_hours),
+                'expense_cost': float(ledger.expense_cost),
+                'purchase_cost': float(ledger.purchase_cost),
+            } if ledger else None,
+            'progress_percentage': snapshot['progress_percentage'],
+            'tasks': [{
+                'id': task.id,
+                'name': task.name,
+                'status': task.status,
+                'priority': task.priority,
+                'parent_task_id': task.parent_task_id,
+                'due_date': _day(task.due_date),
+                'progress_percentage': float(task.progress_percentage or 0),
+                'assigned_to': _person(task.assigned_to),
+            } for task in snapshot['tasks']],
+            'milestones': [{
+                'id': milestone.id,
+                'name': milestone.name,
+                'status': milestone.status,
+                'due_date': _day(milestone.due_date),
+                'completed_date': _day(milestone.completed_date),
+            } for milestone in snapshot['milestones']],
+            'resources': [{
+                'id': resource.id,
+                'user': _person(resource.user),
+                'role': resource.role,
+                'allocation_percentage': float(resource.allocation_percentage or 0),
+                'hourly_rate': float(resource.hourly_rate or 0),
+            } for resource in snapshot['resources']],
+            'time_entries': [{
+                'id': entry.id,
+                'date': _day(entry.date),
+                'hours': float(entry.hours),
+                'description': entry.description,
+                'is_billable': entry.is_billable,
+                'user': _person(entry.user),
+                'task': {'id': entry.task.id, 'name': entry.task.name} if entry.task else None,
+            } for entry in snapshot['time_entries']],
+        }
+
+@backfill('project_time_summaries')
+def backfill_time_summaries():
+    return TimeRollupService.rebuild()
+
+@backfill('project_cost_ledgers')
+def backfill_cost_ledgers():
+    return ProjectCostService.rebuild()
+
+@backfill('project_task_closures')
+def backfill_task_closures():
+    return TaskTreeService.rebuild()
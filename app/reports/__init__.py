@@ -2,4 +2,7 @@ from flask import Blueprint
 
 bp = Blueprint('reports', __name__)
 
-from app.reports import routes
\ No newline at end of file
+# Import models to register them with SQLAlchemy
+from app.reports import models
+from app.reports import routes
+from app.reports import commands
\ No newline at end of file
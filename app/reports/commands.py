@@ -0,0 +1,18 @@
+import click
+from datetime import timedelta
+from app.reports import bp
+from app.reports.services import SalesRollupService
+from app.reports.jobs import ReportJobService
+
+@bp.cli.command('rebuild-sales-rollups')
+def rebuild_sales_rollups():
+    """Rebuild the daily sales rollup tables from invoices and orders."""
+    counts = SalesRollupService.rebuild()
+    click.echo(f"Rebuilt {counts['line_rollups']} line rollups and {counts['order_rollups']} order rollups")
+
+@bp.cli.command('purge-report-jobs')
+@click.option('--days', default=7, show_default=True, help='Delete finished jobs older than this.')
+def purge_report_jobs(days):
+    """Delete finished background report jobs and their cached results."""
+    count = ReportJobService.purge(timedelta(days=days))
+    click.echo(f"Deleted {count} report jobs")
@@ -0,0 +1,312 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, func, or_
+from app.core.extensions import db
+from app.finance.models import Invoice, InvoiceItem
+from app.sales.models import Customer, SalesOrder, SalesOrderItem
+from app.inventory.models import Product
+
+invoices = Invoice.__table__
+invoice_items = InvoiceItem.__table__
+sales_orders = SalesOrder.__table__
+order_items = SalesOrderItem.__table__
+products = Product.__table__
+customers = Customer.__table__
+
+# Statuses whose lines are kept out of the cube, matching the sales rollups
+EXCLUDED_INVOICE_STATUSES = ('draft', 'cancelled')
+EXCLUDED_ORDER_STATUSES = ('draft', 'cancelled')
+
+# Dictionary-encoded dimensions; day and month are stored as plain integers so ranges stay cheap
+ENCODED_DIMENSIONS = ('source', 'product', 'product_category', 'customer', 'customer_category',
+                      'salesperson', 'status')
+DIMENSIONS = ENCODED_DIMENSIONS + ('day', 'month')
+MEASURES = ('quantity', 'amount')
+
+# Rows updated this close to the previous refresh are fetched again, so a transaction that
+# committed after the refresh with an earlier updated_at is still picked up
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+class Dictionary:
+    """Dense integer codes for the values of one dimension"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, values):
+        return np.array([self.codes.get(value, -1) for value in values], dtype=np.int32)
+
+    def decode(self, code):
+        return self.values[code]
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _months(day_ordinals):
+    """Vectorized year * 12 + month - 1 for an array of date ordinals"""
+    months = (day_ordinals - _EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+    return months + 1970 * 12
+
+class SalesCube:
+    """In-memory columnar cube of invoice and sales order lines.
+
+    Each line is one row keyed by (source, line id). Dimensions are int32 code
+    columns and measures float64 columns; rows that are deleted or fall into an
+    excluded status stay in place with ``valid`` cleared. Refreshes re-read only
+    lines whose line, header, product or customer changed since the high-water
+    mark; a periodic full rebuild drops rows that were hard-deleted. Reads
+    and refreshes share one lock, so a query never sees a half-loaded cube.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.dictionaries = {name: Dictionary() for name in ENCODED_DIMENSIONS}
+        self.columns = {name: np.zeros(0, dtype=np.int32) for name in DIMENSIONS}
+        self.columns.update({name: np.zeros(0, dtype=np.float64) for name in MEASURES})
+        self.valid = np.zeros(0, dtype=bool)
+        self.positions = {}
+        self.size = 0
+        self.high_water_mark = None
+        self.built_at = None
+        self.refreshed_at = None
+
+    def _reserve(self, rows):
+        needed = self.size + rows
+        capacity = len(self.valid)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:self.size] = self.valid[:self.size]
+        self.valid = valid
+
+    @staticmethod
+    def _invoice_lines(since):
+        query = (
+            select(
+                invoice_items.c.id,
+                invoices.c.issue_date.label('day'),
+                func.coalesce(invoice_items.c.product_id, 0).label('product'),
+                func.coalesce(products.c.category_id, 0).label('product_category'),
+                invoices.c.customer_id.label('customer'),
+                func.coalesce(customers.c.customer_category_id, 0).label('customer_category'),
+                func.coalesce(sales_orders.c.salesperson_id, 0).label('salesperson'),
+                func.coalesce(invoices.c.status, '').label('status'),
+                func.coalesce(invoice_items.c.quantity, 0).label('quantity'),
+                func.coalesce(invoice_items.c.line_total, 0).label('amount'),
+                ((invoice_items.c.is_deleted == False) & (invoices.c.is_deleted == False) &
+                 invoices.c.status.notin_(EXCLUDED_INVOICE_STATUSES)).label('valid'),
+            )
+            .select_from(
+                invoice_items
+                .join(invoices, invoices.c.id == invoice_items.c.invoice_id)
+                .outerjoin(sales_orders, sales_orders.c.id == invoices.c.order_id)
+                .outerjoin(products, products.c.id == invoice_items.c.product_id)
+                .outerjoin(customers, customers.c.id == invoices.c.customer_id)
+            )
+        )
+        if since is not None:
+            query = query.where(or_(invoice_items.c.updated_at >= since, invoices.c.updated_at >= since,
+                                    sales_orders.c.updated_at >= since, products.c.updated_at >= since,
+                                    customers.c.updated_at >= since))
+        return query
+
+    @staticmethod
+    def _order_lines(since):
+        query = (
+            select(
+                order_items.c.id,
+                sales_orders.c.order_date.label('day'),
+                func.coalesce(order_items.c.product_id, 0).label('product'),
+                func.coalesce(products.c.category_id, 0).label('product_category'),
+                sales_orders.c.customer_id.label('customer'),
+                func.coalesce(customers.c.customer_category_id, 0).label('customer_category'),
+                func.coalesce(sales_orders.c.salesperson_id, 0).label('salesperson'),
+                func.coalesce(sales_orders.c.status, '').label('status'),
+                func.coalesce(order_items.c.quantity, 0).label('quantity'),
+                func.coalesce(order_items.c.line_total, 0).label('amount'),
+                ((order_items.c.is_deleted == False) & (sales_orders.c.is_deleted == False) &
+                 sales_orders.c.status.notin_(EXCLUDED_ORDER_STATUSES)).label('valid'),
+            )
+            .select_from(
+                order_items
+                .join(sales_orders, sales_orders.c.id == order_items.c.order_id)
+                .outerjoin(products, products.c.id == order_items.c.product_id)
+                .outerjoin(customers, customers.c.id == sales_orders.c.customer_id)
+            )
+        )
+        if since is not None:
+            query = query.where(or_(order_items.c.updated_at >= since, sales_orders.c.updated_at >= since,
+                                    products.c.updated_at >= since, customers.c.updated_at >= since))
+        return query
+
+    def _load(self, source, rows):
+        """Upsert fetched lines of one source into the column arrays"""
+        if not rows:
+            return 0
+        source_code = self.dictionaries['source'].encode(source)
+        encoders = {name: self.dictionaries[name].encode for name in ENCODED_DIMENSIONS if name != 'source'}
+
+        positions = np.empty(len(rows), dtype=np.int64)
+        appended = 0
+        for i, row in enumerate(rows):
+            key = (source_code, row.id)
+            position = self.positions.get(key)
+            if position is None:
+                position = self.positions[key] = self.size + appended
+                appended += 1
+            positions[i] = position
+        self._reserve(appended)
+        self.size += appended
+
+        days = np.array([row.day.toordinal() for row in rows], dtype=np.int32)
+        self.columns['source'][positions] = source_code
+        self.columns['day'][positions] = days
+        self.columns['month'][positions] = _months(days)
+        for name, encode in encoders.items():
+            self.columns[name][positions] = [encode(getattr(row, name)) for row in rows]
+        for name in MEASURES:
+            self.columns[name][positions] = [float(getattr(row, name)) for row in rows]
+        self.valid[positions] = [bool(row.valid) for row in rows]
+        return len(rows)
+
+    def refresh(self, force_rebuild=False):
+        """Bring the cube up to date; returns the number of lines (re)loaded"""
+        with self._lock:
+            config = current_app.config
+            now = datetime.utcnow()
+            rebuild_after = timedelta(seconds=config.get('ANALYTICS_CUBE_REBUILD_SECONDS', 3600))
+            if force_rebuild or self.built_at is None or now - self.built_at > rebuild_after:
+                self._reset()
+                self.built_at = now
+
+            since = self.high_water_mark - REFRESH_OVERLAP if self.high_water_mark else None
+            connection = db.session.connection()
+            loaded = self._load('invoice', connection.execute(self._invoice_lines(since)).all())
+            loaded += self._load('order', connection.execute(self._order_lines(since)).all())
+            self.high_water_mark = now
+            self.refreshed_at = time.monotonic()
+            return loaded
+
+    def ensure_fresh(self):
+        """Refresh when the last refresh is older than ANALYTICS_CUBE_REFRESH_SECONDS"""
+        max_age = current_app.config.get('ANALYTICS_CUBE_REFRESH_SECONDS', 30)
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at > max_age:
+            self.refresh()
+
+    def _mask(self, filters, start, end):
+        mask = self.valid[:self.size].copy()
+        if start is not None:
+            mask &= self.columns['day'][:self.size] >= start.toordinal()
+        if end is not None:
+            mask &= self.columns['day'][:self.size] <= end.toordinal()
+        for name, values in (filters or {}).items():
+            if name not in ENCODED_DIMENSIONS:
+                raise ValueError(f'Cannot filter on {name}')
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            codes = self.dictionaries[name].lookup(values)
+            mask &= np.isin(self.columns[name][:self.size], codes)
+        return mask
+
+    def _decode(self, name, code):
+        if name == 'day':
+            return date.fromordinal(int(code))
+        if name == 'month':
+            year, month = divmod(int(code), 12)
+            return f'{year:04d}-{month + 1:02d}'
+        return self.dictionaries[name].decode(int(code))
+
+    def aggregate(self, group_by=(), measures=MEASURES, filters=None, start=None, end=None, limit=None):
+        """Sum measures and count lines per combination of ``group_by`` dimensions.
+
+        ``filters`` maps encoded dimensions to a value or a list of values, e.g.
+        ``{'source': 'invoice', 'product_category': [3, 4]}``. Period groupings
+        come back in date order, anything else by the first measure descending.
+        """
+        for name in group_by:
+            if name not in DIMENSIONS:
+                raise ValueError(f'Cannot group by {name}')
+        for name in measures:
+            if name not in MEASURES:
+                raise ValueError(f'Unknown measure {name}')
+
+        with self._lock:
+            return self._aggregate(group_by, measures, filters, start, end, limit)
+
+    def _aggregate(self, group_by, measures, filters, start, end, limit):
+        mask = self._mask(filters, start, end)
+        if not group_by:
+            row = {name: float(self.columns[name][:self.size][mask].sum()) for name in measures}
+            row['lines'] = int(mask.sum())
+            return [row]
+
+        # Mixed-radix group key; small key spaces are counted directly, larger ones via a sort
+        combined = np.zeros(int(mask.sum()), dtype=np.int64)
+        offsets, radices = [], []
+        for name in group_by:
+            column = self.columns[name][:self.size][mask].astype(np.int64)
+            offset = int(column.min()) if len(column) else 0
+            radix = int(column.max()) - offset + 1 if len(column) else 1
+            combined = combined * radix + (column - offset)
+            offsets.append(offset)
+            radices.append(radix)
+        space = int(np.prod(radices, dtype=np.float64))
+        if space <= max(4 * len(combined), 1 << 20):
+            counts = np.bincount(combined, minlength=space)
+            keys = np.flatnonzero(counts)
+            inverse = np.searchsorted(keys, combined)
+            counts = counts[keys]
+        else:
+            keys, inverse, counts = np.unique(combined, return_inverse=True, return_counts=True)
+            inverse = inverse.reshape(-1)
+        groups = np.empty((len(keys), len(group_by)), dtype=np.int64)
+        remainder = keys.copy()
+        for j in range(len(group_by) - 1, -1, -1):
+            remainder, groups[:, j] = np.divmod(remainder, radices[j])
+            groups[:, j] += offsets[j]
+        totals = {name: np.bincount(inverse, weights=self.columns[name][:self.size][mask], minlength=len(keys))
+                  for name in measures}
+
+        if 'day' in group_by or 'month' in group_by:
+            period = group_by.index('day') if 'day' in group_by else group_by.index('month')
+            order = np.argsort(groups[:, period], kind='stable')
+        elif measures:
+            order = np.argsort(-totals[measures[0]], kind='stable')
+        else:
+            order = np.argsort(-counts, kind='stable')
+        if limit:
+            order = order[:limit]
+
+        result = []
+        for i in order:
+            row = {name: self._decode(name, groups[i, j]) for j, name in enumerate(group_by)}
+            row.update({name: float(totals[name][i]) for name in measures})
+            row['lines'] = int(counts[i])
+            result.append(row)
+        return result
+
+def get_sales_cube():
+    """The current app's cube, refreshed if stale"""
+    cube = current_app.extensions.get('sales_cube')
+    if cube is None:
+        cube = current_app.extensions['sales_cube'] = SalesCube()
+    cube.ensure_fresh()
+    return cube
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from sqlalchemy import update, case, exists, or_
+from sqlalchemy.exc import IntegrityError
+from app.core.extensions import db
+from app.reports.models import ReportJob, ReportJobRequest
+
+report_jobs_table = ReportJob.__table__
+report_job_requests = ReportJobRequest.__table__
+
+class ReportType:
+    """A report that can run as a background job"""
+
+    def __init__(self, name, compute, params, tables):
+        self.name = name
+        self.compute = compute  # compute(params, progress) -> {'summary', 'headers', 'rows'}
+        self.params = params    # params(args) -> normalized, JSON-serializable dict
+        self.tables = frozenset(tables)  # source tables whose changes invalidate cached results
+
+REPORT_TYPES = {}
+
+def report_type(name, params, tables):
+    """Register a function as the computation for a background report type"""
+    def register(compute):
+        REPORT_TYPES[name] = ReportType(name, compute, params, tables)
+        return compute
+    return register
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def cache_key(report_type, params):
+    """Stable key for a report type and its normalized parameters"""
+    payload = json.dumps([report_type, params], sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ReportJobRunner:
+    """Runs report jobs on a process pool created alongside the Flask app.
+
+    The pool is started lazily on the first submission so CLI commands and the
+    worker processes themselves (which build their own app) never spawn one.
+    With REPORT_JOB_WORKERS = 0 jobs run inline in the requesting thread. A job
+    whose worker dies (or whose pool breaks) is marked failed when its future
+    completes, so identical requests stop attaching to it.
+    """
+
+    def __init__(self, app=None, config_name=None):
+        self._executor = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app, config_name)
+
+    def init_app(self, app, config_name):
+        self.app = app
+        self.config_name = config_name
+        self.workers = app.config.get('REPORT_JOB_WORKERS', 2)
+        app.extensions['report_jobs'] = self
+
+    def submit(self, job_id):
+        if not self.workers:
+            ReportJobService.run(job_id)
+            return
+        if self._executor is None or self._pid != os.getpid():
+            self._start()
+        try:
+            future = self._executor.submit(_run_job, self.config_name, job_id)
+        except BrokenProcessPool:
+            # A worker died since the last submission; start a fresh pool once
+            self._start()
+            future = self._executor.submit(_run_job, self.config_name, job_id)
+        future.add_done_callback(lambda future: self._finished(job_id, future))
+
+    def _start(self):
+        # Worker processes are spawned fresh; they must not inherit the parent's connections
+        self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        self._pid = os.getpid()
+
+    def _finished(self, job_id, future):
+        """Runs on the pool's management thread once a job's worker call returns or dies"""
+        if future.cancelled():
+            message = 'Cancelled'
+        elif future.exception() is not None:
+            message = str(future.exception()) or type(future.exception()).__name__
+        else:
+            return
+        with self.app.app_context():
+            ReportJobService.fail(job_id, message)
+            db.session.remove()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+report_jobs = ReportJobRunner()
+
+_worker_app = None
+
+def _run_job(config_name, job_id):
+    """Entry point inside a worker process"""
+    global _worker_app
+    if _worker_app is None:
+        from app import create_app
+        _worker_app = create_app(config_name)
+    with _worker_app.app_context():
+        ReportJobService.run(job_id)
+
+class ReportJobService:
+    """Submit, run, cache and invalidate background report jobs"""
+
+    @staticmethod
+    def submit(report_type, args, user_id=None):
+        """Return a job for the report: a fresh cached one, the identical one in flight, or a new one"""
+        from flask import current_app
+
+        definition = REPORT_TYPES[report_type]
+        params = definition.params(args)
+        key = cache_key(report_type, params)
+        ReportJobService.expire_stale(key, current_app.config.get('REPORT_JOB_STALE_SECONDS', 900))
+
+        cached = ReportJobService.cached(key)
+        if cached is not None:
+            return ReportJobService._share(cached, user_id)
+
+        job = ReportJob(
+            report_type=report_type,
+            params=json.dumps(params, sort_keys=True, default=_json_default),
+            cache_key=key,
+            inflight_key=key,
+            requested_by_id=user_id
+        )
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # An identical job is already queued or running; share its computation
+            db.session.rollback()
+            inflight = ReportJob.query.filter_by(inflight_key=key).first()
+            if inflight is not None:
+                return ReportJobService._share(inflight, user_id)
+            return ReportJobService.submit(report_type, args, user_id)
+
+        current_app.extensions['report_jobs'].submit(job.id)
+        return job
+
+    @staticmethod
+    def _share(job, user_id):
+        """Let ``user_id`` read a job another user requested"""
+        if user_id is None or job.requested_by_id == user_id:
+            return job
+        if not ReportJobRequest.query.filter_by(report_job_id=job.id, user_id=user_id).first():
+            db.session.add(ReportJobRequest(report_job_id=job.id, user_id=user_id))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # The same user attached concurrently
+                db.session.rollback()
+        return job
+
+    @staticmethod
+    def visible_to(user):
+        """Query of the jobs ``user`` requested or was handed; admins see every job"""
+        query = ReportJob.query
+        if user.is_admin():
+            return query
+        shared = exists().where(report_job_requests.c.report_job_id == ReportJob.id,
+                                report_job_requests.c.user_id == user.id)
+        return query.filter(or_(ReportJob.requested_by_id == user.id, shared))
+
+    @staticmethod
+    def cached(key):
+        """The most recent unexpired completed job for a cache key"""
+        return (
+            ReportJob.query
+            .filter(ReportJob.cache_key == key,
+                    ReportJob.status == 'completed',
+                    ReportJob.expires_at > datetime.utcnow())
+            .order_by(ReportJob.finished_at.desc())
+            .first()
+        )
+
+    @staticmethod
+    def run(job_id):
+        """Compute a queued job and store its result"""
+        from flask import current_app
+
+        job = db.session.get(ReportJob, job_id)
+        if job is None or job.status != 'queued':
+            return
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        def progress(percent):
+            db.session.execute(update(report_jobs_table)
+                               .where(report_jobs_table.c.id == job_id)
+                               .values(progress=int(percent)))
+            db.session.commit()
+
+        try:
+            definition = REPORT_TYPES[job.report_type]
+            result = definition.compute(json.loads(job.params), progress)
+            payload = json.dumps(result, default=_json_default)
+        except Exception as e:
+            db.session.rollback()
+            db.session.execute(update(report_jobs_table)
+                               .where(report_jobs_table.c.id == job_id)
+                               .values(status='failed', error=str(e), inflight_key=None,
+                                       finished_at=datetime.utcnow()))
+            db.session.commit()
+            return
+
+        now = datetime.utcnow()
+        ttl = timedelta(seconds=current_app.config.get('REPORT_CACHE_TTL', 300))
+        # A job invalidated while running loses its inflight_key; keep its result but do not cache it
+        db.session.execute(update(report_jobs_table)
+                           .where(report_jobs_table.c.id == job_id)
+                           .values(status='completed', progress=100, result=payload, inflight_key=None,
+                                   finished_at=now,
+                                   expires_at=case((report_jobs_table.c.inflight_key.is_(None), now),
+                                                   else_=now + ttl)))
+        db.session.commit()
+
+    @staticmethod
+    def fail(job_id, error):
+        """Mark a job that is still queued or running as failed and release its inflight_key"""
+        count = db.session.execute(
+            update(report_jobs_table)
+            .where(report_jobs_table.c.id == job_id, report_jobs_table.c.status.in_(('queued', 'running')))
+            .values(status='failed', error=error, inflight_key=None, finished_at=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def expire_stale(key, timeout):
+        """Fail the in-flight job for a cache key when it made no progress for ``timeout`` seconds,
+        e.g. because the process running it was restarted"""
+        now = datetime.utcnow()
+        count = db.session.execute(
+            update(report_jobs_table)
+            .where(report_jobs_table.c.inflight_key == key,
+                   report_jobs_table.c.updated_at < now - timedelta(seconds=timeout))
+            .values(status='failed', error='Timed out without progress', inflight_key=None, finished_at=now)
+        ).rowcount
+        if count:
+            db.session.commit()
+        return count
+
+    @staticmethod
+    def invalidate(connection, tables):
+        """Expire cached and in-flight results of report types that read any of ``tables``"""
+        report_types = [name for name, definition in REPORT_TYPES.items() if definition.tables & set(tables)]
+        if not report_types:
+            return 0
+        now = datetime.utcnow()
+        result = connection.execute(
+            update(report_jobs_table)
+            .where(report_jobs_table.c.report_type.in_(report_types),
+                   report_jobs_table.c.status.in_(('queued', 'running', 'completed')),
+                   (report_jobs_table.c.inflight_key.isnot(None)) | (report_jobs_table.c.expires_at > now))
+            .values(inflight_key=None,
+                    expires_at=case((report_jobs_table.c.status == 'completed', now),
+                                    else_=report_jobs_table.c.expires_at))
+        )
+        return result.rowcount
+
+    @staticmethod
+    def purge(older_than):
+        """Delete finished jobs older than a timedelta"""
+        cutoff = datetime.utcnow() - older_than
+        count = ReportJob.query.filter(ReportJob.status.in_(('completed', 'failed')),
+                                       ReportJob.finished_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+
+    @staticmethod
+    def to_dict(job):
+        from flask import url_for
+
+        return {
+            'id': job.id,
+            'report_type': job.report_type,
+            'status': job.status,
+            'progress': job.progress,
+            'error': job.error,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'status_url': url_for('reports.job_status', id=job.id),
+            'download_url': url_for('reports.job_download', id=job.id) if job.status == 'completed' else None,
+        }
+
+def _period_params(args):
+    from app.reports.services import resolve_period
+
+    start, end = resolve_period(args.get('date_range', 'this_month'),
+                                args.get('start_date', ''),
+                                args.get('end_date', ''))
+    return {'start': start.isoformat(), 'end': end.isoformat()}
+
+def _sales_summary_params(args):
+    params = _period_params(args)
+    params['customer_id'] = int(args['customer_id']) if args.get('customer_id') else None
+    params['status'] = args.get('status') or None
+    return params
+
+@report_type('sales_summary', params=_sales_summary_params,
+             tables=('invoices', 'invoice_items', 'sales_orders', 'customers', 'products', 'product_categories',
+                     'sales_line_rollups', 'sales_order_rollups'))
+def sales_summary_report(params, progress):
+    from app.reports.services import SalesRollupService
+
+    start, end = date.fromisoformat(params['start']), date.fromisoformat(params['end'])
+    summary = SalesRollupService.summary(start, end, customer_id=params['customer_id'], status=params['status'])
+    progress(80)
+    return {
+        'summary': summary,
+        'headers': ['Date', 'Sales'],
+        'rows': list(zip(summary['sales_trend_labels'], summary['sales_trend_data'])),
+    }
+
+def _inventory_params(args):
+    return {
+        'warehouse_id': int(args['warehouse_id']) if args.get('warehouse_id') else None,
+        'category_id': int(args['category_id']) if args.get('category_id') else None,
+        'product_type': args.get('product_type') or None,
+    }
+
+@report_type('inventory_valuation', params=_inventory_params,
+             tables=('stock_movements', 'products', 'product_categories', 'warehouses',
+                     'stock_levels', 'stock_category_levels'))
+def inventory_valuation_report(params, progress):
+    from app.inventory.services import InventoryReportService
+
+    metrics = InventoryReportService.metrics(**params)
+    progress(40)
+    categories = InventoryReportService.category_breakdown(params['warehouse_id'])
+    progress(70)
+    warehouses = InventoryReportService.warehouse_breakdown(params['category_id'])
+    return {
+        'summary': {'metrics': metrics, 'category_breakdown': categories, 'warehouse_breakdown': warehouses},
+        'headers': ['Category', 'Stocked Items', 'Value'],
+        'rows': [[c['name'], c['count'], c['value']] for c in categories],
+    }
+
+def _ar_aging_params(args):
+    as_of = date.fromisoformat(args['as_of']) if args.get('as_of') else date.today()
+    return {
+        'as_of': as_of.isoformat(),
+        'customer_id': int(args['customer_id']) if args.get('customer_id') else None,
+    }
+
+@report_type('ar_aging', params=_ar_aging_params, tables=('invoices', 'customers'))
+def ar_aging_report(params, progress):
+    from app.finance.services import ReceivablesService
+
+    aging = ReceivablesService.aging(date.fromisoformat(params['as_of']), params['customer_id'])
+    progress(80)
+    return {
+        'summary': aging,
+        'headers': ['Customer Code', 'Customer', 'Current', '1-30', '31-60', '61-90', '90+', 'Total'],
+        'rows': [[c['customer_code'], c['company_name'], *[c[key] for key in aging['buckets']], c['total']]
+                 for c in aging['customers']],
+    }
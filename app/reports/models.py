@@ -0,0 +1,135 @@
+from app.core.extensions import db
+from app.models.base import BaseModel
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+class SalesLineRollup(BaseModel):
+    """Invoiced quantity and revenue per day, product, customer and salesperson"""
+    __tablename__ = 'sales_line_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'customer_id', 'product_id', 'salesperson_id', name='uq_sales_line_rollups_key'),
+    )
+
+    day = db.Column(db.Date, nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = free-text line
+    customer_id = db.Column(db.Integer, nullable=False, default=0)
+    salesperson_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = unassigned
+
+    quantity_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SalesLineRollup {self.day} Product:{self.product_id} Customer:{self.customer_id}>'
+
+class SalesOrderRollup(BaseModel):
+    """Order count and value per day, customer, salesperson and status"""
+    __tablename__ = 'sales_order_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'customer_id', 'salesperson_id', 'status', name='uq_sales_order_rollups_key'),
+    )
+
+    day = db.Column(db.Date, nullable=False, index=True)
+    customer_id = db.Column(db.Integer, nullable=False, default=0)
+    salesperson_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='')
+
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    order_total = db.Column(db.Numeric(15, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SalesOrderRollup {self.day} Customer:{self.customer_id} {self.status}>'
+
+class ReportJob(BaseModel):
+    """A report computed in the background; completed jobs double as the result cache"""
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        db.Index('ix_report_jobs_cache_key_status', 'cache_key', 'status'),
+    )
+
+    report_type = db.Column(db.String(50), nullable=False, index=True)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    cache_key = db.Column(db.String(64), nullable=False)  # sha256 of report type + params
+    # Set to cache_key while the job is queued or running so identical requests share it
+    inflight_key = db.Column(db.String(64), unique=True)
+
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # 0-100
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+
+    requested_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)  # cached result is reused until then
+
+    requested_by = db.relationship('User', backref='report_jobs')
+
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.report_type} {self.status}>'
+
+class ReportJobRequest(BaseModel):
+    """A user who was handed a report job computed or queued for someone else's identical request"""
+    __tablename__ = 'report_job_requests'
+    __table_args__ = (
+        db.UniqueConstraint('report_job_id', 'user_id', name='uq_report_job_requests_job_user'),
+    )
+
+    report_job_id = db.Column(db.Integer, db.ForeignKey('report_jobs.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<ReportJobRequest {self.report_job_id} User:{self.user_id}>'
+
+def _touched_ids(session, persistent_only=False):
+    """Ids of invoices, invoice lines and sales orders pending in this flush"""
+    from app.finance.models import Invoice, InvoiceItem
+    from app.sales.models import SalesOrder
+
+    objects = chain(session.dirty, session.deleted) if persistent_only else \
+        chain(session.new, session.dirty, session.deleted)
+    ids = {Invoice: set(), InvoiceItem: set(), SalesOrder: set()}
+    for obj in objects:
+        for model, model_ids in ids.items():
+            if isinstance(obj, model) and obj.id is not None:
+                model_ids.add(obj.id)
+    return ids[Invoice], ids[InvoiceItem], ids[SalesOrder]
+
+# Keep rollups current: every flush recomputes only the (day, customer) slices it touched.
+# Slices are looked up in the database both before and after the flush so moves
+# between days or customers clear the old slice as well.
+@event.listens_for(Session, 'before_flush')
+def capture_sales_rollup_keys(session, flush_context, instances):
+    from app.reports.services import SalesRollupService
+
+    invoice_ids, item_ids, order_ids = _touched_ids(session, persistent_only=True)
+    if invoice_ids or item_ids or order_ids:
+        line_keys, order_keys = SalesRollupService.slice_keys(session.connection(), invoice_ids, item_ids, order_ids)
+        pending = session.info.setdefault('sales_rollup_keys', (set(), set()))
+        pending[0].update(line_keys)
+        pending[1].update(order_keys)
+
+@event.listens_for(Session, 'after_flush')
+def refresh_sales_rollups(session, flush_context):
+    from app.reports.services import SalesRollupService
+
+    line_keys, order_keys = session.info.pop('sales_rollup_keys', (set(), set()))
+    invoice_ids, item_ids, order_ids = _touched_ids(session)
+    if invoice_ids or item_ids or order_ids:
+        connection = session.connection()
+        new_line_keys, new_order_keys = SalesRollupService.slice_keys(connection, invoice_ids, item_ids, order_ids)
+        line_keys |= new_line_keys
+        order_keys |= new_order_keys
+    if line_keys or order_keys:
+        SalesRollupService.refresh(session.connection(), line_keys, order_keys)
+
+# Expire cached report results in the same transaction as the change to their source tables
+@event.listens_for(Session, 'after_flush')
+def invalidate_report_cache(session, flush_context):
+    from app.reports.jobs import ReportJobService
+
+    tables = {obj.__table__.name for obj in chain(session.new, session.dirty, session.deleted)
+              if hasattr(obj, '__table__')}
+    if tables:
+        ReportJobService.invalidate(session.connection(), tables)
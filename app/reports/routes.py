@@ -1,7 +1,17 @@
-from flask import render_template, request
-from flask_login import login_required
+from flask import render_template, request, jsonify, abort, Response
+from flask_login import login_required, current_user
 from app.reports import bp
+from app.reports.services import SalesRollupService, resolve_period
+from app.reports.jobs import REPORT_TYPES, ReportJobService
+from app.reports.models import ReportJob
+from app.reports.cube import get_sales_cube, ENCODED_DIMENSIONS, MEASURES
+from app.inventory.services import InventoryReportService
+from app.inventory.models import Warehouse, ProductCategory
+from app.sales.models import Customer
+from app.core.extensions import db
+from app.core.export import export_response, stream_query
 from datetime import datetime, date, timedelta
+import json
 
 @bp.route('/')
 @login_required
@@ -11,68 +21,54 @@ def index():
 @bp.route('/sales-summary')
 @login_required
 def sales_summary():
-    # Mock data for now - TODO: Replace with actual database queries
-    customers = []  # TODO: Get from database
+    start, end = resolve_period(request.args.get('date_range', 'this_month'),
+                                request.args.get('start_date', ''),
+                                request.args.get('end_date', ''))
+    customer_id = request.args.get('customer_id', type=int)
+    status = request.args.get('status', '')
     
-    # Mock metrics
-    metrics = {
-        'total_sales': 0,
-        'sales_growth': 0,
-        'total_orders': 0,
-        'orders_growth': 0,
-        'average_order_value': 0,
-        'aov_growth': 0,
-        'unique_customers': 0,
-        'customer_growth': 0,
-        'conversion_rate': 0,
-        'repeat_customer_rate': 0,
-        'revenue_per_customer': 0,
-        'avg_days_to_close': 0,
-        'current_period_sales': 0,
-        'previous_period_sales': 0
-    }
+    export = export_response(
+        request.args.get('export'), 'sales_summary',
+        ['Date', 'SKU', 'Product', 'Customer', 'Quantity Sold', 'Revenue'],
+        stream_query(SalesRollupService.export_query(start, end, customer_id)))
+    if export:
+        return export
     
-    # Mock chart data
-    sales_trend_labels = []
-    sales_trend_data = []
-    category_labels = []
-    category_data = []
+    customers = db.session.query(Customer.id, Customer.company_name.label('name')).filter(
+        Customer.is_deleted == False).order_by(Customer.company_name).all()
     
-    top_products = []  # TODO: Get from database
-    top_customers = []  # TODO: Get from database
+    # All figures come from the daily rollup tables, never from invoices/orders directly
+    summary = SalesRollupService.summary(start, end, customer_id=customer_id, status=status or None)
     
     return render_template('reports/sales_summary.html',
                          customers=customers,
-                         metrics=metrics,
-                         sales_trend_labels=sales_trend_labels,
-                         sales_trend_data=sales_trend_data,
-                         category_labels=category_labels,
-                         category_data=category_data,
-                         top_products=top_products,
-                         top_customers=top_customers)
+                         **summary)
 
 @bp.route('/inventory-report')
 @login_required
 def inventory_report():
-    # Mock data for now - TODO: Replace with actual database queries
-    warehouses = []   # TODO: Get from database
-    categories = []   # TODO: Get from database
-    products = []     # TODO: Get from database
+    warehouse_id = request.args.get('warehouse_id', type=int)
+    category_id = request.args.get('category_id', type=int)
+    stock_status = request.args.get('stock_status', '')
+    product_type = request.args.get('product_type', '')
+    filters = dict(warehouse_id=warehouse_id, category_id=category_id, product_type=product_type or None)
+    
+    export = export_response(
+        request.args.get('export'), 'inventory_report',
+        ['SKU', 'Product', 'Category', 'Type', 'Stock', 'Min Stock', 'Max Stock', 'Cost Price', 'Stock Value'],
+        stream_query(InventoryReportService.export_query(stock_status=stock_status or None, **filters)))
+    if export:
+        return export
     
-    # Mock metrics
-    metrics = {
-        'total_products': 0,
-        'active_products': 0,
-        'total_inventory_value': 0,
-        'low_stock_items': 0,
-        'out_of_stock_items': 0,
-        'in_stock_items': 0,
-        'overstock_items': 0
-    }
+    warehouses = Warehouse.query.filter_by(is_deleted=False).order_by(Warehouse.name).all()
+    categories = ProductCategory.query.filter_by(is_deleted=False).order_by(ProductCategory.name).all()
     
-    low_stock_products = []    # TODO: Get from database
-    category_breakdown = []    # TODO: Get from database
-    warehouse_breakdown = []   # TODO: Get from database
+    # Aggregates come from stock_levels and its category rollup; movements are never replayed here
+    metrics = InventoryReportService.metrics(stock_status=stock_status or None, **filters)
+    products = InventoryReportService.products(stock_status=stock_status or None, **filters)
+    low_stock_products = InventoryReportService.low_stock_products(**filters)
+    category_breakdown = InventoryReportService.category_breakdown(warehouse_id)
+    warehouse_breakdown = InventoryReportService.warehouse_breakdown(category_id)
     
     return render_template('reports/inventory_report.html',
                          warehouses=warehouses,
@@ -81,4 +77,79 @@ def inventory_report():
                          metrics=metrics,
                          low_stock_products=low_stock_products,
                          category_breakdown=category_breakdown,
-                         warehouse_breakdown=warehouse_breakdown)
\ No newline at end of file
+                         warehouse_breakdown=warehouse_breakdown)
+
+@bp.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    """Queue a heavy report, or attach to a cached or identical running one"""
+    args = request.get_json(silent=True) or request.form.to_dict() or request.args.to_dict()
+    report_type = args.pop('report_type', None)
+    if report_type not in REPORT_TYPES:
+        return jsonify({'error': f'Unknown report type: {report_type}'}), 400
+    
+    try:
+        job = ReportJobService.submit(report_type, args, user_id=current_user.id)
+    except (ValueError, KeyError) as e:
+        return jsonify({'error': f'Invalid report parameters: {e}'}), 400
+    return jsonify(ReportJobService.to_dict(job)), 200 if job.status == 'completed' else 202
+
+@bp.route('/jobs/<int:id>')
+@login_required
+def job_status(id):
+    """Progress polling for a report job"""
+    job = ReportJobService.visible_to(current_user).filter(ReportJob.id == id).first_or_404()
+    return jsonify(ReportJobService.to_dict(job))
+
+@bp.route('/jobs/<int:id>/download')
+@login_required
+def job_download(id):
+    """Download a finished report job as JSON, CSV or Excel"""
+    job = ReportJobService.visible_to(current_user).filter(ReportJob.id == id).first_or_404()
+    if job.status != 'completed':
+        return jsonify(ReportJobService.to_dict(job)), 409
+    
+    export_format = request.args.get('format', 'json')
+    if export_format == 'json':
+        return Response(job.result, mimetype='application/json')
+    
+    result = json.loads(job.result)
+    export = export_response(export_format, job.report_type, result['headers'], result['rows'])
+    if export is None:
+        abort(400)
+    return export
+
+@bp.route('/api/sales-cube')
+@login_required
+def sales_cube():
+    """Pivot invoice and order lines from the in-memory cube.
+
+    Example: ?group_by=month,product_category&source=invoice&customer_category=2,3&date_range=this_year
+    """
+    group_by = tuple(name for name in request.args.get('group_by', '').split(',') if name)
+    measures = tuple(name for name in request.args.get('measures', ','.join(MEASURES)).split(',') if name)
+    start = end = None
+    if request.args.get('date_range'):
+        start, end = resolve_period(request.args['date_range'],
+                                    request.args.get('start_date', ''),
+                                    request.args.get('end_date', ''))
+    
+    filters = {}
+    for name in ENCODED_DIMENSIONS:
+        if request.args.get(name):
+            values = request.args[name].split(',')
+            filters[name] = values if name in ('source', 'status') else [int(v) for v in values if v.isdigit()]
+    
+    cube = get_sales_cube()
+    try:
+        rows = cube.aggregate(group_by, measures, filters, start, end,
+                              limit=request.args.get('limit', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'group_by': group_by,
+        'start_date': start.isoformat() if start else None,
+        'end_date': end.isoformat() if end else None,
+        'rows': [{k: v.isoformat() if isinstance(v, date) else v for k, v in row.items()} for row in rows],
+    })
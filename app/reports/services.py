@@ -0,0 +1,412 @@
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from sqlalchemy import select, delete, func, literal, or_
+from app.core.extensions import db
+from app.core.schema import backfill
+from app.reports.models import SalesLineRollup, SalesOrderRollup
+from app.reports.jobs import ReportJobService
+from app.finance.models import Invoice, InvoiceItem
+from app.sales.models import Customer, SalesOrder
+from app.inventory.models import Product, ProductCategory
+
+line_rollups = SalesLineRollup.__table__
+order_rollups = SalesOrderRollup.__table__
+invoices = Invoice.__table__
+invoice_items = InvoiceItem.__table__
+sales_orders = SalesOrder.__table__
+
+# Invoice statuses that do not count as sales
+EXCLUDED_INVOICE_STATUSES = ('draft', 'cancelled')
+# Order statuses left out of order metrics unless explicitly filtered on
+EXCLUDED_ORDER_STATUSES = ('draft', 'cancelled')
+
+def resolve_period(date_range, start_date='', end_date='', today=None):
+    """Translate the report's date_range filter into an inclusive (start, end) pair"""
+    today = today or date.today()
+    if date_range == 'today':
+        return today, today
+    if date_range == 'yesterday':
+        yesterday = today - timedelta(days=1)
+        return yesterday, yesterday
+    if date_range == 'this_week':
+        return today - timedelta(days=today.weekday()), today
+    if date_range == 'last_week':
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6)
+    if date_range == 'last_month':
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    if date_range == 'this_quarter':
+        return date(today.year, 3 * ((today.month - 1) // 3) + 1, 1), today
+    if date_range == 'this_year':
+        return date(today.year, 1, 1), today
+    if date_range == 'custom':
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+            if start <= end:
+                return start, end
+        except ValueError:
+            pass
+    return today.replace(day=1), today
+
+def previous_period(start, end):
+    """Return the period of equal length immediately before (start, end)"""
+    length = (end - start).days + 1
+    return start - timedelta(days=length), start - timedelta(days=1)
+
+def _growth(current, previous):
+    if not previous:
+        return 0
+    return round(float((current - previous) / previous * 100), 1)
+
+class SalesRollupService:
+    @staticmethod
+    def _audit_columns():
+        now = datetime.utcnow()
+        return [
+            literal(now, db.DateTime).label('created_at'),
+            literal(now, db.DateTime).label('updated_at'),
+            literal(False, db.Boolean).label('is_deleted'),
+        ]
+
+    @staticmethod
+    def _line_source():
+        """Aggregate invoice lines into sales_line_rollups rows"""
+        return (
+            select(
+                invoices.c.issue_date,
+                func.coalesce(invoice_items.c.product_id, 0),
+                invoices.c.customer_id,
+                func.coalesce(sales_orders.c.salesperson_id, 0),
+                func.coalesce(func.sum(invoice_items.c.quantity), 0),
+                func.coalesce(func.sum(invoice_items.c.line_total), 0),
+                func.count(),
+                *SalesRollupService._audit_columns()
+            )
+            .select_from(
+                invoice_items
+                .join(invoices, invoice_items.c.invoice_id == invoices.c.id)
+                .outerjoin(sales_orders, invoices.c.order_id == sales_orders.c.id)
+            )
+            .where(
+                invoices.c.is_deleted == False,
+                invoice_items.c.is_deleted == False,
+                invoices.c.status.notin_(EXCLUDED_INVOICE_STATUSES)
+            )
+            .group_by(
+                invoices.c.issue_date,
+                func.coalesce(invoice_items.c.product_id, 0),
+                invoices.c.customer_id,
+                func.coalesce(sales_orders.c.salesperson_id, 0)
+            )
+        )
+
+    @staticmethod
+    def _order_source():
+        """Aggregate sales orders into sales_order_rollups rows"""
+        return (
+            select(
+                sales_orders.c.order_date,
+                sales_orders.c.customer_id,
+                func.coalesce(sales_orders.c.salesperson_id, 0),
+                func.coalesce(sales_orders.c.status, ''),
+                func.count(),
+                func.coalesce(func.sum(sales_orders.c.total_amount), 0),
+                *SalesRollupService._audit_columns()
+            )
+            .where(sales_orders.c.is_deleted == False)
+            .group_by(
+                sales_orders.c.order_date,
+                sales_orders.c.customer_id,
+                func.coalesce(sales_orders.c.salesperson_id, 0),
+                func.coalesce(sales_orders.c.status, '')
+            )
+        )
+
+    _line_columns = ['day', 'product_id', 'customer_id', 'salesperson_id',
+                     'quantity_sold', 'revenue', 'line_count', 'created_at', 'updated_at', 'is_deleted']
+    _order_columns = ['day', 'customer_id', 'salesperson_id', 'status',
+                      'order_count', 'order_total', 'created_at', 'updated_at', 'is_deleted']
+
+    @staticmethod
+    def slice_keys(connection, invoice_ids=(), item_ids=(), order_ids=()):
+        """Return the (day, customer_id) slices the given records currently fall into.
+
+        Orders also feed the salesperson of their invoices' lines, so their
+        invoices' slices are included in the line keys.
+        """
+        conditions = []
+        if invoice_ids:
+            conditions.append(invoices.c.id.in_(invoice_ids))
+        if item_ids:
+            conditions.append(invoices.c.id.in_(
+                select(invoice_items.c.invoice_id).where(invoice_items.c.id.in_(item_ids))))
+        if order_ids:
+            conditions.append(invoices.c.order_id.in_(order_ids))
+
+        line_keys, order_keys = set(), set()
+        if conditions:
+            line_keys = {tuple(row) for row in connection.execute(
+                select(invoices.c.issue_date, invoices.c.customer_id).where(or_(*conditions)).distinct())}
+        if order_ids:
+            order_keys = {tuple(row) for row in connection.execute(
+                select(sales_orders.c.order_date, sales_orders.c.customer_id)
+                .where(sales_orders.c.id.in_(order_ids)).distinct())}
+        return line_keys, order_keys
+
+    @staticmethod
+    def refresh(connection, line_keys=(), order_keys=()):
+        """Recompute the given (day, customer_id) slices of both rollup tables"""
+        for day, customer_id in line_keys:
+            connection.execute(delete(line_rollups).where(
+                line_rollups.c.day == day, line_rollups.c.customer_id == customer_id))
+            connection.execute(line_rollups.insert().from_select(
+                SalesRollupService._line_columns,
+                SalesRollupService._line_source().where(
+                    invoices.c.issue_date == day, invoices.c.customer_id == customer_id)
+            ))
+
+        for day, customer_id in order_keys:
+            connection.execute(delete(order_rollups).where(
+                order_rollups.c.day == day, order_rollups.c.customer_id == customer_id))
+            connection.execute(order_rollups.insert().from_select(
+                SalesRollupService._order_columns,
+                SalesRollupService._order_source().where(
+                    sales_orders.c.order_date == day, sales_orders.c.customer_id == customer_id)
+            ))
+
+    @staticmethod
+    def rebuild():
+        """Rebuild both rollup tables from scratch with two set-based statements"""
+        connection = db.session.connection()
+        connection.execute(delete(line_rollups))
+        connection.execute(line_rollups.insert().from_select(
+            SalesRollupService._line_columns, SalesRollupService._line_source()))
+        connection.execute(delete(order_rollups))
+        connection.execute(order_rollups.insert().from_select(
+            SalesRollupService._order_columns, SalesRollupService._order_source()))
+        ReportJobService.invalidate(connection, {'sales_line_rollups', 'sales_order_rollups'})
+        db.session.commit()
+        return {
+            'line_rollups': db.session.query(func.count(SalesLineRollup.id)).scalar(),
+            'order_rollups': db.session.query(func.count(SalesOrderRollup.id)).scalar(),
+        }
+
+    @staticmethod
+    def _line_filters(start, end, customer_id=None):
+        filters = [SalesLineRollup.day >= start, SalesLineRollup.day <= end]
+        if customer_id:
+            filters.append(SalesLineRollup.customer_id == customer_id)
+        return filters
+
+    @staticmethod
+    def _order_filters(start, end, customer_id=None, status=None):
+        filters = [SalesOrderRollup.day >= start, SalesOrderRollup.day <= end]
+        if customer_id:
+            filters.append(SalesOrderRollup.customer_id == customer_id)
+        if status:
+            filters.append(SalesOrderRollup.status == status)
+        else:
+            filters.append(SalesOrderRollup.status.notin_(EXCLUDED_ORDER_STATUSES))
+        return filters
+
+    @staticmethod
+    def period_totals(start, end, customer_id=None, status=None):
+        """Headline totals for one period, read from the rollups only"""
+        revenue = db.session.query(func.coalesce(func.sum(SalesLineRollup.revenue), 0)).filter(
+            *SalesRollupService._line_filters(start, end, customer_id)).scalar()
+
+        per_customer = (
+            db.session.query(
+                SalesOrderRollup.customer_id,
+                func.sum(SalesOrderRollup.order_count).label('orders'),
+                func.sum(SalesOrderRollup.order_total).label('total'))
+            .filter(*SalesRollupService._order_filters(start, end, customer_id, status))
+            .group_by(SalesOrderRollup.customer_id)
+            .subquery()
+        )
+        orders, order_value, customers, repeat_customers = db.session.query(
+            func.coalesce(func.sum(per_customer.c.orders), 0),
+            func.coalesce(func.sum(per_customer.c.total), 0),
+            func.count(per_customer.c.customer_id),
+            func.coalesce(func.sum(db.case((per_customer.c.orders > 1, 1), else_=0)), 0)
+        ).one()
+
+        return {
+            'sales': Decimal(revenue or 0),
+            'orders': int(orders or 0),
+            'order_value': Decimal(order_value or 0),
+            'customers': int(customers or 0),
+            'repeat_customers': int(repeat_customers or 0),
+        }
+
+    @staticmethod
+    def sales_trend(start, end, customer_id=None):
+        """Revenue per day, or per month for periods longer than two months"""
+        rows = (
+            db.session.query(SalesLineRollup.day, func.sum(SalesLineRollup.revenue))
+            .filter(*SalesRollupService._line_filters(start, end, customer_id))
+            .group_by(SalesLineRollup.day)
+            .all()
+        )
+        by_day = {day: float(total or 0) for day, total in rows}
+
+        labels, data = [], []
+        if (end - start).days > 62:
+            buckets = {}
+            for day, total in by_day.items():
+                month = day.strftime('%Y-%m')
+                buckets[month] = buckets.get(month, 0) + total
+            month = start.replace(day=1)
+            while month <= end:
+                label = month.strftime('%Y-%m')
+                labels.append(month.strftime('%b %Y'))
+                data.append(round(buckets.get(label, 0), 2))
+                month = (month + timedelta(days=32)).replace(day=1)
+        else:
+            day = start
+            while day <= end:
+                labels.append(day.strftime('%b %d'))
+                data.append(round(by_day.get(day, 0), 2))
+                day += timedelta(days=1)
+        return labels, data
+
+    @staticmethod
+    def category_breakdown(start, end, customer_id=None):
+        rows = (
+            db.session.query(
+                func.coalesce(ProductCategory.name, 'Uncategorized'),
+                func.sum(SalesLineRollup.revenue).label('revenue'))
+            .select_from(SalesLineRollup)
+            .outerjoin(Product, Product.id == SalesLineRollup.product_id)
+            .outerjoin(ProductCategory, ProductCategory.id == Product.category_id)
+            .filter(*SalesRollupService._line_filters(start, end, customer_id))
+            .group_by(func.coalesce(ProductCategory.name, 'Uncategorized'))
+            .order_by(db.desc('revenue'))
+            .all()
+        )
+        return [name for name, _ in rows], [float(revenue or 0) for _, revenue in rows]
+
+    @staticmethod
+    def top_products(start, end, customer_id=None, limit=10, total_sales=None):
+        rows = (
+            db.session.query(
+                SalesLineRollup.product_id,
+                func.sum(SalesLineRollup.quantity_sold).label('quantity_sold'),
+                func.sum(SalesLineRollup.revenue).label('revenue'))
+            .filter(SalesLineRollup.product_id != 0,
+                    *SalesRollupService._line_filters(start, end, customer_id))
+            .group_by(SalesLineRollup.product_id)
+            .order_by(db.desc('revenue'))
+            .limit(limit)
+            .all()
+        )
+        products = {p.id: p for p in Product.query.filter(Product.id.in_([r.product_id for r in rows]))}
+        result = []
+        for row in rows:
+            product = products.get(row.product_id)
+            revenue = float(row.revenue or 0)
+            result.append({
+                'id': row.product_id,
+                'name': product.name if product else f'Product #{row.product_id}',
+                'sku': product.sku if product else '',
+                'quantity_sold': int(row.quantity_sold or 0),
+                'revenue': revenue,
+                'percentage': revenue / float(total_sales) * 100 if total_sales else 0,
+            })
+        return result
+
+    @staticmethod
+    def top_customers(start, end, status=None, limit=10, total_sales=None):
+        rows = (
+            db.session.query(
+                SalesLineRollup.customer_id,
+                func.sum(SalesLineRollup.revenue).label('total_sales'))
+            .filter(*SalesRollupService._line_filters(start, end))
+            .group_by(SalesLineRollup.customer_id)
+            .order_by(db.desc('total_sales'))
+            .limit(limit)
+            .all()
+        )
+        customer_ids = [r.customer_id for r in rows]
+        names = dict(db.session.query(Customer.id, Customer.company_name).filter(Customer.id.in_(customer_ids)))
+        order_counts = dict(
+            db.session.query(SalesOrderRollup.customer_id, func.sum(SalesOrderRollup.order_count))
+            .filter(SalesOrderRollup.customer_id.in_(customer_ids),
+                    *SalesRollupService._order_filters(start, end, status=status))
+            .group_by(SalesOrderRollup.customer_id)
+        )
+        result = []
+        for row in rows:
+            total = float(row.total_sales or 0)
+            result.append({
+                'id': row.customer_id,
+                'name': names.get(row.customer_id, f'Customer #{row.customer_id}'),
+                'orders_count': int(order_counts.get(row.customer_id) or 0),
+                'total_sales': total,
+                'percentage': total / float(total_sales) * 100 if total_sales else 0,
+            })
+        return result
+
+    @staticmethod
+    def export_query(start, end, customer_id=None):
+        """Daily line rollups for a period with product and customer names, for streaming export"""
+        return (
+            db.session.query(
+                SalesLineRollup.day,
+                Product.sku,
+                Product.name.label('product'),
+                Customer.company_name.label('customer'),
+                SalesLineRollup.quantity_sold,
+                SalesLineRollup.revenue)
+            .outerjoin(Product, Product.id == SalesLineRollup.product_id)
+            .outerjoin(Customer, Customer.id == SalesLineRollup.customer_id)
+            .filter(*SalesRollupService._line_filters(start, end, customer_id))
+            .order_by(SalesLineRollup.day, SalesLineRollup.id)
+        )
+
+    @staticmethod
+    def summary(start, end, customer_id=None, status=None):
+        """Everything the sales summary report needs, computed from the rollups"""
+        prev_start, prev_end = previous_period(start, end)
+        current = SalesRollupService.period_totals(start, end, customer_id, status)
+        previous = SalesRollupService.period_totals(prev_start, prev_end, customer_id, status)
+
+        def aov(totals):
+            return totals['order_value'] / totals['orders'] if totals['orders'] else Decimal(0)
+
+        metrics = {
+            'total_sales': float(current['sales']),
+            'sales_growth': _growth(current['sales'], previous['sales']),
+            'total_orders': current['orders'],
+            'orders_growth': _growth(current['orders'], previous['orders']),
+            'average_order_value': float(aov(current)),
+            'aov_growth': _growth(aov(current), aov(previous)),
+            'unique_customers': current['customers'],
+            'customer_growth': _growth(current['customers'], previous['customers']),
+            'conversion_rate': 0,
+            'repeat_customer_rate': round(current['repeat_customers'] / current['customers'] * 100, 1)
+                                    if current['customers'] else 0,
+            'revenue_per_customer': float(current['sales'] / current['customers']) if current['customers'] else 0,
+            'avg_days_to_close': 0,
+            'current_period_sales': float(current['sales']),
+            'previous_period_sales': float(previous['sales'])
+        }
+
+        sales_trend_labels, sales_trend_data = SalesRollupService.sales_trend(start, end, customer_id)
+        category_labels, category_data = SalesRollupService.category_breakdown(start, end, customer_id)
+
+        return {
+            'metrics': metrics,
+            'sales_trend_labels': sales_trend_labels,
+            'sales_trend_data': sales_trend_data,
+            'category_labels': category_labels,
+            'category_data': category_data,
+            'top_products': SalesRollupService.top_products(start, end, customer_id, total_sales=current['sales']),
+            'top_customers': SalesRollupService.top_customers(start, end, status, total_sales=current['sales']),
+        }
+
+@backfill('sales_line_rollups', 'sales_order_rollups')
+def backfill_sales_rollups():
+    return SalesRollupService.rebuild()
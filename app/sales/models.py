@@ -1,5 +1,6 @@
 from app.core.extensions import db
 from app.models.base import BaseModel
+from app.core.sequences import next_document_number
 from datetime import datetime, date
 from decimal import Decimal
 from sqlalchemy import event
@@ -75,6 +76,9 @@ class Customer(BaseModel):
 
 class SalesOrder(BaseModel):
     __tablename__ = 'sales_orders'
+    __table_args__ = (
+        db.Index('ix_sales_orders_customer_order_date', 'customer_id', 'order_date'),
+    )
     
     # Order Information
     order_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -214,27 +218,14 @@ class QuoteItem(BaseModel):
 @event.listens_for(Customer, 'before_insert')
 def generate_customer_code(mapper, connection, target):
     if not target.customer_code:
-        # Get the last customer number
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(customer_code, 5) AS INTEGER)) FROM customers WHERE customer_code LIKE 'CUST%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.customer_code = f"CUST{next_num:06d}"
+        target.customer_code = next_document_number(connection, 'CUST', Customer.__table__.c.customer_code)
 
 @event.listens_for(SalesOrder, 'before_insert')
 def generate_order_number(mapper, connection, target):
     if not target.order_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(order_number, 4) AS INTEGER)) FROM sales_orders WHERE order_number LIKE 'ORD%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.order_number = f"ORD{next_num:06d}"
+        target.order_number = next_document_number(connection, 'ORD', SalesOrder.__table__.c.order_number)
 
 @event.listens_for(Quote, 'before_insert')
 def generate_quote_number(mapper, connection, target):
     if not target.quote_number:
-        result = connection.execute(
-            db.text("SELECT MAX(CAST(SUBSTR(quote_number, 4) AS INTEGER)) FROM quotes WHERE quote_number LIKE 'QUO%'")
-        ).scalar()
-        next_num = (result or 0) + 1
-        target.quote_number = f"QUO{next_num:06d}"
\ No newline at end of file
+        target.quote_number = next_document_number(connection, 'QUO', Quote.__table__.c.quote_number)
\ No newline at end of file
@@ -1,10 +1,33 @@
 from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from app.sales import bp
+from app.sales.models import Customer, SalesOrder, Quote
+from app.core.export import export_response, stream_query
 
 @bp.route('/customers')
 @login_required
 def customers():
+    status_filter = request.args.get('status', '')
+    search = request.args.get('search', '')
+    
+    query = Customer.query.filter_by(is_deleted=False)
+    if status_filter:
+        query = query.filter(Customer.status == status_filter)
+    if search:
+        query = query.filter(Customer.company_name.contains(search))
+    
+    export = export_response(
+        request.args.get('export'), 'customers',
+        ['Code', 'Company', 'Contact', 'Email', 'Phone', 'City', 'Country', 'Status',
+         'Credit Limit', 'Current Balance'],
+        stream_query(
+            query.with_entities(Customer.customer_code, Customer.company_name, Customer.contact_person,
+                                Customer.email, Customer.phone, Customer.city, Customer.country,
+                                Customer.status, Customer.credit_limit, Customer.current_balance)
+            .order_by(Customer.company_name, Customer.id)))
+    if export:
+        return export
+    
     return render_template('sales/customers.html')
 
 @bp.route('/customers/add', methods=['GET', 'POST'])
@@ -41,6 +64,28 @@ def edit_customer(id):
 @bp.route('/orders')
 @login_required
 def orders():
+    status_filter = request.args.get('status', '')
+    customer_filter = request.args.get('customer_id', type=int)
+    
+    query = SalesOrder.query.filter_by(is_deleted=False)
+    if status_filter:
+        query = query.filter(SalesOrder.status == status_filter)
+    if customer_filter:
+        query = query.filter(SalesOrder.customer_id == customer_filter)
+    
+    export = export_response(
+        request.args.get('export'), 'sales_orders',
+        ['Order Number', 'Customer', 'Order Date', 'Required Date', 'Status', 'Payment Status',
+         'Subtotal', 'Tax', 'Total'],
+        stream_query(
+            query.outerjoin(Customer, Customer.id == SalesOrder.customer_id)
+            .with_entities(SalesOrder.order_number, Customer.company_name, SalesOrder.order_date,
+                           SalesOrder.required_date, SalesOrder.status, SalesOrder.payment_status,
+                           SalesOrder.subtotal, SalesOrder.tax_amount, SalesOrder.total_amount)
+            .order_by(SalesOrder.order_date.desc(), SalesOrder.id)))
+    if export:
+        return export
+    
     return render_template('sales/orders.html')
 
 @bp.route('/orders/add', methods=['GET', 'POST'])
@@ -79,6 +124,26 @@ def edit_order(id):
 @bp.route('/quotes')
 @login_required
 def quotes():
+    status_filter = request.args.get('status', '')
+    customer_filter = request.args.get('customer_id', type=int)
+    
+    query = Quote.query.filter_by(is_deleted=False)
+    if status_filter:
+        query = query.filter(Quote.status == status_filter)
+    if customer_filter:
+        query = query.filter(Quote.customer_id == customer_filter)
+    
+    export = export_response(
+        request.args.get('export'), 'quotes',
+        ['Quote Number', 'Customer', 'Quote Date', 'Valid Until', 'Status', 'Subtotal', 'Tax', 'Total'],
+        stream_query(
+            query.outerjoin(Customer, Customer.id == Quote.customer_id)
+            .with_entities(Quote.quote_number, Customer.company_name, Quote.quote_date, Quote.valid_until,
+                           Quote.status, Quote.subtotal, Quote.tax_amount, Quote.total_amount)
+            .order_by(Quote.quote_date.desc(), Quote.id)))
+    if export:
+        return export
+    
     return render_template('sales/quotes.html')
 
 @bp.route('/quotes/add', methods=['GET', 'POST'])
@@ -553,10 +553,62 @@ class NotificationManager {
     }
 
     startPolling() {
-        // Poll for new notifications every 30 seconds
-        setInterval(() => {
-            this.loadNotifications();
-        }, 30000);
+        // New notifications are pushed over Server-Sent Events; the stream ends every few minutes and the
+        // browser reconnects with Last-Event-ID. Poll where EventSource is missing or the server answers 204
+        if (!window.EventSource) {
+            this.pollNotifications();
+            return;
+        }
+
+        const source = new EventSource('/api/notifications/stream');
+        source.addEventListener('notification', (event) => {
+            this.receiveNotification(JSON.parse(event.data));
+        });
+        source.addEventListener('unread', (event) => {
+            this.unreadCount = JSON.parse(event.data).unread_count;
+            this.updateBadge();
+        });
+        source.addEventListener('error', () => {
+            // Network errors reconnect on their own; a closed source will not
+            if (source.readyState === EventSource.CLOSED) {
+                this.pollNotifications();
+            }
+        });
+    }
+
+    pollNotifications() {
+        // The server answers from the unread counter row alone until something changes
+        let version = null;
+        let lastId = null;
+        const poll = async () => {
+            let delay = 30000;
+            try {
+                const params = new URLSearchParams();
+                if (version !== null) params.set('version', version);
+                if (lastId !== null) params.set('last_id', lastId);
+                const response = await fetch('/api/notifications/poll?' + params.toString());
+                if (response.ok) {
+                    const data = await response.json();
+                    if (version !== null) {
+                        data.notifications.forEach((notification) => this.receiveNotification(notification));
+                    }
+                    version = data.version;
+                    lastId = data.last_id;
+                    this.unreadCount = data.unread_count;
+                    this.updateBadge();
+                    delay = data.retry_after * 1000;
+                }
+            } catch (error) {
+                console.warn('Failed to poll notifications:', error);
+            }
+            setTimeout(poll, Math.max(delay, 1000));
+        };
+        poll();
+    }
+
+    receiveNotification(notification) {
+        this.notifications.unshift(notification);
+        this.showToast(notification.message, notification.type === 'critical' ? 'error' : notification.type);
     }
 
     showToast(message, type = 'info', duration = 5000) {
@@ -868,6 +920,131 @@ class FormEnhancer {
     }
 }
 
+// Typeahead Picker Component
+// Enhances <input data-typeahead="customers" data-typeahead-target="client_id"> paired with a
+// hidden input of that name, querying /api/typeahead/<source> instead of rendering every option
+class TypeaheadPicker {
+    constructor(input) {
+        this.input = input;
+        this.source = input.dataset.typeahead;
+        this.hidden = input.form.querySelector(`input[type="hidden"][name="${input.dataset.typeaheadTarget}"]`);
+        this.debounceTimer = null;
+        this.results = [];
+        this.selectedIndex = -1;
+        
+        this.init();
+    }
+
+    init() {
+        this.menu = document.createElement('div');
+        this.menu.className = 'search-results typeahead-results';
+        this.menu.style.display = 'none';
+        this.input.parentNode.appendChild(this.menu);
+        
+        this.bindEvents();
+    }
+
+    bindEvents() {
+        this.input.addEventListener('input', () => {
+            // Typing invalidates the previous pick until a result is chosen again
+            this.hidden.value = '';
+            this.updateValidity();
+            clearTimeout(this.debounceTimer);
+            
+            const query = this.input.value.trim();
+            if (!query) {
+                this.hide();
+                return;
+            }
+            this.debounceTimer = setTimeout(() => this.fetchResults(query), 150);
+        });
+
+        this.input.addEventListener('keydown', (e) => {
+            if (this.menu.style.display === 'none') return;
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                const step = e.key === 'ArrowDown' ? 1 : -1;
+                this.selectedIndex = Math.max(0, Math.min(this.results.length - 1, this.selectedIndex + step));
+                this.highlight();
+            } else if (e.key === 'Enter' && this.selectedIndex >= 0) {
+                e.preventDefault();
+                this.select(this.results[this.selectedIndex]);
+            } else if (e.key === 'Escape') {
+                this.hide();
+            }
+        });
+
+        this.input.addEventListener('blur', () => {
+            setTimeout(() => this.hide(), 150);
+        });
+    }
+
+    async fetchResults(query) {
+        try {
+            const params = new URLSearchParams({ q: query, limit: 10 });
+            const response = await fetch(`/api/typeahead/${this.source}?${params}`);
+            
+            if (response.ok && this.input.value.trim() === query) {
+                this.render(await response.json());
+            }
+        } catch (error) {
+            console.error('Typeahead error:', error);
+        }
+    }
+
+    render(results) {
+        this.results = results;
+        this.selectedIndex = -1;
+        
+        if (results.length === 0) {
+            this.menu.innerHTML = '<div class="search-no-results">No matches found</div>';
+        } else {
+            this.menu.innerHTML = '';
+            results.forEach((result, index) => {
+                const item = document.createElement('div');
+                item.className = 'search-result-item';
+                item.innerHTML = `
+                    <div class="search-result-content">
+                        <div class="search-result-title"></div>
+                        <div class="search-result-description"></div>
+                    </div>
+                `;
+                item.querySelector('.search-result-title').textContent = result.label;
+                item.querySelector('.search-result-description').textContent = result.detail;
+                item.addEventListener('mousedown', (e) => {
+                    e.preventDefault();
+                    this.select(results[index]);
+                });
+                this.menu.appendChild(item);
+            });
+        }
+        
+        this.menu.style.display = 'block';
+    }
+
+    highlight() {
+        this.menu.querySelectorAll('.search-result-item').forEach((item, index) => {
+            item.classList.toggle('selected', index === this.selectedIndex);
+        });
+    }
+
+    select(result) {
+        this.input.value = result.label;
+        this.hidden.value = result.id;
+        this.updateValidity();
+        this.hide();
+    }
+
+    updateValidity() {
+        const pending = this.input.value.trim() && !this.hidden.value;
+        this.input.setCustomValidity(pending ? 'Select an entry from the list' : '');
+    }
+
+    hide() {
+        this.menu.style.display = 'none';
+    }
+}
+
 // Initialize all components
 document.addEventListener('DOMContentLoaded', () => {
     // Initialize components
@@ -876,6 +1053,7 @@ document.addEventListener('DOMContentLoaded', () => {
     window.notificationManager = new NotificationManager();
     window.scrollToTop = new ScrollToTop();
     window.formEnhancer = new FormEnhancer();
+    document.querySelectorAll('input[data-typeahead]').forEach(input => new TypeaheadPicker(input));
     
     console.log('ERP Components initialized');
 });
@@ -887,6 +1065,7 @@ if (typeof module !== 'undefined' && module.exports) {
         SidebarManager,
         NotificationManager,
         ScrollToTop,
-        FormEnhancer
+        FormEnhancer,
+        TypeaheadPicker
     };
 }
@@ -16,9 +16,93 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_FOLDER = 'uploads'
     
+    # Project documents: content-addressed store under UPLOAD_FOLDER, streamed in chunks of this many bytes
+    DOCUMENT_STORE_FOLDER = 'documents'
+    DOCUMENT_CHUNK_SIZE = 1024 * 1024
+    DOCUMENT_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx', 'txt', 'csv',
+                           'jpg', 'jpeg', 'png', 'gif', 'dwg', 'dxf', 'zip'}
+    # Unreferenced blobs are only garbage-collected once untouched for this many seconds, so an upload
+    # deduplicated against one is not robbed of its content
+    DOCUMENT_GC_GRACE_SECONDS = 3600
+    # Browser cache lifetime of downloads; set the prefix to an nginx internal location (e.g. /protected-documents)
+    # to offload downloads with X-Accel-Redirect, or USE_X_SENDFILE for Apache/lighttpd
+    DOCUMENT_CACHE_SECONDS = 3600
+    DOCUMENT_ACCEL_REDIRECT_PREFIX = os.environ.get('DOCUMENT_ACCEL_REDIRECT_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
+    
     # Pagination
     ITEMS_PER_PAGE = 20
     
+    # Document numbers reserved per worker process at a time
+    DOCUMENT_SEQUENCE_BLOCK_SIZE = 20
+    
+    # Background report jobs: worker processes (0 runs jobs inline), result cache lifetime in seconds,
+    # and seconds without progress after which a queued or running job is given up as dead
+    REPORT_JOB_WORKERS = 2
+    REPORT_CACHE_TTL = 300
+    REPORT_JOB_STALE_SECONDS = 900
+    
+    # In-memory sales cube: incremental refresh interval and full rebuild interval in seconds
+    ANALYTICS_CUBE_REFRESH_SECONDS = 30
+    ANALYTICS_CUBE_REBUILD_SECONDS = 3600
+    
+    # Dashboard counters are cached per process for this many seconds
+    DASHBOARD_CACHE_TTL = 30
+    
+    # Projects landing page statistics are cached per process for this many seconds
+    PROJECT_STATS_CACHE_TTL = 30
+    
+    # Server-Sent Events notification feed: each stream lives NOTIFICATION_STREAM_SECONDS and then the browser
+    # reconnects; it reads the user's counter row every NOTIFICATION_STREAM_INTERVAL seconds and sends a heartbeat
+    # after NOTIFICATION_STREAM_HEARTBEAT quiet seconds. An open stream occupies a worker, so serve it with a
+    # gevent, eventlet or gthread worker class, or set the lifetime to 0 to make browsers poll instead
+    NOTIFICATION_STREAM_SECONDS = 300
+    NOTIFICATION_STREAM_INTERVAL = 5
+    NOTIFICATION_STREAM_HEARTBEAT = 15
+    # Fallback polling interval in seconds for browsers without a stream
+    NOTIFICATION_POLL_SECONDS = 30
+    
+    # Global search ranks by BM25 only when a query matches at most this many documents
+    SEARCH_RANK_CANDIDATES = 1000
+    
+    # Typeahead prefix indexes are patched by this process's commits and fully rebuilt
+    # this often (seconds) to pick up changes committed by other processes
+    TYPEAHEAD_REBUILD_SECONDS = 300
+    
+    # Task schedules are re-timed by this process's commits and fully rebuilt this often (seconds);
+    # tasks without planned dates are scheduled at this many estimated hours per day
+    SCHEDULE_REBUILD_SECONDS = 300
+    SCHEDULE_HOURS_PER_DAY = 8
+    
+    # Resource capacity matrix: days kept before and after today, and full rebuild interval in seconds
+    CAPACITY_PAST_DAYS = 31
+    CAPACITY_FUTURE_DAYS = 366
+    CAPACITY_REBUILD_SECONDS = 300
+    
+    # First month of the fiscal year; the profit and loss report starts there by default
+    FISCAL_YEAR_START_MONTH = 1
+    
+    # The chart of accounts tree is cached per process for this many seconds (and dropped on changes)
+    ACCOUNT_TREE_CACHE_TTL = 300
+    
+    # In-process job scheduler: turn off where an external scheduler runs the CLI commands instead;
+    # due jobs are looked for this often (seconds)
+    SCHEDULER_ENABLED = True
+    SCHEDULER_TICK_SECONDS = 60
+    
+    # Overdue invoice sweep: run interval in seconds (0 disables), rows per audit/notification batch
+    # and the user its audit rows are recorded under (default: the first active admin)
+    OVERDUE_SWEEP_INTERVAL = 3600
+    OVERDUE_SWEEP_BATCH_SIZE = 1000
+    OVERDUE_SWEEP_USER_ID = None
+    
+    # Bank reconciliation: amount tolerance, days either side of the payment date, lines stored per
+    # executemany batch, and statement date formats accepted besides YYYY-MM-DD
+    BANK_MATCH_AMOUNT_TOLERANCE = 0.0
+    BANK_MATCH_DATE_WINDOW = 3
+    BANK_RECONCILIATION_BATCH_SIZE = 5000
+    BANK_STATEMENT_DATE_FORMATS = ('%d/%m/%Y',)
+    
     @staticmethod
     def init_app(app):
         pass
@@ -55,6 +139,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    REPORT_JOB_WORKERS = 0
+    SCHEDULER_ENABLED = False
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,40 @@
+import pytest
+from flask import g
+from app import create_app
+from app.core.extensions import db
+from app.core.sequences import allocator
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+    # Document number blocks are cached per process and would outlive the database
+    allocator.reset()
+
+@pytest.fixture
+def login(app):
+    """A test client logged in as ``user``"""
+    def login(user):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        db.session.remove()
+        g.pop('_login_user', None)
+        return client
+    return login
+
+@pytest.fixture
+def accounts(app):
+    """A small chart of accounts as {account_code: id}"""
+    from app.finance.models import ChartOfAccounts
+    chart = [ChartOfAccounts(account_code=code, account_name=name, account_type=account_type)
+             for code, name, account_type in [('1000', 'Cash', 'Asset'), ('4000', 'Sales', 'Revenue'),
+                                               ('5100', 'Office Expenses', 'Expense')]]
+    db.session.add_all(chart)
+    db.session.commit()
+    return {account.account_code: account.id for account in chart}
@@ -0,0 +1,74 @@
+from datetime import date
+from decimal import Decimal
+from app.core.extensions import db
+
+def balances():
+    """account_balances as {(account_id, period): (debit, credit, lines)}, leaving out emptied rows"""
+    from app.finance.models import AccountBalance
+    db.session.expire_all()
+    return {(row.account_id, row.period): (row.debit_total, row.credit_total, row.line_count)
+            for row in AccountBalance.query.all() if row.line_count}
+
+def assert_balances(expected):
+    from app.finance.services import LedgerService
+    assert balances() == expected
+    LedgerService.rebuild()
+    assert balances() == expected
+
+def make_entry(accounts, amount, status='posted', day=date(2026, 3, 5)):
+    from app.finance.models import JournalEntry, JournalEntryLine
+    entry = JournalEntry(entry_date=day, status=status, lines=[
+        JournalEntryLine(account_id=accounts['1000'], debit_amount=amount, credit_amount=0),
+        JournalEntryLine(account_id=accounts['4000'], debit_amount=0, credit_amount=amount),
+    ])
+    db.session.add(entry)
+    db.session.commit()
+    return entry
+
+def test_posting_adds_to_account_balances(app, accounts):
+    cash, sales = accounts['1000'], accounts['4000']
+    make_entry(accounts, Decimal('61.50'))
+    make_entry(accounts, Decimal('10.00'), status='draft')
+    assert_balances({(cash, 202603): (Decimal('61.50'), Decimal('0.00'), 1),
+                     (sales, 202603): (Decimal('0.00'), Decimal('61.50'), 1)})
+
+def test_editing_a_posted_entry_moves_its_balances(app, accounts):
+    cash, sales = accounts['1000'], accounts['4000']
+    entry = make_entry(accounts, Decimal('61.50'))
+    for line in entry.lines:
+        if line.debit_amount:
+            line.debit_amount = Decimal('70.00')
+        else:
+            line.credit_amount = Decimal('70.00')
+    db.session.commit()
+    assert_balances({(cash, 202603): (Decimal('70.00'), Decimal('0.00'), 1),
+                     (sales, 202603): (Decimal('0.00'), Decimal('70.00'), 1)})
+
+    entry.entry_date = date(2026, 4, 1)
+    db.session.commit()
+    assert_balances({(cash, 202604): (Decimal('70.00'), Decimal('0.00'), 1),
+                     (sales, 202604): (Decimal('0.00'), Decimal('70.00'), 1)})
+
+def test_posting_a_draft_and_reversing_it(app, accounts):
+    cash, sales = accounts['1000'], accounts['4000']
+    entry = make_entry(accounts, Decimal('25.00'), status='draft')
+    assert_balances({})
+
+    entry.status = 'posted'
+    db.session.commit()
+    assert_balances({(cash, 202603): (Decimal('25.00'), Decimal('0.00'), 1),
+                     (sales, 202603): (Decimal('0.00'), Decimal('25.00'), 1)})
+
+    entry.status = 'reversed'
+    db.session.commit()
+    assert_balances({})
+
+def test_rolled_back_posting_leaves_balances_alone(app, accounts):
+    make_entry(accounts, Decimal('25.00'))
+    before = balances()
+    from app.finance.models import JournalEntry
+    entry = JournalEntry.query.one()
+    entry.status = 'reversed'
+    db.session.flush()
+    db.session.rollback()
+    assert balances() == before
@@ -0,0 +1,85 @@
+from datetime import date
+from decimal import Decimal
+import pytest
+from sqlalchemy import event, select
+from app.core.extensions import db
+
+@pytest.fixture
+def line(app, accounts):
+    """A budget line on Office Expenses covering 2026"""
+    from app.finance.models import Budget, BudgetLine
+    budget = Budget(name='FY2026', fiscal_year=2026, start_date=date(2026, 1, 1), end_date=date(2026, 12, 31))
+    line = BudgetLine(budget=budget, account_id=accounts['5100'], budgeted_amount=Decimal('100.00'))
+    db.session.add(line)
+    db.session.commit()
+    return line.id
+
+def actuals(line_id):
+    from app.finance.models import BudgetLine
+    db.session.expire_all()
+    line = db.session.get(BudgetLine, line_id)
+    return line.actual_amount, line.variance
+
+def assert_actuals(line_id, actual):
+    from app.finance.services import BudgetService
+    expected = (actual, actual - Decimal('100.00'))
+    assert actuals(line_id) == expected
+    BudgetService.rebuild()
+    assert actuals(line_id) == expected
+
+def post_expense(accounts, amount, status='posted'):
+    from app.finance.models import JournalEntry, JournalEntryLine
+    db.session.add(JournalEntry(entry_date=date(2026, 3, 5), status=status, lines=[
+        JournalEntryLine(account_id=accounts['5100'], debit_amount=amount, credit_amount=0),
+        JournalEntryLine(account_id=accounts['1000'], debit_amount=0, credit_amount=amount),
+    ]))
+    db.session.commit()
+
+def test_postings_move_budget_actuals(app, accounts, line):
+    post_expense(accounts, Decimal('61.50'))
+    post_expense(accounts, Decimal('10.00'), status='draft')
+    assert_actuals(line, Decimal('61.50'))
+
+def test_approved_expenses_are_not_counted_on_top_of_postings(app, accounts, line):
+    from app.finance.models import Expense
+    post_expense(accounts, Decimal('61.50'))
+    db.session.add(Expense(category='Office', description='Paper', amount=Decimal('30.00'),
+                           expense_date=date(2026, 3, 5), account_id=accounts['5100'], status='approved'))
+    db.session.commit()
+    assert_actuals(line, Decimal('61.50'))
+
+def test_rollback_discards_queued_deltas(app, accounts, line):
+    from app.finance.models import JournalEntry, JournalEntryLine
+    db.session.add(JournalEntry(entry_date=date(2026, 3, 5), status='posted', lines=[
+        JournalEntryLine(account_id=accounts['5100'], debit_amount=Decimal('40.00'), credit_amount=0),
+        JournalEntryLine(account_id=accounts['1000'], debit_amount=0, credit_amount=Decimal('40.00')),
+    ]))
+    db.session.flush()
+    db.session.rollback()
+    post_expense(accounts, Decimal('5.00'))
+    assert_actuals(line, Decimal('5.00'))
+
+def test_connection_commit_does_not_leak_deltas(app, accounts, line):
+    from app.finance.services import BudgetService
+    with db.engine.connect() as connection:
+        connection.execute(select(1))
+        BudgetService.record(connection, accounts['5100'], date(2026, 3, 5), Decimal('99.00'))
+        connection.commit()
+        assert not BudgetService.pending(connection)
+    with db.engine.connect() as connection:
+        BudgetService.record(connection, accounts['5100'], date(2026, 3, 5), Decimal('99.00'))
+    with db.engine.connect() as connection:
+        assert not BudgetService.pending(connection)
+    post_expense(accounts, Decimal('5.00'))
+    assert_actuals(line, Decimal('5.00'))
+
+def test_read_only_commit_opens_no_connection(app, line):
+    checkouts = []
+    listener = lambda *args: checkouts.append(args)
+    db.session.remove()
+    event.listen(db.engine.pool, 'checkout', listener)
+    try:
+        db.session.commit()
+    finally:
+        event.remove(db.engine.pool, 'checkout', listener)
+    assert checkouts == []
@@ -0,0 +1,60 @@
+from datetime import date
+from decimal import Decimal
+import pytest
+from app.core.extensions import db
+
+def line(account_id, debit=None, credit=None):
+    return {'account_id': account_id, 'debit_amount': debit, 'credit_amount': credit}
+
+def balances():
+    from app.finance.models import AccountBalance
+    return {(row.account_id, row.period): (row.debit_total, row.credit_total, row.line_count)
+            for row in AccountBalance.query.all()}
+
+def test_bulk_post_inserts_entries_lines_and_balances(app, accounts):
+    from app.finance.models import JournalEntry, JournalEntryLine
+    from app.finance.services import JournalPostingService
+    cash, sales = accounts['1000'], accounts['4000']
+    result = JournalPostingService.post([
+        {'entry_date': '2026-03-05', 'lines': [line(cash, '100.25'), line(sales, credit='100.25')]},
+        {'entry_date': '2026-03-20', 'lines': [line(cash, 40), line(sales, credit=15), line(sales, credit=25)]},
+    ])
+    assert result['entries'] == 2 and result['lines'] == 5
+    assert result['entry_numbers'] == ['JE000001', 'JE000002']
+    assert [entry.total_debit for entry in JournalEntry.query.order_by(JournalEntry.id)] == \
+        [Decimal('100.25'), Decimal('40.00')]
+    assert JournalEntryLine.query.count() == 5
+    assert balances() == {(cash, 202603): (Decimal('140.25'), Decimal('0.00'), 2),
+                          (sales, 202603): (Decimal('0.00'), Decimal('140.25'), 3)}
+
+@pytest.mark.parametrize('entry, error', [
+    ({'lines': [line('cash', 10), line('sales', credit='abc')]}, 'Line amounts must be numbers'),
+    ({'lines': 'x'}, 'lines must be a list'),
+    ({'lines': ['x', 'y']}, 'Each line must be an object'),
+    ({'lines': [line('cash', '10.005'), line('sales', credit='10.005')]},
+     'Line amounts can have at most two decimal places'),
+    ({'lines': [line('cash', '1e30'), line('sales', credit='1e30')]}, 'Line amounts must be at most 9999999999999.99'),
+    ({'lines': [line('cash', 'NaN'), line('sales', credit=1)]}, 'Line amounts must be numbers'),
+    ({'lines': [{'debit_amount': 1}, line('sales', credit=1)]}, 'Each line needs an account_id'),
+    ({'entry_date': '05/03/2026', 'lines': []}, 'entry_date must be formatted as YYYY-MM-DD'),
+    # Balance checks still all run on entries whose lines parsed
+    ({'lines': [line('cash', 10)]}, ['An entry needs at least two lines', 'Debits and credits must be equal']),
+    ({'lines': [line('cash', 10), line('sales', credit=9)]}, 'Debits and credits must be equal'),
+    ({'lines': [line('cash', 10, 10), line('sales', credit=0)]},
+     'Each line must have either a positive debit or a positive credit'),
+    ({'lines': [line('cash', 10), line(99999, credit=10)]}, 'Lines must use active accounts'),
+])
+def test_bulk_post_reports_the_one_real_error_per_entry(app, accounts, entry, error):
+    from app.finance.models import JournalEntry
+    from app.finance.services import JournalBatchError, JournalPostingService
+    ids = {'cash': accounts['1000'], 'sales': accounts['4000']}
+    for item in entry['lines'] if isinstance(entry['lines'], list) else ():
+        if isinstance(item, dict) and item.get('account_id') in ids:
+            item['account_id'] = ids[item['account_id']]
+    valid = {'lines': [line(ids['cash'], 5), line(ids['sales'], credit=5)]}
+    with pytest.raises(JournalBatchError) as raised:
+        JournalPostingService.post([valid, entry])
+    assert raised.value.errors == [{'entry': 1, 'error': message} for message in
+                                   (error if isinstance(error, list) else [error])]
+    db.session.rollback()
+    assert JournalEntry.query.count() == 0 and balances() == {}
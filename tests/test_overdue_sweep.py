@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+from unittest import mock
+import pytest
+from app.core.extensions import db
+
+TODAY = date(2026, 6, 30)
+
+@pytest.fixture
+def customer(app):
+    from app.finance.services import OverdueInvoiceService
+    from app.models.scheduled_job import ScheduledJobState
+    from app.models.user import User
+    from app.sales.models import Customer
+    customer = Customer(customer_code='C1', company_name='Acme')
+    db.session.add_all([customer, User(username='admin', email='admin@example.com', password_hash='x',
+                                       first_name='Ada', last_name='Admin', role='admin'),
+                        # The scheduler creates the job's state row, where the sweep keeps its watermark
+                        ScheduledJobState(name=OverdueInvoiceService.JOB_NAME)])
+    db.session.commit()
+    return customer
+
+def invoice(customer, number, due, status='sent', balance=100):
+    from app.finance.models import Invoice
+    record = Invoice(invoice_number=number, customer_id=customer.id, total_amount=balance, paid_amount=0,
+                     balance_due=balance, issue_date=due - timedelta(days=30), due_date=due, status=status)
+    db.session.add(record)
+    db.session.commit()
+    return record.id
+
+def statuses():
+    from app.finance.models import Invoice
+    db.session.expire_all()
+    return {record.invoice_number: record.status for record in Invoice.query.order_by(Invoice.id)}
+
+def test_sweep_marks_only_open_sent_invoices_past_due(customer):
+    from app.finance.services import OverdueInvoiceService
+    from app.models.audit_log import AuditLog
+    from app.models.notification import Notification
+    yesterday = TODAY - timedelta(days=1)
+    invoice(customer, 'DUE', yesterday)
+    invoice(customer, 'TODAY', TODAY)
+    invoice(customer, 'DRAFT', yesterday, status='draft')
+    invoice(customer, 'PAID', yesterday, status='paid', balance=0)
+    invoice(customer, 'SETTLED', yesterday, balance=0)
+
+    assert OverdueInvoiceService.sweep(TODAY) == 1
+    assert statuses() == {'DUE': 'overdue', 'TODAY': 'sent', 'DRAFT': 'draft', 'PAID': 'paid', 'SETTLED': 'sent'}
+    assert AuditLog.query.filter_by(table_name='invoices').count() == 1
+    assert Notification.query.filter_by(category='invoice_overdue').count() == 1
+    assert OverdueInvoiceService.sweep(TODAY) == 0
+
+def test_sweep_catches_invoices_sent_after_their_due_date_was_swept(customer):
+    from app.finance.models import Invoice
+    from app.finance.services import OverdueInvoiceService
+    late = invoice(customer, 'LATE', TODAY - timedelta(days=10), status='draft')
+    assert OverdueInvoiceService.sweep(TODAY) == 0
+
+    db.session.get(Invoice, late).status = 'sent'
+    db.session.commit()
+    assert OverdueInvoiceService.sweep(TODAY + timedelta(days=1)) == 1
+    assert statuses() == {'LATE': 'overdue'}
+
+def test_sweep_refreshes_search_documents(customer):
+    from app.finance.services import OverdueInvoiceService
+    from app.models.search_document import SearchDocument
+    invoice_id = invoice(customer, 'DUE', TODAY - timedelta(days=1))
+    document = SearchDocument.query.filter_by(entity_type='invoice', entity_id=invoice_id).one()
+    assert document.subtitle.startswith('Sent')
+
+    OverdueInvoiceService.sweep(TODAY)
+    db.session.expire_all()
+    document = SearchDocument.query.filter_by(entity_type='invoice', entity_id=invoice_id).one()
+    assert document.subtitle.startswith('Overdue')
+    assert 'overdue' in document.body
+
+def test_sweep_command_fails_when_the_sweep_raises(app, customer):
+    from app.finance.services import OverdueInvoiceService
+    runner = app.test_cli_runner()
+    with mock.patch.object(OverdueInvoiceService, 'sweep', side_effect=RuntimeError('database unavailable')):
+        result = runner.invoke(args=['finance', 'sweep-overdue-invoices'])
+    assert result.exit_code != 0
+    assert isinstance(result.exception, RuntimeError)
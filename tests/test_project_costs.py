@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from app.core.extensions import db
+from app.models.user import User
+
+def make_project():
+    """A project with one user who logged 10 billable hours while on it at 10 an hour"""
+    # Imported once create_app has loaded every blueprint's models, as the app itself does
+    from app.projects.models import Project, ProjectResource, TimeEntry
+    today = date.today()
+    user = User(username='member', email='member@example.com', password_hash='x',
+                first_name='Team', last_name='Member')
+    project = Project(project_code='PRJ-1', name='Project', manager=user,
+                      start_date=today, end_date=today + timedelta(days=90))
+    db.session.add_all([user, project])
+    db.session.add(ProjectResource(project=project, user=user, hourly_rate=10,
+                                   start_date=today - timedelta(days=10)))
+    db.session.commit()
+    db.session.add(TimeEntry(project=project, user=user, date=today, hours=10, is_billable=True))
+    db.session.commit()
+    return project, user
+
+def labor(project_id):
+    from app.projects.models import Project, ProjectCostLedger
+    db.session.expire_all()
+    ledger = ProjectCostLedger.query.filter_by(project_id=project_id).one()
+    return ledger.labor_cost, db.session.get(Project, project_id).actual_cost
+
+def rebuilt(project_id):
+    from app.projects.services import ProjectCostService
+    ProjectCostService.rebuild()
+    return labor(project_id)
+
+def test_resources_added_in_one_flush_reprice_labor_once(app):
+    from app.projects.models import ProjectResource
+    project, user = make_project()
+    assert labor(project.id) == (Decimal('100.00'), Decimal('100.00'))
+
+    db.session.add_all([ProjectResource(project=project, user=user, hourly_rate=20, start_date=date.today()),
+                        ProjectResource(project=project, user=user, hourly_rate=30, start_date=date.today())])
+    db.session.commit()
+    assert labor(project.id) == (Decimal('300.00'), Decimal('300.00')) == rebuilt(project.id)
+
+def test_resources_updated_and_deleted_in_one_flush_reprice_labor_once(app):
+    from app.projects.models import ProjectResource
+    project, user = make_project()
+    extra = ProjectResource(project=project, user=user, hourly_rate=20, start_date=date.today())
+    db.session.add(extra)
+    db.session.commit()
+
+    for resource in ProjectResource.query.filter_by(project_id=project.id):
+        resource.hourly_rate += 5
+    db.session.commit()
+    assert labor(project.id) == (Decimal('250.00'), Decimal('250.00')) == rebuilt(project.id)
+
+    db.session.delete(extra)
+    db.session.commit()
+    assert labor(project.id) == (Decimal('150.00'), Decimal('150.00')) == rebuilt(project.id)
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import event
+from app.core.extensions import db
+from app.models.user import User
+
+def make_project(task_count):
+    """A project whose tasks each have their own assignee, with subtasks, milestones, resources and time"""
+    # Imported once create_app has loaded every blueprint's models, as the app itself does
+    from app.projects.models import Project, ProjectTask, ProjectMilestone, ProjectResource, TimeEntry
+    today = date.today()
+    manager = User(username='manager', email='manager@example.com', password_hash='x',
+                   first_name='Project', last_name='Manager')
+    db.session.add(manager)
+    project = Project(project_code='PRJ-1', name='Project', manager=manager,
+                      start_date=today, end_date=today + timedelta(days=90))
+    db.session.add(project)
+    tasks = []
+    for number in range(task_count):
+        assignee = User(username=f'user{number}', email=f'user{number}@example.com', password_hash='x',
+                        first_name='Team', last_name=f'Member {number}')
+        task = ProjectTask(project=project, name=f'Task {number}', assigned_to=assignee, created_by=manager,
+                           parent_task=tasks[number // 2] if number % 3 == 0 and number else None,
+                           start_date=today, due_date=today + timedelta(days=number % 30))
+        tasks.append(task)
+        db.session.add_all([
+            assignee, task,
+            ProjectResource(project=project, user=assignee, role='Member', start_date=today),
+            ProjectMilestone(project=project, name=f'Milestone {number}', due_date=today + timedelta(days=number)),
+            TimeEntry(project=project, task=task, user=assignee, date=today, hours=1),
+        ])
+    db.session.commit()
+    return manager, project.id
+
+def count_queries(client, url):
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200, response.data[:500]
+    return len(statements)
+
+@pytest.mark.parametrize('path', ['/projects/{id}', '/projects/{id}/snapshot'])
+def test_project_detail_query_count_does_not_grow_with_tasks(app, login, path):
+    counts = {}
+    for task_count in (5, 200):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        manager, project_id = make_project(task_count)
+        counts[task_count] = count_queries(login(manager), path.format(id=project_id))
+    assert counts[5] == counts[200], counts
@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+from decimal import Decimal
+import pytest
+from app.core.extensions import db
+
+AS_OF = date(2026, 6, 30)
+
+@pytest.fixture
+def customer(app):
+    from app.sales.models import Customer
+    customer = Customer(customer_code='C1', company_name='Acme')
+    db.session.add(customer)
+    db.session.commit()
+    return customer
+
+def invoice(customer, number, days_past_due, balance, status='sent'):
+    from app.finance.models import Invoice
+    due = AS_OF - timedelta(days=days_past_due)
+    db.session.add(Invoice(invoice_number=number, customer_id=customer.id, total_amount=balance, paid_amount=0,
+                           balance_due=balance, issue_date=due - timedelta(days=30), due_date=due, status=status))
+
+def test_aging_buckets_open_balances_by_days_past_due(customer):
+    from app.finance.services import ReceivablesService
+    for number, days, balance in [('I1', -5, 10), ('I2', 0, 20), ('I3', 1, 30), ('I4', 30, 40), ('I5', 31, 50),
+                                  ('I6', 60, 60), ('I7', 61, 70), ('I8', 90, 80), ('I9', 91, 90), ('I10', 400, 100)]:
+        invoice(customer, number, days, balance, status='overdue' if days > 0 else 'sent')
+    # Not receivables: settled or unsent invoices, and open ones without a balance
+    for number, status, balance in [('D1', 'draft', 5), ('P1', 'paid', 5), ('X1', 'cancelled', 5), ('Z1', 'sent', 0)]:
+        invoice(customer, number, 45, balance, status=status)
+    db.session.commit()
+
+    aging = ReceivablesService.aging(AS_OF)
+    expected = {'current': 30.0, '1_30': 70.0, '31_60': 110.0, '61_90': 150.0, '90_plus': 190.0, 'total': 550.0}
+    assert aging['totals'] == expected
+    [row] = aging['customers']
+    assert row['invoice_count'] == 10
+    assert {key: row[key] for key in expected} == expected
+
+def test_open_invoices_and_overdue_hybrids_follow_status(customer):
+    from app.finance.models import Invoice
+    from app.finance.services import ReceivablesService
+    invoice(customer, 'S1', 10, 25)
+    invoice(customer, 'D1', 10, 25, status='draft')
+    invoice(customer, 'C1', 10, 25, status='cancelled')
+    db.session.commit()
+
+    assert [row['invoice_number'] for row in ReceivablesService.open_invoices(customer.id, AS_OF)] == ['S1']
+    assert ReceivablesService.open_invoices(customer.id, AS_OF)[0]['days_overdue'] == 10
+    overdue = Invoice.query.filter(Invoice.overdue_on(AS_OF)).all()
+    assert [inv.invoice_number for inv in overdue] == ['S1']
+    drafts = Invoice.query.filter(Invoice.status != 'sent').all()
+    assert not any(inv.is_overdue for inv in drafts)
+    assert all(inv.days_overdue == 0 for inv in drafts)
+    assert Decimal(Invoice.query.filter(Invoice.is_open).one().balance_due) == Decimal('25.00')